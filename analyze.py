@@ -0,0 +1,62 @@
+"""
+Re-classify every stored report (`reports/**/*.csv`) against the current comparison rules, without re-running any
+  uploads. Prints a summary per report, and optionally the rows whose classification has changed.
+"""
+import argparse
+import collections
+import sys
+import time
+
+from common import analysis, report
+import main
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reports-dir', default=main.REPORTS_PATH, help='Where to look for reports')
+    parser.add_argument('--providers', nargs='*', help='Only analyze reports for these provider(s)')
+    parser.add_argument('--changed', action='store_true',
+                        help='If flag present, list every row whose classification differs from the stored one')
+    parser.add_argument('--update', action='store_true',
+                        help='If flag present, rewrite the reports with the new classifications')
+    return parser.parse_args()
+
+
+def analyze(report_files, *, show_changed: bool=False, update: bool=False) -> int:
+    """Re-classify every row of every report. Returns the number of rows whose classification changed."""
+    classifier = analysis.Classifier()
+    total_changed = 0
+    for rf in report_files:
+        stored = list(report.read_report(rf.path))
+        updated = [classifier.reclassify(r) for r in stored]
+
+        counts = collections.Counter(r.returned_match for r in updated if r.returned_match is not None)
+        changed = [(old, new) for old, new in zip(stored, updated) if old.returned_match != new.returned_match]
+        total_changed += len(changed)
+
+        kind = 'folders' if rf.folders else 'files'
+        if rf.run:
+            kind += f', run {rf.run}'
+        summary = ', '.join(f'{verdict}: {count}' for verdict, count in counts.most_common())
+        print(f'{rf.provider} ({rf.transport}, {kind}): {len(updated)} row(s); {summary or "no comparisons"}')
+        if show_changed:
+            for old, new in changed:
+                print(f'    {old.description!r}: {old.returned_match} -> {new.returned_match} '
+                      f'(sent {old.our_fn!r}, got {old.their_fn!r})')
+
+        if update and changed:
+            report.write_report(updated, out_fn=rf.path)
+    return total_changed
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 6):
+        raise RuntimeError('For best results, must use Python >= 3.6')
+
+    args = parse_args()
+
+    start = time.time()
+    files = [rf for rf in analysis.find_reports(args.reports_dir)
+             if not args.providers or rf.provider in args.providers]
+    count = analyze(files, show_changed=args.changed, update=args.update)
+    print(f'{count} classification(s) changed across {len(files)} report(s) in {time.time() - start:.2f}s')
@@ -0,0 +1,145 @@
+"""
+Measure end-to-end throughput of the filename checking pipeline against local mock providers (see `mocks/`), so that
+  changes can be benchmarked offline without touching real accounts.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import typing
+
+import settings
+from mocks import PROVIDERS, FilenameRules, MockConfig, MockServer
+
+
+# Providers need these settings to build request URLs. The mock servers ignore credentials entirely.
+PLACEHOLDER_SETTINGS = {
+    'OSF_NODE': 'abc12',
+    'GH_REPO_NAME': 'frodo/filenames',
+    'S3_BUCKET': 'filename-checker',
+    'S3_REGION': 'us-east-1',
+    'S3_ACCESS_KEY': 'mock',
+    'S3_SECRET_KEY': 'mock',
+    'DATAVERSE_NAME': 'filenames',
+    'OWNCLOUD_USERNAME': 'mock',
+    'OWNCLOUD_APP_PASSWORD': 'mock',
+}
+
+
+# Benchmarked unless --providers says otherwise. Box's multipart upload (see the FIXME in its provider) and Google
+#   Drive's upload don't yet work against the mocks, so they are left out; name them explicitly to try them anyway.
+DEFAULT_PROVIDERS = ['dataverse', 'dropbox', 'figshare', 'github', 'osfstorage', 'owncloud', 's3']
+
+
+def configure_settings(mock_host: str) -> None:
+    """Must happen before any provider modules are imported, since they read settings at class definition time"""
+    settings.MOCK_HOST = mock_host
+    for name, value in PLACEHOLDER_SETTINGS.items():
+        if getattr(settings, name, None) is None:
+            setattr(settings, name, value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--providers', nargs='*', default=DEFAULT_PROVIDERS,
+                        help='The name of the storage provider(s) to benchmark')
+    parser.add_argument('--scenarios', nargs='*', help='The name(s) of the filename trial suite(s) to try')
+    parser.add_argument('--concurrency', default=1, type=int,
+                        help='The maximum number of requests in flight at once, per provider')
+    parser.add_argument('--batch', action='store_true',
+                        help='If flag present, providers with a bulk upload API send many filenames per request')
+    parser.add_argument('--max-rate', default=None, type=float,
+                        help='Cap on requests/sec per provider. By default, the benchmark is not throttled.')
+    parser.add_argument('--port', default=8765, type=int, help='Port for the mock server')
+    parser.add_argument('--latency', default=0.05, type=float, help='Mean simulated server latency, in seconds')
+    parser.add_argument('--jitter', default=0.0, type=float, help='Standard deviation of simulated latency')
+    parser.add_argument('--error-rate', default=0.0, type=float,
+                        help='Fraction of requests that fail with a simulated 503')
+    parser.add_argument('--reject-chars', default='',
+                        help='Characters that every mock provider will refuse in filenames')
+    return parser.parse_args()
+
+
+async def run_benchmark(provider_names: typing.Iterable[str],
+                        scenarios: list,
+                        *,
+                        server: MockServer,
+                        concurrency: int=1,
+                        batch: bool=False,
+                        max_rate: typing.Union[float, None]=None) -> typing.Dict[str, typing.Union[dict, Exception]]:
+    """
+    Run the full pipeline for each provider concurrently, and time it. If a provider fails, its result is the
+      exception, and the other providers carry on.
+    """
+    import main  # Import only once settings point at the mock server
+
+    async def timed(provider, out_dir):
+        start = time.monotonic()
+        count = await main.pipeline(provider, scenarios, concurrency=concurrency, batch=batch, report_dir=out_dir,
+                                    trace_fn=os.path.join(out_dir, 'trace.jsonl'))
+        elapsed = time.monotonic() - start
+        latency = provider.tracer.summary()['all']
+        return {
+            'scenarios': count,
+            'seconds': elapsed,
+            'scenarios_per_sec': count / elapsed if elapsed else None,
+            'requests': latency['count'],
+            'p50': latency['p50'],
+            'p95': latency['p95'],
+            'p99': latency['p99'],
+        }
+
+    await server.start()
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            instances = []
+            for name in provider_names:
+                provider = main.KNOWN_PROVIDERS[name](provider_name=name)
+                rate = max_rate or float('inf')
+                provider.throttle.max_rate = provider.throttle.rate = rate
+                instances.append(provider)
+
+            results = await asyncio.gather(*[timed(provider, out_dir) for provider in instances],
+                                           return_exceptions=True)
+    finally:
+        await server.stop()
+
+    return {provider.provider_name: result for provider, result in zip(instances, results)}
+
+
+def print_results(results: typing.Dict[str, typing.Union[dict, Exception]]) -> None:
+    print(f'{"provider":<12} {"scenarios":>9} {"seconds":>8} {"scen/sec":>9} {"requests":>8} '
+          f'{"p50":>7} {"p95":>7} {"p99":>7}')
+    for name, r in sorted(results.items()):
+        if isinstance(r, Exception):
+            print(f'{name:<12} failed: {type(r).__name__}: {r}')
+            continue
+        print(f'{name:<12} {r["scenarios"]:>9} {r["seconds"]:>8.2f} {r["scenarios_per_sec"]:>9.1f} '
+              f'{r["requests"]:>8} {r["p50"]:>7.3f} {r["p95"]:>7.3f} {r["p99"]:>7.3f}')
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 6):
+        raise RuntimeError('For best results, must use Python >= 3.6')
+
+    args = parse_args()
+
+    config = MockConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    if args.reject_chars:
+        for name in PROVIDERS:
+            config.rules[name] = FilenameRules(reject=args.reject_chars)
+
+    server = MockServer(config, port=args.port)
+    configure_settings(server.url)
+
+    import main
+    scenarios = list(main.load_scenarios(main.get_scenario_locations(desired_scenarios=args.scenarios)))
+
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(run_benchmark(args.providers, scenarios, server=server,
+                                                    concurrency=args.concurrency, batch=args.batch,
+                                                    max_rate=args.max_rate))
+    loop.close()
+    print_results(results)
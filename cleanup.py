@@ -0,0 +1,107 @@
+"""
+Delete the test data created by earlier runs: every folder, file, dataset and article recorded in the run manifests
+  (see `common/manifest.py`). Providers with a batch delete API use it; others get concurrent individual deletes.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import typing
+
+from common import manifest
+import main
+import providers
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--providers', nargs='*',
+                        help='Only clean up resources created on these provider(s). By default, clean up everything')
+    parser.add_argument('--reports-dir', default=main.REPORTS_PATH,
+                        help='Where to look for run manifests (including those of sharded runs)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='If flag present, only report what would be deleted')
+    return parser.parse_args()
+
+
+def _resource_key(record: dict) -> typing.Tuple[str, str, str, str]:
+    return record['provider'], record['transport'], record['kind'], record['id']
+
+
+async def cleanup_provider(provider_name: str,
+                           transport: str,
+                           records: typing.List[dict],
+                           *,
+                           dry_run: bool=False) -> typing.Set[tuple]:
+    """
+    Delete every recorded resource for one provider. Returns the keys (see `_resource_key`) of the resources that are
+      now gone, including those deleted along with their folder.
+    """
+    ProviderClass = providers.get_provider_class(provider_name, use_wb=(transport == 'wb'))
+    provider = ProviderClass(provider_name=provider_name)
+
+    targets = manifest.prune(records, recursive=provider.RECURSIVE_DELETE)
+    print(f'Cleanup for {provider_name} ({transport}): {len(targets)} delete(s) to remove {len(records)} resource(s)')
+    if dry_run or not targets:
+        return set()
+
+    await provider.authorize()
+    try:
+        codes = await provider.delete_resources(targets)
+    finally:
+        await provider.close()
+
+    # Something that is already gone (404) needs no further cleanup either
+    deleted = {record['id'] for record, code in zip(targets, codes) if code < 400 or code == 404}
+    failures = len(targets) - len(deleted)
+    if failures:
+        print(f'Could not delete {failures} resource(s) for {provider_name}; they will be retried next time')
+
+    gone = set()
+    for record in records:
+        inside_deleted_folder = provider.RECURSIVE_DELETE and record.get('parent') in deleted
+        if record['id'] in deleted or inside_deleted_folder:
+            gone.add(_resource_key(record))
+    return gone
+
+
+async def cleanup(manifest_paths: typing.List[str], *,
+                  provider_names: typing.Iterable[str]=None,
+                  dry_run: bool=False) -> int:
+    """Clean up every provider concurrently, then remove deleted resources from the manifests. Returns the count."""
+    manifests = {path: manifest.Manifest(path) for path in manifest_paths}
+    contents = {path: m.load() for path, m in manifests.items()}
+
+    # The same provider may appear in several manifests (eg one per shard). Each resource only needs deleting once.
+    by_provider = collections.defaultdict(dict)
+    for records in contents.values():
+        for record in records:
+            if provider_names and record['provider'] not in provider_names:
+                continue
+            by_provider[(record['provider'], record['transport'])][_resource_key(record)] = record
+
+    results = await asyncio.gather(*[cleanup_provider(name, transport, list(records.values()), dry_run=dry_run)
+                                     for (name, transport), records in by_provider.items()])
+    gone = set().union(*results)
+
+    for path, records in contents.items():
+        remaining = [record for record in records if _resource_key(record) not in gone]
+        if remaining:
+            manifests[path].rewrite(remaining)
+        elif not dry_run:
+            os.remove(path)
+    return len(gone)
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 6):
+        raise RuntimeError('For best results, must use Python >= 3.6')
+
+    args = parse_args()
+
+    loop = asyncio.get_event_loop()
+    count = loop.run_until_complete(cleanup(manifest.find_manifests(args.reports_dir),
+                                            provider_names=args.providers, dry_run=args.dry_run))
+    print(f'Removed {count} resource(s)')
+    loop.close()
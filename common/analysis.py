@@ -0,0 +1,92 @@
+"""
+Re-classify stored results without re-running any uploads. Every normalized form of every distinct filename is
+  computed once (see `behaviors.NORMALIZATIONS`), and the verdict for each distinct (ours, theirs) pair is computed once,
+  so that new comparison rules can be applied retroactively to every historical report in seconds.
+"""
+import os
+import typing
+
+from . import behaviors
+from . import report
+
+
+class ReportFile(typing.NamedTuple):
+    path: str
+    provider: str
+    transport: str
+    folders: bool
+    run: str
+
+
+class Classifier:
+    """Classify filename pairs according to an ordered set of equivalence rules (see `behaviors.EQUIVALENCES`)"""
+    def __init__(self,
+                 equivalences: typing.Dict[str, typing.Tuple[str, str]]=None,
+                 normalizations: typing.Dict[str, typing.Callable[[str], str]]=None):
+        equivalences = behaviors.EQUIVALENCES if equivalences is None else equivalences
+        normalizations = behaviors.NORMALIZATIONS if normalizations is None else normalizations
+
+        # Only compute the forms that some rule actually uses
+        used = list(dict.fromkeys(form for pair in equivalences.values() for form in pair))
+        self._normalizers = [normalizations[form] for form in used]
+        position = {form: i for i, form in enumerate(used)}
+        self._rules = [(name, position[ours], position[theirs]) for name, (ours, theirs) in equivalences.items()]
+
+        self._forms: typing.Dict[str, typing.Tuple[str, ...]] = {}
+        self._verdicts: typing.Dict[typing.Tuple[str, str], typing.Union[str, bool]] = {}
+
+    def forms(self, fn: str) -> typing.Tuple[str, ...]:
+        try:
+            return self._forms[fn]
+        except KeyError:
+            forms = self._forms[fn] = tuple(normalize(fn) for normalize in self._normalizers)
+            return forms
+
+    def classify(self, ours: str, theirs: str) -> typing.Union[str, bool]:
+        """Return the name of the first rule that matches, or False if none do (as `behaviors.compare` does)"""
+        if not theirs:
+            return False
+        key = (ours, theirs)
+        try:
+            return self._verdicts[key]
+        except KeyError:
+            pass
+
+        our_forms = self.forms(ours)
+        their_forms = self.forms(theirs)
+        verdict = next((name for name, i, j in self._rules if our_forms[i] == their_forms[j]), False)
+        self._verdicts[key] = verdict
+        return verdict
+
+    def reclassify(self, r: report.Report) -> report.Report:
+        """Folder checks (no comparison) and failed uploads are left as they are"""
+        if r.returned_match is None or r.upload_status_code >= 400:
+            return r
+        return r._replace(returned_match=self.classify(r.our_fn, r.their_fn))
+
+
+def find_reports(root: str) -> typing.List[ReportFile]:
+    """
+    Every report below `root`: direct results in a folder, and those routed through Waterbutler in its `waterbutler`
+      subfolder. Reports from earlier runs may be archived in subfolders of `root`; the relative path identifies the
+      run (the current run is ''). Hidden folders (cache, shards) are skipped.
+    """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        rel = os.path.relpath(dirpath, root)
+        parts = [] if rel == '.' else rel.split(os.sep)
+        transport = 'direct'
+        if parts and parts[-1] == 'waterbutler':
+            transport = 'wb'
+            parts.pop()
+        run = '/'.join(parts)
+
+        for fn in sorted(filenames):
+            name, ext = os.path.splitext(fn)
+            if ext != '.csv':
+                continue
+            folders = name.endswith('-folders')
+            provider = name[:-len('-folders')] if folders else name
+            found.append(ReportFile(os.path.join(dirpath, fn), provider, transport, folders, run))
+    return found
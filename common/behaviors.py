@@ -3,6 +3,9 @@ Define the set of behaviors we want to check for. Eg, "this filename is exactly
   "this filename is the same, accounting for URL encoding"
   
 """
+import functools
+import typing
+import unicodedata
 import urllib.parse
 
 
@@ -19,29 +22,49 @@ def encode_plus_to_send(our_fn: str) -> str:
 
 
 #####
-# Check filenames returned by the API
-def filenames_match(ours: str, theirs: str) -> bool:
-    """Filenames are an exact match"""
-    return ours == theirs
+# Check filenames returned by the API. Each comparison checks whether one normalized form of our filename equals one
+#   normalized form of theirs. Live runs and offline re-analysis (`common/analysis.py`, which computes each form of
+#   each distinct filename once) share these rules.
+NORMALIZATIONS = {
+    "raw": str,
+    "unquote": urllib.parse.unquote,
+    "unquote_plus": urllib.parse.unquote_plus,
+    "nfc": functools.partial(unicodedata.normalize, 'NFC'),
+    "nfkc": functools.partial(unicodedata.normalize, 'NFKC'),
+    "casefold": str.casefold,
+    "stripped": str.strip,
+}
 
+# Define the scenarios that we will check when reporting on special character handling in API return values
+# Comparison name: (form of our filename, form of their filename). Checked in order, so the first match is reported.
+EQUIVALENCES = {
+    "exact": ("raw", "raw"),
+    "receive_encoded": ("raw", "unquote"),
+    "receive_encoded_plus": ("raw", "unquote_plus"),
+    "unicode_normalized": ("nfc", "nfc"),
+    "compatibility_normalized": ("nfkc", "nfkc"),
+    "case_insensitive": ("casefold", "casefold"),
+    "whitespace_stripped": ("stripped", "stripped"),
+}
 
-def filenames_match_decoded(ours: str, theirs: str) -> bool:
-    """If we URL decode the filename returned by the API, it matches what we expect the filename to be"""
-    return urllib.parse.unquote(theirs) == ours
 
+def _comparison(our_form: str, their_form: str) -> typing.Callable[[str, str], bool]:
+    normalize_ours = NORMALIZATIONS[our_form]
+    normalize_theirs = NORMALIZATIONS[their_form]
 
-def filenames_match_decoded_plus(ours: str, theirs: str) -> bool:
-    """
-    If we URL decode the filename returned by the API, according to more stringent rules, it matches what 
-      we expect the filename to be
-    """
-    return urllib.parse.unquote_plus(theirs) == ours
+    def matches(ours: str, theirs: str) -> bool:
+        return normalize_ours(ours) == normalize_theirs(theirs)
+    return matches
 
 
-# Define the scenarios that we will check when reporting on special character handling in API return values
-# In python 3.6, we can iterate over these in order because COMPUTERS
-COMPARISONS = {
-    "exact": filenames_match,
-    "receive_encoded": filenames_match_decoded,
-    "receive_encoded_plus": filenames_match_decoded_plus
-}
+COMPARISONS = {name: _comparison(*forms) for name, forms in EQUIVALENCES.items()}
+
+
+def compare(ours: str, theirs: str):
+    """Return the name of the first comparison that matches, or False if none do"""
+    if not theirs:
+        return False
+    for match_type, method in COMPARISONS.items():
+        if method(ours, theirs):
+            return match_type
+    return False
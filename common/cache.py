@@ -0,0 +1,95 @@
+"""
+A local, content-addressed cache of filename test results, so that repeat runs only need to send requests for
+  filenames whose outcome is unknown (or stale)
+"""
+import collections
+import hashlib
+import json
+import os
+import time
+import typing
+
+from . import report
+
+
+class ResultCache:
+    """
+    One small JSON file per result, named by a hash of everything that could change the outcome: provider, transport
+      (direct or via Waterbutler), kind of check, filename, and the provider's version tag.
+
+    Entries expire after `ttl` seconds. When there are more than `max_entries`, the least recently used are evicted
+      (see `evict`, which scans the whole cache, so call it once at the end of a run).
+    """
+    def __init__(self, root: str, *, ttl: typing.Union[float, None]=None, max_entries: typing.Union[int, None]=None):
+        self.root = root
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # One cache is shared by every provider in a run, so count hits and misses per provider
+        self.hits: typing.Counter[str] = collections.Counter()
+        self.misses: typing.Counter[str] = collections.Counter()
+
+    @staticmethod
+    def key(*, provider: str, transport: str, kind: str, filename: str, version: str) -> str:
+        payload = json.dumps([provider, transport, kind, filename, version])
+        return hashlib.sha256(payload.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + '.json')
+
+    def get(self, key: str, *, provider: str=None) -> typing.Union[report.Report, None]:
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses[provider] += 1
+            return None
+
+        if self.ttl is not None and time.time() - entry['stored_at'] > self.ttl:
+            self.misses[provider] += 1
+            return None
+
+        # Mark as recently used (for LRU eviction)
+        os.utime(path)
+        self.hits[provider] += 1
+        return report.Report(*entry['report'])
+
+    def put(self, key: str, r: report.Report) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write atomically, so a crash never leaves a half-written entry behind. Several worker processes may share one
+        #   cache, so each writes to its own temporary file.
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'stored_at': time.time(), 'report': list(r)}, f)
+        os.replace(tmp_path, path)
+
+    def evict(self) -> int:
+        """Remove the least recently used entries beyond `max_entries`. Returns the number removed."""
+        if self.max_entries is None or not os.path.isdir(self.root):
+            return 0
+
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for fn in filenames:
+                if fn.endswith('.json'):
+                    path = os.path.join(dirpath, fn)
+                    try:
+                        entries.append((os.stat(path).st_mtime, path))
+                    except FileNotFoundError:
+                        # Evicted by another process sharing this cache
+                        pass
+
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return 0
+
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return excess
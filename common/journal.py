@@ -0,0 +1,147 @@
+"""
+Keep an append-only journal of completed scenarios for one provider, so that an interrupted run can be resumed without
+  repeating work (or creating a new parent folder)
+"""
+import json
+import os
+import typing
+
+from . import report
+
+
+def is_final(r: report.Report) -> bool:
+    """
+    Whether a result stands when the run is resumed. Auth failures (eg after an access token expires), rate limits and
+      server errors say nothing about the filename, so those scenarios are tried again.
+    """
+    code = r.upload_status_code
+    return code is not None and code < 500 and code not in (401, 403, 429)
+
+
+class Journal:
+    """
+    One JSON record per line: either the parent folder used for the run, or a completed `Report`. Writes are flushed
+      and fsync'd in batches, so a crash loses at most `sync_every` results.
+
+    Every result is recorded, so that the report covers them all, but only final ones (see `is_final`) count as
+      completed when resuming. The others are dropped from the journal on resume, and tried again.
+    """
+    def __init__(self, path: str, *, sync_every: int=20):
+        self.path = path
+        self.sync_every = sync_every
+
+        self.parent_folder: str = None
+        # Scenarios completed by a previous run (only loaded when resuming). Results themselves stay on disk.
+        self.completed: typing.Set[typing.Tuple[str, str]] = set()
+        # Number of results in the journal, including those from a previous run
+        self.count: int = 0
+        # Results from a previous run that will be tried again
+        self.superseded: int = 0
+
+        self._f = None
+        self._unsynced = 0
+
+    def __contains__(self, scenario: typing.Tuple[str, str]) -> bool:
+        return tuple(scenario) in self.completed
+
+    def load(self) -> None:
+        """Read results from a previous run (if any). A partially written final line is ignored."""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if 'parent_folder' in record:
+                    self.parent_folder = record['parent_folder']
+                elif 'report' in record:
+                    r = report.Report(*record['report'])
+                    if is_final(r):
+                        self.completed.add((r.description, r.our_fn))
+                        self.count += 1
+                    else:
+                        self.superseded += 1
+
+    def _compact(self) -> None:
+        """Drop the results that will be tried again, so that they aren't reported twice"""
+        tmp_path = self.path + '.tmp'
+        with open(self.path, 'r') as src, open(tmp_path, 'w') as dest:
+            for line in src:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'report' in record and not is_final(report.Report(*record['report'])):
+                    continue
+                dest.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, self.path)
+        self.superseded = 0
+
+    def open(self, *, resume: bool=False) -> None:
+        """Open the journal for writing. Unless resuming, this discards the results of any previous run."""
+        if not resume:
+            self.parent_folder = None
+            self.completed = set()
+            self.count = 0
+        elif self.superseded:
+            self._compact()
+        self._f = open(self.path, 'a' if resume else 'w')
+
+        # A crash may have left a partially written line; make sure new records start cleanly
+        if self._f.tell() > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._f.write('\n')
+
+    def _write(self, record: dict) -> None:
+        self._f.write(json.dumps(record) + '\n')
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        """Force all pending records to disk"""
+        if self._f is None or not self._unsynced:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        if self._f is None:
+            return
+        self.sync()
+        self._f.close()
+        self._f = None
+
+    def record_parent_folder(self, folder_id: str) -> None:
+        self.parent_folder = folder_id
+        self._write({'parent_folder': folder_id})
+        # The parent folder is needed to resume at all, so don't wait for a batch to fill up
+        self.sync()
+
+    def record(self, r: report.Report) -> None:
+        self.count += 1
+        self._write({'report': list(r)})
+
+    async def track(self, reports: typing.AsyncIterator[report.Report]) -> typing.AsyncIterator[report.Report]:
+        """Record each report as it passes through"""
+        async for r in reports:
+            self.record(r)
+            yield r
+
+    async def replay(self) -> typing.AsyncIterator[report.Report]:
+        """Stream all completed reports back from disk, in the order they were run"""
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'report' in record:
+                    yield report.Report(*record['report'])
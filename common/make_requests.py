@@ -2,83 +2,322 @@
 Given a specific provider, handle making a series of requests
 """
 import asyncio
+import collections
 import typing
 
 import providers
 from . import behaviors
+from . import cache as result_cache
+from . import journal
 from . import report
 
 
+# How many scenarios (per unit of concurrency) may be dispatched ahead of the oldest result not yet reported
+BUFFER_FACTOR = 4
+
+# The content of every file we upload
+FILE_CONTENT = 'Any text will do'
+
+
+def _returned_name(value) -> typing.Union[str, None]:
+    """
+    Reports are journaled, cached and stored as text, so anything a provider returned that isn't a name or id (eg an
+      error response) is reported as no name at all
+    """
+    return value if isinstance(value, str) else None
+
+
+def file_report(provider: providers.BaseProvider,
+                scenario: typing.Tuple[str, str],
+                payload,
+                code: int,
+                attempts: int=1) -> report.Report:
+    """Build a report from the response to a file upload"""
+    prose, fn = scenario
+    their_fn = _returned_name(provider.extract_uploaded_filename(payload)) if code < 400 else None
+
+    return report.Report(
+        description=prose,
+        our_fn=fn,
+        their_fn=their_fn,
+        upload_status_code=code,
+        returned_match=behaviors.compare(fn, their_fn),
+        attempts=attempts
+    )
+
+
 async def check_one_filename(provider: providers.BaseProvider,
                              scenario: typing.Tuple[str, str]) -> report.Report:
     """Perform a set of upload/download tests for one filename scenario"""
     prose, fn = scenario
     print(f'Checking: {provider.provider_name} for filename {fn}')
 
-    json, code = await provider.upload_file(fn, 'Any text will do')
-    their_fn = provider.extract_uploaded_filename(json) if code < 400 else None
+    with provider.tracer.operation('upload_file'), provider.attempts.count() as counter:
+        json, code = await provider.upload_file(fn, FILE_CONTENT)
+    return file_report(provider, scenario, json, code, counter.attempts)
+
+
+async def check_filename_batch(provider: providers.BaseProvider,
+                               scenarios: typing.List[typing.Tuple[str, str]]) -> typing.List[report.Report]:
+    """Upload several filename scenarios in one batch (for providers that support it), with one report per scenario"""
+    filenames = [fn for _, fn in scenarios]
+    print(f'Checking: {provider.provider_name} for a batch of {len(filenames)} filenames')
 
-    is_match = False
-    for match_type, method in behaviors.COMPARISONS.items():
-        if their_fn and method(fn, their_fn):
-            is_match = match_type
-            break
+    with provider.tracer.operation('upload_file'), provider.attempts.count() as counter:
+        responses = await provider.upload_files(filenames, FILE_CONTENT)
+    return [file_report(provider, scenario, json, code, counter.attempts_of(scenario[1]))
+            for scenario, (json, code) in zip(scenarios, responses)]
 
+
+def folder_report(scenario: typing.Tuple[str, str], folder_id, code: int, attempts: int=1) -> report.Report:
+    """Build a report from the response to a folder creation. We don't verify folder name, so returned_match = None"""
+    prose, fn = scenario
     return report.Report(
         description=prose,
         our_fn=fn,
-        their_fn=their_fn,
+        their_fn=_returned_name(folder_id),
         upload_status_code=code,
-        returned_match=is_match
+        returned_match=None,
+        attempts=attempts
     )
 
 
 async def check_one_foldername(provider: providers.BaseProvider,
                                scenario: typing.Tuple[str, str]) -> report.Report:
-    """Check whether we can create a folder. We don't verify folder name, so returned_match = None"""
+    """Check whether we can create a folder"""
     prose, fn = scenario
     # TODO: Some providers may have a problem with nested folders; check
     print(f'Checking: {provider.provider_name} for foldername {fn}')
-    folder_id, code = await provider.create_folder(fn)
+    with provider.tracer.operation('create_folder'), provider.attempts.count() as counter:
+        folder_id, code = await provider.create_folder(fn)
+    return folder_report(scenario, folder_id, code, counter.attempts)
 
-    allowed_creation = (code < 400)
 
-    return report.Report(
-        description=prose,
-        our_fn=fn,
-        their_fn=folder_id,
-        upload_status_code=code,
-        returned_match=None
-    )
+async def check_foldername_batch(provider: providers.BaseProvider,
+                                 scenarios: typing.List[typing.Tuple[str, str]]) -> typing.List[report.Report]:
+    """Create several folders in one batch (for providers that support it), with one report per scenario"""
+    foldernames = [fn for _, fn in scenarios]
+    print(f'Checking: {provider.provider_name} for a batch of {len(foldernames)} foldernames')
+
+    with provider.tracer.operation('create_folder'), provider.attempts.count() as counter:
+        responses = await provider.create_folders(foldernames)
+    return [folder_report(scenario, folder_id, code, counter.attempts_of(scenario[1]))
+            for scenario, (folder_id, code) in zip(scenarios, responses)]
+
+
+def _from_cache(cached: report.Report, prose: str) -> report.Report:
+    """
+    The same filename may appear in more than one scenario; keep this scenario's description. No requests were sent.
+    The comparison rules may have changed since the result was cached, so compare the names again.
+    """
+    if cached.returned_match is not None:
+        cached = cached._replace(returned_match=behaviors.compare(cached.our_fn, cached.their_fn))
+    return cached._replace(description=prose, attempts=0)
+
+
+def _cache_key(provider: providers.BaseProvider, fn: str, kind: str, cache: result_cache.ResultCache) -> str:
+    return cache.key(provider=provider.provider_name,
+                     transport=provider.TRANSPORT,
+                     kind=kind,
+                     filename=fn,
+                     version=provider.VERSION_TAG)
+
+
+async def check_cached(provider: providers.BaseProvider,
+                       scenario: typing.Tuple[str, str],
+                       *,
+                       check: typing.Callable=check_one_filename,
+                       cache: result_cache.ResultCache=None) -> report.Report:
+    """
+    Run a check, unless the cache already knows the outcome for this filename. New outcomes are stored later, once
+      they have been verified (see `cache_results`).
+    """
+    if cache is None:
+        return await check(provider, scenario)
+
+    prose, fn = scenario
+    key = _cache_key(provider, fn, 'folder' if check is check_one_foldername else 'file', cache)
+    cached = cache.get(key, provider=provider.provider_name)
+    if cached is not None:
+        return _from_cache(cached, prose)
+
+    return await check(provider, scenario)
+
+
+async def check_batch_cached(provider: providers.BaseProvider,
+                             scenarios: typing.List[typing.Tuple[str, str]],
+                             *,
+                             check: typing.Callable=check_filename_batch,
+                             cache: result_cache.ResultCache=None) -> typing.List[report.Report]:
+    """Run a batch check (of filenames or foldernames), leaving out any whose outcome the cache already knows"""
+    results: typing.List[report.Report] = [None] * len(scenarios)
+    kind = 'folder' if check is check_foldername_batch else 'file'
+    if cache is not None:
+        for i, (prose, fn) in enumerate(scenarios):
+            cached = cache.get(_cache_key(provider, fn, kind, cache), provider=provider.provider_name)
+            if cached is not None:
+                results[i] = _from_cache(cached, prose)
+
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        fresh = await check(provider, [scenarios[i] for i in misses])
+        for i, r in zip(misses, fresh):
+            results[i] = r
+    return results
+
+
+async def cache_results(provider: providers.BaseProvider,
+                        reports: typing.AsyncIterator[report.Report],
+                        *,
+                        cache: result_cache.ResultCache,
+                        kind: str='file') -> typing.AsyncIterator[report.Report]:
+    """
+    Store each new outcome in the cache as it passes through. This happens after verification (see `common.verify`),
+      so that providers whose upload responses don't name the stored file have that name cached too.
+    """
+    async for r in reports:
+        # Results from the cache (no attempts) are already there. Special requests depend on an earlier request, so
+        #   their outcome says nothing about the filename alone.
+        if r.attempts and journal.is_final(r) and (r.description, r.our_fn) not in SPECIAL_SCENARIOS:
+            cache.put(_cache_key(provider, r.our_fn, kind, cache), r)
+        yield r
+
+
+def _chunks(iterable: typing.Iterable, size: int) -> typing.Iterator[list]:
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Scenarios that depend on the outcome of an earlier request, in the order they must run (see `special_requests`)
+SPECIAL_STEPS = [
+    # Try creating a file and folder with the same name in the same directory.
+    (check_one_foldername, ('Create a folder, then a file with same name (folder)', 'folderthenfile')),
+    (check_one_filename, ('Create a folder, then a file with same name (file)', 'folderthenfile')),
+    # Same as above, but opposite order (file, then folder)
+    (check_one_filename, ('Create a file, then a folder with same name (file)', 'filethenfolder')),
+    (check_one_foldername, ('Create a file, then a folder with same name (folder)', 'filethenfolder')),
+]
+SPECIAL_SCENARIOS = frozenset(scenario for _, scenario in SPECIAL_STEPS)
+
+
+async def special_requests(provider: providers.BaseProvider,
+                           *,
+                           delay: typing.Union[float, None]=None,
+                           skip: typing.Container=()) -> typing.AsyncIterator[report.Report]:
+    """
+    Scenarios that depend on the outcome of an earlier request (eg "create a folder, then a file with the same
+      name"). These must always run in series, after all other scenarios are complete.
+    """
+    if not provider.ALLOWS_SUBFOLDERS:
+        return
+
+    for check, scenario in SPECIAL_STEPS:
+        if scenario in skip:
+            continue
+        yield await check(provider, scenario)
+        if delay:
+            await asyncio.sleep(delay)
 
 
 async def serial_requests(provider: providers.BaseProvider,
                           scenarios: typing.Iterator,
                           *,
-                          delay: typing.Union[float, None]=None) -> typing.AsyncIterator[report.Report]:
-    """Make a series of requests to the specified provider"""
+                          delay: typing.Union[float, None]=None,
+                          skip: typing.Container=(),
+                          cache: result_cache.ResultCache=None,
+                          special: bool=True,
+                          folders: bool=False) -> typing.AsyncIterator[report.Report]:
+    """
+    Make a series of requests to the specified provider. Scenarios in `skip` (eg already completed) are not run.
+    If a cache is provided, only filenames with no (fresh) cached outcome are sent to the provider.
+    If `special` is False, the special requests (see `special_requests`) are left for someone else to run.
+    If `folders` is True, each scenario name is tried as a folder name instead of a filename.
+    """
+    check = check_one_foldername if folders else check_one_filename
     for scenario in scenarios:
-        yield await check_one_filename(provider, scenario)
+        if scenario in skip:
+            continue
+        yield await check_cached(provider, scenario, check=check, cache=cache)
         if delay:
             await asyncio.sleep(delay)
 
-    ####
-    # Special scenarios
-    if provider.ALLOWS_SUBFOLDERS:
-        # Try creating a file and folder with the same name in the same directory.
-        folder_then_file = ('Create a folder, then a file with same name (folder)', 'folderthenfile')
-        yield await check_one_foldername(provider, folder_then_file)
-        if delay:
-            await asyncio.sleep(delay)
-        folder_then_file = ('Create a folder, then a file with same name (file)', 'folderthenfile')
-        yield await check_one_filename(provider, folder_then_file)
-        if delay:
-            await asyncio.sleep(delay)
+    if not special:
+        return
+    async for r in special_requests(provider, delay=delay, skip=skip):
+        yield r
 
-        # Same as above, but opposite order (file, then folder)
-        file_then_folder = ('Create a file, then a folder with same name (file)', 'filethenfolder')
-        yield await check_one_filename(provider, file_then_folder)
-        if delay:
-            await asyncio.sleep(delay)
-        file_then_folder = ('Create a file, then a folder with same name (folder)', 'filethenfolder')
-        yield await check_one_foldername(provider, file_then_folder)
+
+async def concurrent_requests(provider: providers.BaseProvider,
+                              scenarios: typing.Iterator,
+                              *,
+                              concurrency: int=1,
+                              delay: typing.Union[float, None]=None,
+                              skip: typing.Container=(),
+                              cache: result_cache.ResultCache=None,
+                              batch_size: typing.Union[int, None]=None,
+                              special: bool=True,
+                              folders: bool=False) -> typing.AsyncIterator[report.Report]:
+    """
+    Make requests to the specified provider, keeping up to `concurrency` scenarios in flight at once. If `batch_size`
+      is given, scenarios are instead grouped into batches (see `provider.upload_files`, or `provider.create_folders`
+      if trying scenario names as `folders`), and up to `concurrency` batches are kept in flight.
+
+    Reports are yielded in the same order as the scenarios, regardless of the order in which responses arrive. To
+      keep memory bounded, at most `concurrency * BUFFER_FACTOR` scenarios (or batches) are read ahead of the oldest
+      unreported one.
+    """
+    if concurrency <= 1 and not batch_size:
+        async for r in serial_requests(provider, scenarios, delay=delay, skip=skip, cache=cache, special=special,
+                                       folders=folders):
+            yield r
+        return
+
+    remaining = (scenario for scenario in scenarios if scenario not in skip)
+    if batch_size:
+        units = _chunks(remaining, batch_size)
+        batch_check = check_foldername_batch if folders else check_filename_batch
+
+        async def run(unit):
+            return await check_batch_cached(provider, unit, check=batch_check, cache=cache)
+    else:
+        units = remaining
+        check = check_one_foldername if folders else check_one_filename
+
+        async def run(unit):
+            return [await check_cached(provider, unit, check=check, cache=cache)]
+
+    slots = asyncio.Semaphore(max(concurrency, 1))
+
+    async def limited(unit):
+        async with slots:
+            results = await run(unit)
+            if delay:
+                await asyncio.sleep(delay)
+            return results
+
+    pending = collections.deque()
+    try:
+        for unit in units:
+            if len(pending) >= max(concurrency, 1) * BUFFER_FACTOR:
+                for r in await pending.popleft():
+                    yield r
+            pending.append(asyncio.ensure_future(limited(unit)))
+
+        while pending:
+            for r in await pending.popleft():
+                yield r
+    finally:
+        # If the consumer stops early, don't leave orphaned requests running on the loop
+        for future in pending:
+            future.cancel()
+
+    if not special:
+        return
+    async for r in special_requests(provider, delay=delay, skip=skip):
+        yield r
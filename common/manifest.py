@@ -0,0 +1,88 @@
+"""
+Keep an append-only manifest of every resource (folder, file, dataset, article...) created on a provider, so that test
+  data can be cleaned up afterwards
+"""
+import json
+import os
+import typing
+
+
+class Manifest:
+    """
+    One JSON record per line, per created resource: the provider and transport it was created through, what kind of
+      resource it is, the provider-specific id needed to delete it, and the id of the folder it was created in. Unlike
+      a journal, a manifest is never truncated by a new run; only cleanup removes records from it.
+    """
+    def __init__(self, path: str, *, sync_every: int=20):
+        self.path = path
+        self.sync_every = sync_every
+
+        self._f = None
+        self._unsynced = 0
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._f = open(self.path, 'a')
+
+    def sync(self) -> None:
+        """Force all pending records to disk"""
+        if self._f is None or not self._unsynced:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        if self._f is None:
+            return
+        self.sync()
+        self._f.close()
+        self._f = None
+
+    def record(self, *, provider: str, transport: str, kind: str, resource_id: str, parent: str=None, **extra) -> None:
+        record = dict(extra, provider=provider, transport=transport, kind=kind, id=resource_id, parent=parent)
+        self._f.write(json.dumps(record) + '\n')
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def load(self) -> typing.List[dict]:
+        """Read every record. A partially written final line is ignored."""
+        if not os.path.exists(self.path):
+            return []
+
+        records = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        return records
+
+    def rewrite(self, records: typing.Iterable[dict]) -> None:
+        """Replace the manifest contents (eg with only the resources that could not be deleted)"""
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+def find_manifests(root: str) -> typing.List[str]:
+    """Every manifest below `root`, including those written by sharded (`--workers`) runs"""
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        paths.extend(os.path.join(dirpath, fn) for fn in filenames if fn.endswith('.manifest'))
+    return sorted(paths)
+
+
+def prune(records: typing.List[dict], *, recursive: bool=True) -> typing.List[dict]:
+    """
+    Leave out anything created inside a folder that will itself be deleted, if deleting a folder deletes its contents
+      (`recursive`). The resources that remain are the ones that need delete requests.
+    """
+    if not recursive:
+        return list(records)
+    containers = {r['id'] for r in records if r['kind'] != 'file'}
+    return [r for r in records if r.get('parent') not in containers]
@@ -0,0 +1,159 @@
+"""
+Join every report into one matrix keyed by scenario (description and the filename we sent), with one set of columns
+  per report: response code, filename returned and comparison result. A report is only re-read when it changes on
+  disk, so comparing Waterbutler against direct results stays fast as archived runs accumulate.
+"""
+import json
+import os
+import typing
+
+from . import analysis
+from . import report
+
+
+class Column(typing.NamedTuple):
+    """The results from one report. `rows` holds the matrix row of each result; the other lists are aligned with it."""
+    source: analysis.ReportFile
+    stamp: typing.Tuple[int, int]
+    rows: typing.List[int]
+    status: typing.List[int]
+    their_fn: typing.List[str]
+    match: typing.List[typing.Union[str, bool, None]]
+
+
+class Disagreement(typing.NamedTuple):
+    description: str
+    our_fn: str
+    direct: typing.Tuple[int, str, typing.Union[str, bool, None]]
+    wb: typing.Tuple[int, str, typing.Union[str, bool, None]]
+
+
+def _stamp(path: str) -> typing.Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _outcome(status: int, match) -> tuple:
+    """What should agree between transports: whether the upload worked, and how the returned filename compared"""
+    return status < 400, match
+
+
+# Bump this when the saved layout changes; older snapshots are then rebuilt from the reports
+FORMAT = 2
+
+
+class ResultMatrix:
+    def __init__(self):
+        # One row per scenario. Different scenarios can send the same filename (eg the folder and file steps of a
+        #   special request), so rows are keyed by description too.
+        self.scenarios: typing.List[typing.Tuple[str, str]] = []
+        self.columns: typing.Dict[str, Column] = {}
+
+        self._index: typing.Dict[typing.Tuple[str, str], int] = {}
+        self._positions: typing.Dict[str, typing.Dict[int, int]] = {}
+
+    def _row(self, description: str, our_fn: str) -> int:
+        scenario = (description, our_fn)
+        try:
+            return self._index[scenario]
+        except KeyError:
+            self.scenarios.append(scenario)
+            row = self._index[scenario] = len(self.scenarios) - 1
+            return row
+
+    def _load_column(self, rf: analysis.ReportFile, stamp: typing.Tuple[int, int]) -> Column:
+        column = Column(rf, stamp, [], [], [], [])
+        for r in report.read_report(rf.path):
+            column.rows.append(self._row(r.description, r.our_fn))
+            column.status.append(r.upload_status_code)
+            column.their_fn.append(r.their_fn)
+            column.match.append(r.returned_match)
+        return column
+
+    def refresh(self, report_files: typing.Iterable[analysis.ReportFile]) -> typing.List[str]:
+        """Bring the matrix up to date with the reports on disk. Returns the paths of the reports (re)loaded."""
+        seen = set()
+        loaded = []
+        for rf in report_files:
+            seen.add(rf.path)
+            stamp = _stamp(rf.path)
+            existing = self.columns.get(rf.path)
+            if existing is not None and tuple(existing.stamp) == stamp:
+                continue
+            self.columns[rf.path] = self._load_column(rf, stamp)
+            self._positions.pop(rf.path, None)
+            loaded.append(rf.path)
+
+        for path in set(self.columns) - seen:
+            del self.columns[path]
+            self._positions.pop(path, None)
+        return loaded
+
+    def _position(self, path: str) -> typing.Dict[int, int]:
+        """Where each matrix row appears in a column. If a scenario was tried more than once, the first result wins."""
+        try:
+            return self._positions[path]
+        except KeyError:
+            positions = {}
+            for i, row in enumerate(self.columns[path].rows):
+                positions.setdefault(row, i)
+            self._positions[path] = positions
+            return positions
+
+    def pairs(self, *, run: str='') -> typing.Iterator[typing.Tuple[Column, Column]]:
+        """Every (direct, Waterbutler) pair of columns for the same provider and kind of check, in one run"""
+        by_key = {}
+        for column in self.columns.values():
+            rf = column.source
+            if rf.run == run:
+                by_key[(rf.provider, rf.folders, rf.transport)] = column
+        for (provider, folders, transport), column in sorted(by_key.items()):
+            wb = by_key.get((provider, folders, 'wb'))
+            if transport == 'direct' and wb is not None:
+                yield column, wb
+
+    def disagreements(self, direct: Column, wb: Column) -> typing.Tuple[int, typing.List[Disagreement]]:
+        """Join two columns on scenario. Returns the number of scenarios in both, and those whose outcome differs."""
+        direct_positions = self._position(direct.source.path)
+        wb_positions = self._position(wb.source.path)
+
+        common = 0
+        found = []
+        for row, i in direct_positions.items():
+            j = wb_positions.get(row)
+            if j is None:
+                continue
+            common += 1
+            if _outcome(direct.status[i], direct.match[i]) != _outcome(wb.status[j], wb.match[j]):
+                found.append(Disagreement(*self.scenarios[row],
+                                          (direct.status[i], direct.their_fn[i], direct.match[i]),
+                                          (wb.status[j], wb.their_fn[j], wb.match[j])))
+        return common, found
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'format': FORMAT,
+                       'scenarios': self.scenarios,
+                       'columns': [list(column) for column in self.columns.values()]}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ResultMatrix':
+        """Read a saved matrix; if there is none (or it can't be read), start empty"""
+        matrix = cls()
+        try:
+            with open(path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return matrix
+        if saved.get('format') != FORMAT:
+            return matrix
+
+        matrix.scenarios = [tuple(scenario) for scenario in saved['scenarios']]
+        matrix._index = {scenario: row for row, scenario in enumerate(matrix.scenarios)}
+        for source, *rest in saved['columns']:
+            column = Column(analysis.ReportFile(*source), *rest)
+            matrix.columns[column.source.path] = column
+        return matrix
@@ -0,0 +1,103 @@
+"""
+Notice when a provider silently changes how it handles filenames: compare each provider's latest run with the one before
+  it (see `results_db`), then re-try only the scenarios whose outcome changed, to rule out one-off failures
+"""
+import typing
+import uuid
+
+import providers
+from . import make_requests
+from . import manifest
+from . import report
+from . import results_db as results_store
+from . import verify
+
+
+class Change(typing.NamedTuple):
+    provider: str
+    transport: str
+    kind: str
+    description: str
+    filename: str
+    before: str
+    after: str
+
+
+def _outcomes(db: results_store.ResultsDB, run_id: int, **where) -> typing.Dict[typing.Tuple[str, str], str]:
+    return {(r.description, r.our_fn): results_store.outcome(r.upload_status_code, r.returned_match)
+            for r in db.results(run_id, **where)}
+
+
+def find_changes(db: results_store.ResultsDB, *, provider: str, transport: str='direct', kind: str='file') \
+        -> typing.List[Change]:
+    """
+    Compare the latest two runs for one provider. If their fingerprints match, nothing changed and no results are
+      read; otherwise each run's results are read once. Scenarios only tried in one of the runs are ignored.
+    """
+    runs = db.recent_runs(provider=provider, transport=transport, kind=kind, limit=2)
+    if len(runs) < 2:
+        return []
+    latest, previous = runs
+    where = dict(provider=provider, transport=transport, kind=kind)
+    if db.fingerprint(latest, **where) == db.fingerprint(previous, **where):
+        return []
+
+    before = _outcomes(db, previous, **where)
+    after = _outcomes(db, latest, **where)
+    changes = []
+    for (description, filename), outcome in after.items():
+        previous_outcome = before.get((description, filename))
+        if previous_outcome is not None and previous_outcome != outcome:
+            changes.append(Change(provider, transport, kind, description, filename, previous_outcome, outcome))
+    return changes
+
+
+async def reprobe(provider: providers.BaseProvider,
+                  changes: typing.List[Change],
+                  *,
+                  manifest_fn: str) -> typing.List[Change]:
+    """
+    Try the changed scenarios again, in a new folder. Returns the changes that were confirmed, ie where the outcome is
+      the same as in the latest run. Everything created is recorded in the manifest at `manifest_fn`, for cleanup.
+    Special requests (see `make_requests.special_requests`) only mean something after the steps before them, so if any
+      of them changed, the whole sequence is run again, in order.
+    """
+    if not changes:
+        return []
+
+    provider.manifest = manifest.Manifest(manifest_fn)
+    provider.manifest.open()
+    await provider.authorize()
+    try:
+        folder_id, code = await provider.create_folder(uuid.uuid4().hex)
+        if code >= 400:
+            print(f'Could not create a folder to re-check {provider.provider_name}; no changes confirmed')
+            return []
+        provider.parent_folder = folder_id
+
+        check = make_requests.check_one_foldername if changes[0].kind == 'folder' \
+            else make_requests.check_one_filename
+        results: typing.Dict[typing.Tuple[str, str], report.Report] = {}
+        for change in changes:
+            scenario = (change.description, change.filename)
+            if scenario not in make_requests.SPECIAL_SCENARIOS:
+                results[scenario] = await check(provider, scenario)
+        if any((change.description, change.filename) in make_requests.SPECIAL_SCENARIOS for change in changes):
+            async for r in make_requests.special_requests(provider):
+                results[(r.description, r.our_fn)] = r
+        folder_index = await verify.fetch_index(provider)
+    finally:
+        provider.manifest.close()
+        await provider.close()
+
+    async def stream() -> typing.AsyncIterator[report.Report]:
+        for r in results.values():
+            yield r
+
+    verified = {(r.description, r.our_fn): r async for r in verify.verified(stream(), folder_index)}
+    confirmed = []
+    for change in changes:
+        r = verified.get((change.description, change.filename))
+        if r is not None and results_store.outcome(r.upload_status_code, r.returned_match) == change.after:
+            confirmed.append(change)
+    return confirmed
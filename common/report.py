@@ -12,20 +12,48 @@ class Report(typing.NamedTuple):
     their_fn: str
     upload_status_code: int
     returned_match: typing.Union[str, None]
+    # How many times the request(s) for this scenario were sent, including retries. 0 if the result came from cache.
+    attempts: int = 1
+
+
+HEADERS = [
+    'Scenario name',
+    'Filename we sent to server',
+    'Filename we got back',
+    'Server response code on upload',
+    'Filename comparison result',
+    'Attempts'
+]
+
+
+def read_report(fn: str) -> typing.Iterator[Report]:
+    """Read back a report written by `report_writer`. Folder checks (no comparison) come back as None."""
+    with open(fn, 'r', newline='') as f:
+        reader = csv.reader(f)
+        # Reports written before attempts were recorded lack the last column
+        if next(reader, None) not in (HEADERS, HEADERS[:-1]):
+            return
+        for row in reader:
+            description, our_fn, their_fn, code, returned_match = row[:5]
+            attempts = int(row[5]) if len(row) > 5 else 1
+            if returned_match == 'False':
+                returned_match = False
+            elif not returned_match:
+                returned_match = None
+            yield Report(description, our_fn, their_fn, int(code), returned_match, attempts)
+
+
+def write_report(reports: typing.Iterable[Report], *, out_fn: str) -> None:
+    with open(out_fn, 'w', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(HEADERS)
+        writer.writerows(reports)
 
 
 async def report_writer(reports: typing.AsyncIterator[Report], provider_name: str, *, out_fn=None):
     with open(out_fn, 'w') as f:
         writer = csv.writer(f, quoting=csv.QUOTE_ALL)
-        headers = [
-            'Scenario name',
-            'Filename we sent to server',
-            'Filename we got back',
-            'Server response code on upload',
-            'Filename comparison result'
-        ]
-
-        writer.writerow(headers)
+        writer.writerow(HEADERS)
 
         async for r in reports:
             writer.writerow([
@@ -33,6 +61,7 @@ async def report_writer(reports: typing.AsyncIterator[Report], provider_name: st
                 r.our_fn,
                 r.their_fn,
                 r.upload_status_code,
-                r.returned_match
+                r.returned_match,
+                r.attempts
             ])
 
@@ -0,0 +1,239 @@
+"""
+Keep every run's results in one SQLite database, so that results can be compared across runs (the CSV reports are
+  overwritten on every run). Results are inserted in batched transactions, and the usual CSV layout can be exported
+  for any run.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+import typing
+
+from . import report
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    options TEXT
+);
+CREATE TABLE IF NOT EXISTS scenarios (
+    id INTEGER PRIMARY KEY,
+    fn_hash TEXT NOT NULL UNIQUE,
+    filename TEXT NOT NULL,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    scenario_id INTEGER NOT NULL REFERENCES scenarios (id),
+    provider TEXT NOT NULL,
+    transport TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    description TEXT,
+    their_fn TEXT,
+    status INTEGER NOT NULL,
+    returned_match TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS results_by_provider ON results (provider, transport, kind, run_id);
+CREATE INDEX IF NOT EXISTS results_by_run ON results (run_id, provider);
+CREATE INDEX IF NOT EXISTS results_by_scenario ON results (scenario_id, run_id);
+CREATE INDEX IF NOT EXISTS results_by_status ON results (status, provider);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    provider TEXT NOT NULL,
+    transport TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    digest INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (provider, transport, kind, run_id)
+);
+'''
+
+# How `returned_match` is stored: a comparison name, '' for no match (False), or NULL for folder checks (None)
+NO_MATCH = ''
+
+# Fingerprints are sums of per-result hashes. Keep them small enough that adding two can't overflow an SQLite integer.
+DIGEST_MODULUS = 2 ** 62
+
+
+def fn_hash(filename: str) -> str:
+    return hashlib.sha256(filename.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def outcome(status: int, returned_match) -> str:
+    """What we expect to stay the same from run to run: whether the request failed (and how), or what came back"""
+    if status >= 400:
+        return str(status)
+    return f'ok:{NO_MATCH if returned_match is False else returned_match}'
+
+
+def result_hash(description: str, filename: str, result_outcome: str) -> int:
+    """
+    Hash one scenario's outcome. A run's fingerprint is the sum of these, so it doesn't depend on the order in which
+      results were recorded (or which worker recorded them).
+    """
+    payload = '\0'.join([description or '', filename, result_outcome]).encode('utf-8', 'surrogatepass')
+    return int.from_bytes(hashlib.sha256(payload).digest()[:8], 'big') % DIGEST_MODULUS
+
+
+class ResultsDB:
+    """
+    A results database for one run. The connection is opened on first use, so an instance can be handed to worker
+      processes (each then opens its own connection, and SQLite serializes their writes).
+    """
+    def __init__(self, path: str, *, run_id: int=None, batch_size: int=500):
+        self.path = path
+        self.run_id = run_id
+        self.batch_size = batch_size
+
+        self._conn = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_conn'] = None
+        return state
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+        return self._conn
+
+    def _migrate(self) -> None:
+        """Bring databases created by older versions up to date"""
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(results)')}
+        if 'attempts' not in columns:
+            with self._conn:
+                self._conn.execute('ALTER TABLE results ADD COLUMN attempts INTEGER NOT NULL DEFAULT 1')
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def start_run(self, **options) -> int:
+        """Register a new run; every result recorded through this instance belongs to it"""
+        with self.conn:
+            cursor = self.conn.execute('INSERT INTO runs (started_at, options) VALUES (?, ?)',
+                                       (time.time(), json.dumps(options, default=str)))
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def _scenario_ids(self, reports: typing.List[report.Report]) -> typing.List[int]:
+        rows = {fn_hash(r.our_fn): (r.our_fn, r.description) for r in reports}
+        self.conn.executemany('INSERT OR IGNORE INTO scenarios (fn_hash, filename, description) VALUES (?, ?, ?)',
+                              [(h, fn, description) for h, (fn, description) in rows.items()])
+        ids = {}
+        hashes = list(rows)
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            query = f'SELECT fn_hash, id FROM scenarios WHERE fn_hash IN ({",".join("?" * len(chunk))})'
+            ids.update(self.conn.execute(query, chunk))
+        return [ids[fn_hash(r.our_fn)] for r in reports]
+
+    def _add_fingerprint(self, run_id: int, digest: int, count: int, *,
+                         provider: str, transport: str, kind: str) -> None:
+        self.conn.execute(
+            'INSERT INTO fingerprints (run_id, provider, transport, kind, digest, count) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (provider, transport, kind, run_id) DO UPDATE SET '
+            f'digest = (digest + excluded.digest) % {DIGEST_MODULUS}, count = count + excluded.count',
+            (run_id, provider, transport, kind, digest, count))
+
+    def _insert(self, batch: typing.List[typing.Tuple[int, report.Report]], **where) -> None:
+        digest = sum(result_hash(r.description, r.our_fn, outcome(r.upload_status_code, r.returned_match))
+                     for _, r in batch) % DIGEST_MODULUS
+        with self.conn:
+            self._add_fingerprint(self.run_id, digest, len(batch), **where)
+            scenario_ids = self._scenario_ids([r for _, r in batch])
+            self.conn.executemany(
+                'INSERT INTO results (run_id, scenario_id, provider, transport, kind, seq, description, their_fn, '
+                'status, returned_match, attempts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(self.run_id, scenario_id, where['provider'], where['transport'], where['kind'], seq,
+                  r.description, r.their_fn, r.upload_status_code,
+                  NO_MATCH if r.returned_match is False else r.returned_match, r.attempts)
+                 for scenario_id, (seq, r) in zip(scenario_ids, batch)])
+
+    async def record(self,
+                     reports: typing.AsyncIterator[report.Report],
+                     *,
+                     provider: str,
+                     transport: str,
+                     kind: str,
+                     seq_start: int=0,
+                     seq_step: int=1) -> typing.AsyncIterator[report.Report]:
+        """
+        Pass reports through unchanged, storing them in batched transactions along the way. Sharded runs number their
+          rows (`seq_start`, `seq_step`) so that an export restores scenario order.
+        """
+        batch = []
+        seq = seq_start
+        async for r in reports:
+            batch.append((seq, r))
+            seq += seq_step
+            if len(batch) >= self.batch_size:
+                self._insert(batch, provider=provider, transport=transport, kind=kind)
+                batch = []
+            yield r
+        if batch:
+            self._insert(batch, provider=provider, transport=transport, kind=kind)
+
+    def runs(self) -> typing.List[typing.Tuple[int, float, dict]]:
+        return [(run_id, started_at, json.loads(options or '{}'))
+                for run_id, started_at, options in self.conn.execute('SELECT id, started_at, options FROM runs '
+                                                                     'ORDER BY id')]
+
+    def latest_run(self, *, provider: str, transport: str='direct', kind: str='file') -> typing.Union[int, None]:
+        row = self.conn.execute('SELECT MAX(run_id) FROM results WHERE provider = ? AND transport = ? AND kind = ?',
+                                (provider, transport, kind)).fetchone()
+        return row[0]
+
+    def recent_runs(self, *, provider: str, transport: str='direct', kind: str='file',
+                    limit: int=2) -> typing.List[int]:
+        """The ids of the latest runs with results for this provider, newest first"""
+        return [run_id for run_id, in self.conn.execute(
+            'SELECT DISTINCT run_id FROM results WHERE provider = ? AND transport = ? AND kind = ? '
+            'ORDER BY run_id DESC LIMIT ?', (provider, transport, kind, limit))]
+
+    def fingerprint(self, run_id: int, *, provider: str, transport: str='direct', kind: str='file') -> int:
+        """
+        A digest of every outcome for one provider in one run: if two runs have the same fingerprint, nothing changed.
+          Fingerprints are kept up to date as results are recorded, and computed on demand for older results.
+        """
+        where = (provider, transport, kind, run_id)
+        row = self.conn.execute('SELECT digest FROM fingerprints WHERE provider = ? AND transport = ? AND kind = ? '
+                                'AND run_id = ?', where).fetchone()
+        if row is not None:
+            return row[0]
+
+        digest = count = 0
+        for r in self.results(run_id, provider=provider, transport=transport, kind=kind):
+            digest = (digest + result_hash(r.description, r.our_fn,
+                                           outcome(r.upload_status_code, r.returned_match))) % DIGEST_MODULUS
+            count += 1
+        with self.conn:
+            self._add_fingerprint(run_id, digest, count, provider=provider, transport=transport, kind=kind)
+        return digest
+
+    def results(self, run_id: int, *, provider: str, transport: str='direct', kind: str='file') \
+            -> typing.Iterator[report.Report]:
+        """The results for one provider in one run, in scenario order"""
+        cursor = self.conn.execute(
+            'SELECT r.description, s.filename, r.their_fn, r.status, r.returned_match, r.attempts '
+            'FROM results r JOIN scenarios s ON s.id = r.scenario_id '
+            'WHERE r.provider = ? AND r.transport = ? AND r.kind = ? AND r.run_id = ? ORDER BY r.seq, r.id',
+            (provider, transport, kind, run_id))
+        for description, filename, their_fn, status, returned_match, attempts in cursor:
+            yield report.Report(description, filename, their_fn, status,
+                                False if returned_match == NO_MATCH else returned_match, attempts)
+
+    def export(self, run_id: int, *, provider: str, transport: str='direct', kind: str='file', out_fn: str) -> None:
+        """Write one provider's results from one run in the usual report layout"""
+        report.write_report(self.results(run_id, provider=provider, transport=transport, kind=kind), out_fn=out_fn)
@@ -0,0 +1,69 @@
+"""
+For providers whose upload responses don't say what a file was called, find out after the fact: list the test folder
+  once, then match every stored name back to the scenario that created it
+"""
+import typing
+import unicodedata
+import urllib.parse
+
+import providers
+from . import behaviors
+from . import report
+
+
+def _candidate_forms(stored_name: str) -> typing.Iterator[str]:
+    """Ways that a name we sent might have been transformed into the stored name, most exact first"""
+    yield stored_name
+    yield urllib.parse.unquote(stored_name)
+    yield urllib.parse.unquote_plus(stored_name)
+    for form in ('NFC', 'NFD'):
+        yield unicodedata.normalize(form, stored_name)
+
+
+class FolderIndex:
+    """Look up which stored name (if any) corresponds to a filename we sent, in a single hash lookup"""
+    def __init__(self, stored_names: typing.Iterable[str]):
+        self._index: typing.Dict[str, str] = {}
+        # Build in two passes, so that an exact match always wins over a transformed one
+        stored_names = list(stored_names)
+        for name in stored_names:
+            self._index[name] = name
+        for name in stored_names:
+            for form in _candidate_forms(name):
+                self._index.setdefault(form, name)
+
+    def __len__(self):
+        return len(self._index)
+
+    def match(self, our_fn: str) -> typing.Union[str, None]:
+        return self._index.get(our_fn) or self._index.get(unicodedata.normalize('NFC', our_fn))
+
+
+async def fetch_index(provider: providers.BaseProvider) -> typing.Union[FolderIndex, None]:
+    """List the provider's test folder (one listing per folder, however many files were uploaded)"""
+    if not provider.VERIFY_BY_LISTING:
+        return None
+
+    with provider.tracer.operation('list_folder'):
+        names, code = await provider.list_folder()
+
+    if code >= 400 or names is None:
+        print(f'Could not list folder {provider.parent_folder} for provider {provider.provider_name} ({code})')
+        return None
+    print(f'Listed {len(names)} stored names in folder {provider.parent_folder} for {provider.provider_name}')
+    return FolderIndex(names)
+
+
+async def verified(reports: typing.AsyncIterator[report.Report],
+                   index: typing.Union[FolderIndex, None]) -> typing.AsyncIterator[report.Report]:
+    """Fill in the returned filename (and comparison result) for each successful upload that lacks one"""
+    async for r in reports:
+        # Folder checks (returned_match None) and failed uploads have nothing to verify. Results from the cache (no
+        #   attempts) were verified when first stored, and were never uploaded to this run's folder.
+        needs_name = not r.their_fn and r.returned_match is not None and r.upload_status_code < 400 and r.attempts > 0
+        if index is None or not needs_name:
+            yield r
+            continue
+
+        their_fn = index.match(r.our_fn)
+        yield r._replace(their_fn=their_fn, returned_match=behaviors.compare(r.our_fn, their_fn))
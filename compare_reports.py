@@ -0,0 +1,65 @@
+"""
+Compare the results of going through Waterbutler (`reports/waterbutler/*.csv`) against those of talking to each
+  provider directly (`reports/*.csv`), and print every scenario where the two disagree
+"""
+import argparse
+import os
+import sys
+import time
+
+from common import analysis, matrix
+import main
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reports-dir', default=main.REPORTS_PATH, help='Where to look for reports')
+    parser.add_argument('--providers', nargs='*', help='Only compare reports for these provider(s)')
+    parser.add_argument('--run', default='',
+                        help='Compare the reports of an archived run (a subfolder of the reports dir) instead of the '
+                             'current one')
+    parser.add_argument('--summary', action='store_true',
+                        help='If flag present, only print the number of disagreements per provider')
+    return parser.parse_args()
+
+
+def _describe(outcome) -> str:
+    status, their_fn, match = outcome
+    return f'{status} {match} {their_fn!r}'
+
+
+def compare(result_matrix: matrix.ResultMatrix, *, run: str='', provider_names=None, summary: bool=False) -> int:
+    """Print the disagreements between transports for every provider. Returns how many were found."""
+    total = 0
+    for direct, wb in result_matrix.pairs(run=run):
+        provider = direct.source.provider
+        if provider_names and provider not in provider_names:
+            continue
+
+        common, found = result_matrix.disagreements(direct, wb)
+        total += len(found)
+        kind = 'folders' if direct.source.folders else 'files'
+        print(f'{provider} ({kind}): {len(found)} of {common} scenario(s) disagree')
+        if summary:
+            continue
+        for d in found:
+            print(f'    {d.description}, {d.our_fn!r}: direct {_describe(d.direct)}; via wb {_describe(d.wb)}')
+    return total
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 6):
+        raise RuntimeError('For best results, must use Python >= 3.6')
+
+    args = parse_args()
+
+    start = time.time()
+    snapshot_path = os.path.join(args.reports_dir, '.matrix.json')
+    result_matrix = matrix.ResultMatrix.load(snapshot_path)
+    loaded = result_matrix.refresh(analysis.find_reports(args.reports_dir))
+    if loaded:
+        result_matrix.save(snapshot_path)
+
+    count = compare(result_matrix, run=args.run, provider_names=args.providers, summary=args.summary)
+    print(f'{count} disagreement(s); re-read {len(loaded)} of {len(result_matrix.columns)} report(s) '
+          f'in {time.time() - start:.2f}s')
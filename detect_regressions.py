@@ -0,0 +1,86 @@
+"""
+Compare each provider's latest run in the results database (see `main.py --db`) with the one before it, re-check any
+  scenarios whose outcome changed, and alert on the changes that are confirmed. Exits with status 1 if there are any.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from common import regressions, results_db as results_store
+import main
+import providers
+
+
+ALERTS_PATH = os.path.join(main.REPORTS_PATH, 'regressions.jsonl')
+# Anything created while re-checking is recorded for cleanup, one manifest per provider
+REPROBE_MANIFEST_FN = os.path.join(main.REPORTS_PATH, '{}-regressions.manifest')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=main.RESULTS_DB_PATH, help='The results database to read')
+    parser.add_argument('--providers', nargs='*', default=main.KNOWN_PROVIDERS.keys(),
+                        help='The name of the storage provider(s) to check')
+    parser.add_argument('--wb', action='store_true', help='If flag present, check results routed through Waterbutler')
+    parser.add_argument('--folders', action='store_true', help='If flag present, check folder name results')
+    parser.add_argument('--no-reprobe', action='store_true',
+                        help='If flag present, alert on every change found without re-checking it first')
+    parser.add_argument('--alerts', default=ALERTS_PATH, help='Append confirmed changes to this file (JSON lines)')
+    return parser.parse_args()
+
+
+async def detect(db: results_store.ResultsDB,
+                 provider_names,
+                 *,
+                 use_wb: bool=False,
+                 folders: bool=False,
+                 reprobe: bool=True):
+    """Find the changes for every provider, then re-check them, all providers at once"""
+    transport = 'wb' if use_wb else 'direct'
+    kind = 'folder' if folders else 'file'
+
+    found = {}
+    for name in provider_names:
+        changes = regressions.find_changes(db, provider=name, transport=transport, kind=kind)
+        print(f'{name}: {len(changes)} scenario(s) changed since the previous run')
+        if changes:
+            found[name] = changes
+    if not reprobe:
+        return [change for changes in found.values() for change in changes]
+
+    def build(name):
+        ProviderClass = providers.get_provider_class(name, use_wb=use_wb)
+        return ProviderClass(provider_name=name)
+
+    confirmed = await asyncio.gather(*[regressions.reprobe(build(name), changes,
+                                                           manifest_fn=REPROBE_MANIFEST_FN.format(name))
+                                       for name, changes in found.items()])
+    return [change for changes in confirmed for change in changes]
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 6):
+        raise RuntimeError('For best results, must use Python >= 3.6')
+
+    args = parse_args()
+
+    db = results_store.ResultsDB(args.db)
+    loop = asyncio.get_event_loop()
+    alerts = loop.run_until_complete(detect(db, args.providers, use_wb=args.wb, folders=args.folders,
+                                            reprobe=not args.no_reprobe))
+    loop.close()
+    db.close()
+
+    if not alerts:
+        print('No regressions confirmed')
+        sys.exit()
+
+    with open(args.alerts, 'a') as f:
+        for change in alerts:
+            print(f'REGRESSION {change.provider} ({change.transport}, {change.kind}): {change.filename!r} '
+                  f'was {change.before}, now {change.after}')
+            f.write(json.dumps(dict(change._asdict(), detected_at=time.time())) + '\n')
+    sys.exit(1)
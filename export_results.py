@@ -0,0 +1,49 @@
+"""
+Export results from the results database (see `main.py --db`) in the usual report layout, or list the runs recorded
+"""
+import argparse
+import datetime
+import os
+import sys
+
+from common import results_db as results_store
+import main
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=main.RESULTS_DB_PATH, help='The results database to read')
+    parser.add_argument('--list-runs', action='store_true', help='If flag present, list the runs recorded and exit')
+    parser.add_argument('--providers', nargs='*', default=main.KNOWN_PROVIDERS.keys(),
+                        help='The name of the storage provider(s) to export')
+    parser.add_argument('--run', type=int, help='Which run to export. By default, the latest run for each provider')
+    parser.add_argument('--wb', action='store_true', help='If flag present, export results routed through Waterbutler')
+    parser.add_argument('--folders', action='store_true', help='If flag present, export folder name results')
+    parser.add_argument('--out-dir', default='.', help='Where to write the exported reports')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 6):
+        raise RuntimeError('For best results, must use Python >= 3.6')
+
+    args = parse_args()
+
+    db = results_store.ResultsDB(args.db)
+    if args.list_runs:
+        for run_id, started_at, options in db.runs():
+            print(run_id, datetime.datetime.fromtimestamp(started_at).isoformat(timespec='seconds'), options)
+        sys.exit()
+
+    transport = 'wb' if args.wb else 'direct'
+    kind = 'folder' if args.folders else 'file'
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name in args.providers:
+        run_id = args.run or db.latest_run(provider=name, transport=transport, kind=kind)
+        if run_id is None:
+            print(f'No results for {name}')
+            continue
+        out_fn = os.path.join(args.out_dir, main.report_filename(name, folders=args.folders))
+        db.export(run_id, provider=name, transport=transport, kind=kind, out_fn=out_fn)
+        print(f'Exported run {run_id} for {name} to {out_fn}')
+    db.close()
@@ -5,35 +5,33 @@ choose to use only a subset of the available filename samples and providers.
 
 import argparse
 import asyncio
+import concurrent.futures
 import csv
 import glob
+import itertools
 import os
 import sys
+import time
 import typing
 import uuid
 
-from common import make_requests, report
+from common import cache as result_cache, journal, make_requests, manifest, report, results_db as results_store, verify
 import providers
+from util import metrics, scenario_generator
 
 
 HERE = os.path.dirname(__file__)
 SCENARIOS_PATH = os.path.join(os.path.abspath(HERE), 'scenarios')
 REPORTS_PATH = os.path.join(HERE, 'reports')
+TRACES_PATH = os.path.join(REPORTS_PATH, 'traces')
+CACHE_PATH = os.path.join(REPORTS_PATH, '.cache')
+# With `--workers`, each worker writes its shard of reports (and journal) here; shards are then merged into REPORTS_PATH
+SHARDS_PATH = os.path.join(REPORTS_PATH, '.shards')
+# With `--db`, the results of every run are also kept here
+RESULTS_DB_PATH = os.path.join(REPORTS_PATH, 'results.sqlite3')
 
-# Intentionally exclude certain WB services: Rackspace cloudfiles, filesystem (used internally only),
-# MattF can provide owncloud credentials. For s3 testing, use your own amazon account. For local FigShare, use https,
-# or generate a personal token for oauth.
-KNOWN_PROVIDERS = {
-    'box': providers.BoxProvider,
-    'dataverse': providers.DataverseProvider,
-    'dropbox': providers.DropboxProvider,
-    'figshare': providers.FigshareProvider,
-    'github': providers.GithubProvider,
-    'googledrive': providers.GoogleDriveProvider,
-    'osfstorage': providers.WBProvider,
-    'owncloud': providers.OwncloudProvider,
-    's3': providers.S3Provider
-}
+# Provider classes by name, imported on first use (see `providers.KNOWN_PROVIDERS`)
+KNOWN_PROVIDERS = providers.KNOWN_PROVIDERS
 
 
 def parse_args():
@@ -41,10 +39,43 @@ def parse_args():
     parser.add_argument('--providers', nargs='*', default=KNOWN_PROVIDERS.keys(),
                         help='The name of the storage provider(s) to try')
     parser.add_argument('--scenarios', nargs='*', help='The name(s) of the filename trial suite(s) to try')
+    parser.add_argument('--generate', action='store_true',
+                        help='If flag present, test combinatorially generated filenames instead of scenario files')
+    parser.add_argument('--depth', default=2, type=int,
+                        help='When generating, the longest combination of special characters to try')
+    parser.add_argument('--shard', default=0, type=int, help='When generating, which shard of filenames to try')
+    parser.add_argument('--num-shards', default=1, type=int,
+                        help='When generating, split filenames into this many deterministic shards')
     parser.add_argument('--wb', action='store_true',
                         help='If flag present, routes all provider requests through Waterbutler API')
     parser.add_argument('--delay', default=0.2, type=float,
-                        help='The time between requests, in seconds (throttles to avoid overwhelming server)')
+                        help='The initial time between requests, in seconds. Adapts to rate limit responses from '
+                             'each provider.')
+    parser.add_argument('--concurrency', default=1, type=int,
+                        help='The maximum number of requests in flight at once, per provider')
+    parser.add_argument('--resume', action='store_true',
+                        help='If flag present, continue an interrupted run: skip scenarios already recorded in the '
+                             'journal, and reuse the same parent folder')
+    parser.add_argument('--batch', action='store_true',
+                        help='If flag present, providers with a bulk upload API send many filenames per request')
+    parser.add_argument('--folders', action='store_true',
+                        help='If flag present, try each scenario name as a folder name instead of a filename. Results '
+                             'are reported in a separate file (eg `box-folders.csv`)')
+    parser.add_argument('--cache', action='store_true',
+                        help='If flag present, only send requests for filenames whose outcome is not already cached')
+    parser.add_argument('--cache-ttl', default=7, type=float,
+                        help='When using the cache, how long (in days) before a cached outcome is checked again')
+    parser.add_argument('--cache-size', default=1000000, type=int,
+                        help='When using the cache, how many outcomes to keep (least recently used are evicted)')
+    parser.add_argument('--db', action='store_true',
+                        help='If flag present, also store results in a database of all runs (see `export_results.py`)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='If given, serve live OpenMetrics counters and histograms at '
+                             'http://localhost:PORT/metrics while the run is in progress. With workers, each worker '
+                             'serves on the next port up.')
+    parser.add_argument('--workers', default=1, type=int,
+                        help='The number of worker processes. Each runs a provider (or a shard of its scenarios, if '
+                             'there are more workers than providers) on its own event loop')
     return parser.parse_args()
 
 
@@ -65,74 +96,294 @@ def get_scenario_locations(*, desired_scenarios: typing.Iterable = ()) -> list:
 
 
 def load_scenarios(filenames: list):
-    """Return an iterator over all available test situations"""
+    """
+    Return an iterator over all available test situations. Rows are read lazily, so each caller gets an independent
+      cursor and large scenario files are never held in memory all at once.
+    """
     for fn in filenames:
         with open(fn, 'r') as f:
             reader = csv.reader(f, dialect='unix')
-            rows = list(reader)
+            for prose, test_fn in reader:
+                yield (prose, test_fn)
+
+
+def scenario_source(scenario_filenames: list, generate: typing.Union[dict, None]=None) -> typing.Iterator:
+    """A fresh iterator over the scenarios for one provider: generated on the fly if `generate` options are given"""
+    if generate is not None:
+        return scenario_generator.generate_scenarios(**generate)
+    return load_scenarios(scenario_filenames)
+
+
+def shard_scenarios(scenarios: typing.Iterable, shard: int, num_shards: int) -> typing.Iterator:
+    """
+    Deal scenarios out round-robin, keeping every `num_shards`th one starting at `shard`. Reading the shard reports
+      back in the same round-robin order restores the original scenario order (see `merge_shard_reports`).
+    """
+    return itertools.islice(scenarios, shard, None, num_shards)
+
 
-        for prose, test_fn in rows:
-            yield (prose, test_fn)
+def report_filename(provider_name: str, *, folders: bool=False) -> str:
+    """Folder name results are reported separately from filename results"""
+    return f'{provider_name}-folders.csv' if folders else f'{provider_name}.csv'
 
 
 async def pipeline(provider: providers.BaseProvider,
                    scenarios, *,
-                   delay: typing.Union[float, None]=None,
-                   use_wb: bool=False):
+                   concurrency: int=1,
+                   use_wb: bool=False,
+                   resume: bool=False,
+                   trace_fn: str=None,
+                   report_dir: str=None,
+                   cache: result_cache.ResultCache=None,
+                   batch: bool=False,
+                   special: bool=True,
+                   folders: bool=False,
+                   results_db: results_store.ResultsDB=None,
+                   shard: typing.Tuple[int, int]=(0, 1)) -> int:
     """
     Define a pipeline of tasks to run in series
     
     1. Authorize for this provider (with credentials)
     2. Schedule something on the runloop to start making requests for this provider
-    3. As responses come in, start writing them to an output file report
-    :return: 
+    3. As responses come in, record them in a journal (so that an interrupted run can be resumed). Everything created
+         on the provider is recorded in a manifest, for later cleanup (see `cleanup.py`)
+    4. For providers whose upload responses don't name the stored file, list the test folder once to find out
+    5. Write the output file report from the journal (and store new outcomes in the cache, and the results in the
+         results database, if any)
+    6. Close the provider's pooled HTTP session, and summarize request latency (recorded in `trace_fn`)
+    :return: The number of scenarios reported
     """
-    await provider.authorize()
-
-    # Create a folder where tests will be run
-    dest_foldername = uuid.uuid4().hex
-    folder_id, code = await provider.create_folder(dest_foldername)
-
-    if code >= 400:
-        print('Could not create parent folder for run of provider ', provider.provider_name)
-        sys.exit()
-
-    print('Created folder ', folder_id, ' for provider ', provider.provider_name, code)
-    # Some providers can choose to respect this setting for all requests, and do upload tests within this folder
-    provider.parent_folder = folder_id
-
-    trial_reports = make_requests.serial_requests(provider, scenarios, delay=delay)
-
-    report_path = REPORTS_PATH if not use_wb else os.path.join(REPORTS_PATH, 'waterbutler')
+    report_dir = report_dir or REPORTS_PATH
+    report_path = report_dir if not use_wb else os.path.join(report_dir, 'waterbutler')
     os.makedirs(report_path, exist_ok=True)
-    out_fn = os.path.join(report_path, f'{provider.provider_name}.csv')
-    await report.report_writer(trial_reports, provider.provider_name, out_fn=out_fn)
+    out_fn = os.path.join(report_path, report_filename(provider.provider_name, folders=folders))
+    kind = 'folder' if folders else 'file'
+
+    run_journal = journal.Journal(os.path.splitext(out_fn)[0] + '.journal')
+    if resume:
+        run_journal.load()
+    run_journal.open(resume=resume)
+    if trace_fn:
+        provider.tracer.open(trace_fn)
+    provider.manifest = manifest.Manifest(os.path.splitext(out_fn)[0] + '.manifest')
+    provider.manifest.open()
+
+    await provider.authorize()
+    folder_index = None
+    try:
+        if run_journal.parent_folder is not None:
+            folder_id = run_journal.parent_folder
+            print('Resuming in folder ', folder_id, ' for provider ', provider.provider_name,
+                  f'({run_journal.count} scenarios already complete)')
+            metrics.scenarios_resumed(provider.provider_name, kind, run_journal.count)
+        else:
+            # Create a folder where tests will be run
+            dest_foldername = uuid.uuid4().hex
+            with provider.tracer.operation('create_folder'):
+                folder_id, code = await provider.create_folder(dest_foldername)
+
+            if code >= 400:
+                print('Could not create parent folder for run of provider ', provider.provider_name)
+                sys.exit()
+
+            print('Created folder ', folder_id, ' for provider ', provider.provider_name, code)
+            run_journal.record_parent_folder(folder_id)
+
+        # Some providers can choose to respect this setting for all requests, and do upload tests within this folder
+        provider.parent_folder = folder_id
+
+        # Request pacing is handled by the provider's adaptive throttle (see `run_single_provider`)
+        batch_size = None
+        if batch:
+            batch_size = provider.FOLDER_BATCH_SIZE if folders else provider.BATCH_SIZE
+        trial_reports = make_requests.concurrent_requests(provider, scenarios,
+                                                          concurrency=concurrency, skip=run_journal, cache=cache,
+                                                          batch_size=batch_size, special=special, folders=folders)
+        async for r in run_journal.track(trial_reports):
+            metrics.scenario_done(provider.provider_name, kind, r.upload_status_code)
+
+        folder_index = await verify.fetch_index(provider)
+    finally:
+        run_journal.close()
+        provider.manifest.close()
+        await provider.close()
+
+        # If the run stopped part way (eg an access token expired), still report everything completed so far. A later
+        #   `--resume` reports the whole run again.
+        if run_journal.count:
+            reports = verify.verified(run_journal.replay(), folder_index)
+            if cache is not None and (folder_index is not None or not provider.VERIFY_BY_LISTING):
+                # Only cache outcomes once the stored name is known
+                reports = make_requests.cache_results(provider, reports, cache=cache, kind=kind)
+            if results_db is not None:
+                reports = results_db.record(reports, provider=provider.provider_name, transport=provider.TRANSPORT,
+                                            kind=kind, seq_start=shard[0], seq_step=shard[1])
+            await report.report_writer(reports, provider.provider_name, out_fn=out_fn)
+
+    if cache is not None:
+        print(f'Cache for {provider.provider_name}: {cache.hits[provider.provider_name]} hits, '
+              f'{cache.misses[provider.provider_name]} misses')
+    return run_journal.count
 
 
 def run_single_provider(provider_name: str,
-                        scenarios: list,
+                        scenarios: typing.Iterable[typing.Tuple[str, str]],
                         *,
                         delay: typing.Union[float, None]=None,
-                        use_wb: bool=False) -> typing.Awaitable:
+                        concurrency: int=1,
+                        use_wb: bool=False,
+                        resume: bool=False,
+                        trace_fn: str=None,
+                        cache: result_cache.ResultCache=None,
+                        batch: bool=False,
+                        report_dir: str=None,
+                        special: bool=True,
+                        folders: bool=False,
+                        results_db: results_store.ResultsDB=None,
+                        shard: typing.Tuple[int, int]=(0, 1)) -> typing.Awaitable:
     """Import the modules associated with a provider, setup connections, then perform the pipeline of requests"""
-    if use_wb:
-        ProviderClass = providers.WBProvider
-    else:
-        ProviderClass = KNOWN_PROVIDERS[provider_name]
-
-    provider = ProviderClass(provider_name=provider_name)
+    ProviderClass = providers.get_provider_class(provider_name, use_wb=use_wb)
+    provider = ProviderClass(provider_name=provider_name, delay=delay)
 
-    return asyncio.ensure_future(pipeline(provider, scenarios, delay=delay, use_wb=use_wb))
+    return asyncio.ensure_future(pipeline(provider, scenarios, concurrency=concurrency,
+                                          use_wb=use_wb, resume=resume, trace_fn=trace_fn, cache=cache, batch=batch,
+                                          report_dir=report_dir, special=special, folders=folders,
+                                          results_db=results_db, shard=shard))
 
 
 def main(*, provider_names: typing.Iterable[str]=(),
          scenario_names: typing.List[str]=None,
+         generate: typing.Union[dict, None]=None,
          delay: typing.Union[float, None]=None,
-         use_wb: bool=False) -> typing.List[typing.Awaitable]:
-    """Perform filename tests for a series of providers"""
+         concurrency: int=1,
+         use_wb: bool=False,
+         resume: bool=False,
+         cache: result_cache.ResultCache=None,
+         batch: bool=False,
+         folders: bool=False,
+         results_db: results_store.ResultsDB=None) -> typing.List[typing.Awaitable]:
+    """
+    Perform filename tests for a series of providers. If `generate` is specified, filenames are generated on the fly
+      (with those options) instead of being read from scenario files. If a cache is specified, only filenames with
+      unknown outcomes are sent to providers.
+    """
+    scenario_filenames = get_scenario_locations(desired_scenarios=scenario_names)
+
+    # All providers in this run share one file of request timings
+    trace_fn = os.path.join(TRACES_PATH, time.strftime('%Y%m%d-%H%M%S') + '.jsonl')
+    # Each provider streams the scenarios independently, at its own pace
+    return [run_single_provider(name, scenario_source(scenario_filenames, generate),
+                                delay=delay, concurrency=concurrency, use_wb=use_wb, resume=resume, trace_fn=trace_fn,
+                                cache=cache, batch=batch, folders=folders, results_db=results_db)
+            for name in provider_names]
+
+
+def expect_scenarios(provider_names: typing.Iterable[str], scenarios: typing.Iterable, *, folders: bool=False) -> None:
+    """
+    For progress metrics: count the scenarios that each provider will try (not including special requests). This reads
+      every scenario, so only use it for scenario files, not generated scenarios.
+    """
+    total = sum(1 for _ in scenarios)
+    for name in provider_names:
+        metrics.expect_scenarios(name, 'folder' if folders else 'file', total)
+
+
+def _run_shard(provider_name: str, shard: int, num_shards: int, *,
+               scenario_filenames: list,
+               generate: typing.Union[dict, None]=None,
+               metrics_port: int=None,
+               **kwargs) -> int:
+    """Worker process entry point: run one shard of one provider's scenarios on a fresh event loop"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = None
+    try:
+        if metrics_port:
+            server = metrics.MetricsServer(port=metrics_port)
+            loop.run_until_complete(server.start())
+            # Generated scenarios are produced as they are tried, so there is no total to count up front
+            if generate is None:
+                expect_scenarios([provider_name],
+                                 shard_scenarios(scenario_source(scenario_filenames), shard, num_shards),
+                                 folders=kwargs.get('folders', False))
+
+        scenarios = shard_scenarios(scenario_source(scenario_filenames, generate), shard, num_shards)
+        # Special requests depend on each other, so only the first shard runs them
+        future = run_single_provider(provider_name, scenarios, report_dir=os.path.join(SHARDS_PATH, str(shard)),
+                                     special=(shard == 0), shard=(shard, num_shards), **kwargs)
+        return loop.run_until_complete(future)
+    finally:
+        if server is not None:
+            loop.run_until_complete(server.stop())
+        loop.close()
+
+
+def merge_shard_reports(shard_fns: typing.List[str], out_fn: str) -> int:
+    """
+    Merge the shard reports for one provider into a single report, taking one row from each shard in turn (the inverse
+      of `shard_scenarios`). Returns the number of rows written.
+    """
+    files = [open(fn, 'r', newline='') for fn in shard_fns if os.path.exists(fn)]
+    count = 0
+    try:
+        readers = [csv.reader(f) for f in files]
+        headers = [next(reader, None) for reader in readers]
+
+        with open(out_fn, 'w', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(next((h for h in headers if h), []))
+            for rows in itertools.zip_longest(*readers):
+                for row in rows:
+                    if row is not None:
+                        writer.writerow(row)
+                        count += 1
+    finally:
+        for f in files:
+            f.close()
+    return count
+
+
+def run_workers(workers: int, *,
+                provider_names: typing.Iterable[str]=(),
+                scenario_names: typing.List[str]=None,
+                generate: typing.Union[dict, None]=None,
+                use_wb: bool=False,
+                folders: bool=False,
+                metrics_port: int=None,
+                **kwargs) -> typing.Dict[str, int]:
+    """
+    Perform filename tests for a series of providers, spread across `workers` processes, each with its own event loop.
+      Each worker gets one provider; if there are more workers than providers, each provider's scenarios are also
+      split into shards. Shard reports are merged into the usual reports layout. If a `metrics_port` is given, each
+      worker serves its metrics on its own port, counting up from there.
+    :return: The number of rows reported, by provider name
+    """
+    provider_names = list(provider_names)
     scenario_filenames = get_scenario_locations(desired_scenarios=scenario_names)
-    scenarios = list(load_scenarios(scenario_filenames))
-    return [run_single_provider(name, scenarios, delay=delay, use_wb=use_wb) for name in provider_names]
+    num_shards = max(1, -(-workers // max(len(provider_names), 1)))
+
+    trace_fn = os.path.join(TRACES_PATH, time.strftime('%Y%m%d-%H%M%S') + '.jsonl')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [(name, shard) for name in provider_names for shard in range(num_shards)]
+        futures = [pool.submit(_run_shard, name, shard, num_shards,
+                               scenario_filenames=scenario_filenames, generate=generate, use_wb=use_wb,
+                               folders=folders, trace_fn=trace_fn,
+                               metrics_port=(metrics_port + i) if metrics_port else None, **kwargs)
+                   for i, (name, shard) in enumerate(jobs)]
+        # Raise the first error from any worker
+        for future in futures:
+            future.result()
+
+    subdir = 'waterbutler' if use_wb else ''
+    counts = {}
+    for name in provider_names:
+        out_name = report_filename(name, folders=folders)
+        shard_fns = [os.path.join(SHARDS_PATH, str(shard), subdir, out_name) for shard in range(num_shards)]
+        out_dir = os.path.join(REPORTS_PATH, subdir)
+        os.makedirs(out_dir, exist_ok=True)
+        counts[name] = merge_shard_reports(shard_fns, os.path.join(out_dir, out_name))
+        print(f'Merged {num_shards} shard(s) for {name}: {counts[name]} rows')
+    return counts
 
 
 if __name__ == '__main__':
@@ -142,7 +393,48 @@ if __name__ == '__main__':
     args = parse_args()
 
     loop = loop = asyncio.get_event_loop()
-    futures = main(provider_names=args.providers, scenario_names=args.scenarios, delay=args.delay, use_wb=args.wb)
+    generate = None
+    if args.generate:
+        generate = {'depth': args.depth, 'shard': args.shard, 'num_shards': args.num_shards}
+
+    cache = None
+    if args.cache:
+        cache = result_cache.ResultCache(CACHE_PATH, ttl=args.cache_ttl * 24 * 60 * 60, max_entries=args.cache_size)
+
+    results_db = None
+    if args.db:
+        results_db = results_store.ResultsDB(RESULTS_DB_PATH)
+        results_db.start_run(providers=list(args.providers), scenarios=args.scenarios, generate=generate, wb=args.wb,
+                             folders=args.folders)
+        # Worker processes open their own connections
+        results_db.close()
+
+    if args.workers > 1:
+        run_workers(args.workers, provider_names=args.providers, scenario_names=args.scenarios, generate=generate,
+                    delay=args.delay, concurrency=args.concurrency, use_wb=args.wb, resume=args.resume, cache=cache,
+                    batch=args.batch, folders=args.folders, results_db=results_db, metrics_port=args.metrics_port)
+        if cache is not None:
+            cache.evict()
+        sys.exit()
+
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = metrics.MetricsServer(port=args.metrics_port)
+        loop.run_until_complete(metrics_server.start())
+        if generate is None:
+            expect_scenarios(args.providers, scenario_source(get_scenario_locations(desired_scenarios=args.scenarios)),
+                             folders=args.folders)
+
+    futures = main(provider_names=args.providers, scenario_names=args.scenarios, generate=generate, delay=args.delay,
+                   concurrency=args.concurrency, use_wb=args.wb, resume=args.resume, cache=cache, batch=args.batch,
+                   folders=args.folders, results_db=results_db)
     #futures = main(provider_names=['dataverse'], scenario_names=None, use_wb=True, delay=0.2)
     loop.run_until_complete(asyncio.gather(*futures))
+    if metrics_server is not None:
+        loop.run_until_complete(metrics_server.stop())
     loop.close()
+    # Eviction scans the whole cache, so do it once every provider has finished
+    if cache is not None:
+        cache.evict()
+    if results_db is not None:
+        results_db.close()
@@ -0,0 +1,748 @@
+"""
+Local mock servers that emulate the endpoints each provider class uses, so that the full pipeline can be benchmarked
+  (or sanity checked) without talking to real cloud services.
+
+Point providers at a running mock server by setting `MOCK_HOST` in settings. Each provider is served under a prefix
+  matching its name (eg `/dropbox/2/files/upload`, or `/s3/<bucket>/<key>` for path-style S3 requests).
+"""
+import asyncio
+import collections
+import email
+import hashlib
+import http
+import io
+import itertools
+import json
+import random
+import re
+import typing
+import urllib.parse
+import uuid
+import xml.etree.ElementTree as ElementTree
+import xml.sax.saxutils as saxutils
+import zipfile
+
+from aiohttp import web
+
+
+# Names of the mock providers, which are also their URL prefixes
+PROVIDERS = ('box', 'dataverse', 'dropbox', 'figshare', 'github', 'googledrive', 'owncloud', 's3', 'waterbutler')
+
+
+class FilenameRules:
+    """How a mock provider treats the filenames it is given. By default, every name is stored exactly as sent."""
+    def __init__(self, *,
+                 reject: str='',
+                 replace: typing.Dict[str, str]=None,
+                 strip: bool=False,
+                 max_length: int=None):
+        self.reject = reject
+        self.replace = replace or {}
+        self.strip = strip
+        self.max_length = max_length
+
+    def apply(self, name: str) -> typing.Union[str, None]:
+        """Return the name the provider would store, or None if the provider would refuse this name"""
+        if any(c in name for c in self.reject):
+            return None
+        if self.max_length is not None and len(name) > self.max_length:
+            return None
+
+        for old, new in self.replace.items():
+            name = name.replace(old, new)
+        if self.strip:
+            name = name.strip()
+        return name or None
+
+
+class MockConfig:
+    """Settings shared by every mock provider endpoint"""
+    def __init__(self, *,
+                 latency: float=0.0,
+                 jitter: float=0.0,
+                 error_rate: float=0.0,
+                 error_code: int=503,
+                 retry_after: float=None,
+                 rules: typing.Dict[str, FilenameRules]=None,
+                 figshare_part_size: int=5 * 1024 * 1024,
+                 seed: int=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.retry_after = retry_after
+        self.rules = collections.defaultdict(FilenameRules, rules or {})
+        self.figshare_part_size = figshare_part_size
+        self.random = random.Random(seed)
+
+
+class MockStore:
+    """Everything that has been "uploaded" to the mock providers, by (provider, container) -> {stored name: content}"""
+    def __init__(self):
+        self.containers: typing.Dict[typing.Tuple[str, str], typing.Dict[str, bytes]] = collections.defaultdict(dict)
+        self._ids = itertools.count(1000)
+
+    def new_id(self) -> str:
+        return str(next(self._ids))
+
+    def add(self, provider: str, container: str, name: str, content: bytes=b'') -> bool:
+        """Store a file. Returns False if something already exists with that name."""
+        files = self.containers[(provider, container)]
+        if name in files:
+            return False
+        files[name] = content
+        return True
+
+    def remove(self, provider: str, container: str, name: str) -> bool:
+        """Delete a file (or folder). Returns False if there was nothing by that name."""
+        return self.containers[(provider, container)].pop(name, None) is not None
+
+
+def _config(request) -> MockConfig:
+    return request.app['config']
+
+
+def _store(request) -> MockStore:
+    return request.app['store']
+
+
+def _base_url(request) -> str:
+    return f'{request.scheme}://{request.host}/'
+
+
+async def simulate_network(app, handler):
+    """Middleware: add latency, and fail a configurable fraction of requests"""
+    async def middleware(request):
+        config = _config(request)
+        delay = config.random.gauss(config.latency, config.jitter) if config.jitter else config.latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if config.error_rate and config.random.random() < config.error_rate:
+            headers = {'Retry-After': str(config.retry_after)} if config.retry_after is not None else {}
+            return web.Response(status=config.error_code, text='Simulated failure', headers=headers)
+
+        return await handler(request)
+    return middleware
+
+
+def _stored_name(request, provider: str, name: str) -> typing.Union[str, None]:
+    return _config(request).rules[provider].apply(name)
+
+
+#####
+# Box
+async def box_create_folder(request):
+    body = await request.json()
+    name = _stored_name(request, 'box', body['name'])
+    if name is None:
+        return web.json_response({'code': 'item_name_invalid'}, status=400)
+
+    folder_id = _store(request).new_id()
+    if not _store(request).add('box', body['parent']['id'], name):
+        return web.json_response({'code': 'item_name_in_use'}, status=409)
+    return web.json_response({'type': 'folder', 'id': folder_id, 'name': name}, status=201)
+
+
+async def box_upload(request):
+    reader = await request.multipart()
+    attributes, content = {}, b''
+    part = await reader.next()
+    while part is not None:
+        if part.name == 'attributes':
+            attributes = await part.json()
+        else:
+            content = await part.read()
+        part = await reader.next()
+
+    name = _stored_name(request, 'box', attributes.get('name', ''))
+    if name is None:
+        return web.json_response({'code': 'item_name_invalid'}, status=400)
+    if not _store(request).add('box', attributes['parent']['id'], name, content):
+        return web.json_response({'code': 'item_name_in_use'}, status=409)
+    return web.json_response({'type': 'file', 'id': _store(request).new_id(), 'name': name}, status=201)
+
+
+#####
+# Dataverse (SWORD API)
+async def dataverse_create_dataset(request):
+    doi = f'10.5072/FK2/{uuid.uuid4().hex[:6].upper()}'
+    body = f'''<?xml version="1.0"?>
+<entry xmlns="http://www.w3.org/2005/Atom">
+  <id>{_base_url(request)}dataverse/dvn/api/data-deposit/v1.1/swordv2/edit/study/doi:{doi}</id>
+  <link rel="edit-media" href="{_base_url(request)}dataverse/dvn/api/data-deposit/v1.1/swordv2/edit-media/study/doi:{doi}"/>
+</entry>'''
+    return web.Response(status=201, text=body, content_type='application/atom+xml')
+
+
+async def dataverse_deposit(request):
+    doi = request.match_info['doi']
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(await request.read()))
+    except zipfile.BadZipFile:
+        return web.Response(status=400, text='Not a zip file')
+
+    for info in archive.infolist():
+        name = _stored_name(request, 'dataverse', info.filename)
+        if name is None:
+            return web.Response(status=400, text=f'Invalid filename: {info.filename}')
+        _store(request).add('dataverse', doi, name, archive.read(info))
+    return web.Response(status=201, text='<entry xmlns="http://www.w3.org/2005/Atom"/>',
+                        content_type='application/atom+xml')
+
+
+async def dataverse_statement(request):
+    doi = request.match_info['doi']
+    media_url = f'{_base_url(request)}dataverse/dvn/api/data-deposit/v1.1/swordv2/edit-media/file'
+    entries = ''.join(
+        f'<entry><content type="text/plain" src="{media_url}/{i}/{urllib.parse.quote(name, safe="")}"/></entry>'
+        for i, name in enumerate(_store(request).containers[('dataverse', doi)], start=1)
+    )
+    body = f'<feed xmlns="http://www.w3.org/2005/Atom"><title>Dataset doi:{doi}</title>{entries}</feed>'
+    return web.Response(status=200, text=body, content_type='application/atom+xml')
+
+
+#####
+# Dropbox
+def _dropbox_split(path: str) -> typing.Tuple[str, str]:
+    parent, _, name = path.rpartition('/')
+    return parent, name
+
+
+async def dropbox_create_folder(request):
+    body = await request.json()
+    parent, name = _dropbox_split(body['path'])
+    name = _stored_name(request, 'dropbox', name)
+    if name is None:
+        return web.json_response({'error_summary': 'path/malformed_path/'}, status=409)
+    if not _store(request).add('dropbox', parent, name):
+        return web.json_response({'error_summary': 'path/conflict/folder/'}, status=409)
+    return web.json_response({'name': name, 'path_display': f'{parent}/{name}'})
+
+
+async def dropbox_upload(request):
+    arg = json.loads(request.headers['Dropbox-API-Arg'])
+    parent, name = _dropbox_split(arg['path'])
+    name = _stored_name(request, 'dropbox', name)
+    if name is None:
+        return web.json_response({'error_summary': 'path/malformed_path/'}, status=409)
+    if not _store(request).add('dropbox', parent, name, await request.read()):
+        return web.json_response({'error_summary': 'path/conflict/file/'}, status=409)
+    return web.json_response({'name': name, 'path_display': f'{parent}/{name}', 'id': f'id:{_store(request).new_id()}'})
+
+
+async def dropbox_start_session(request):
+    session_id = _store(request).new_id()
+    request.app['dropbox_sessions'][session_id] = await request.read()
+    return web.json_response({'session_id': session_id})
+
+
+async def dropbox_finish_batch(request):
+    """Commit every entry at once; as with the real API, the result must be polled for"""
+    entries = []
+    for entry in (await request.json())['entries']:
+        content = request.app['dropbox_sessions'].pop(entry['cursor']['session_id'], None)
+        parent, name = _dropbox_split(entry['commit']['path'])
+        name = _stored_name(request, 'dropbox', name)
+        if content is None:
+            entries.append({'.tag': 'failure', 'failure': {'.tag': 'lookup_failed'}})
+        elif name is None:
+            entries.append({'.tag': 'failure', 'failure': {'.tag': 'path', 'path': {'.tag': 'malformed_path'}}})
+        elif not _store(request).add('dropbox', parent, name, content):
+            entries.append({'.tag': 'failure', 'failure': {'.tag': 'path', 'path': {'.tag': 'conflict'}}})
+        else:
+            entries.append({'.tag': 'success', 'name': name, 'path_display': f'{parent}/{name}',
+                            'id': f'id:{_store(request).new_id()}'})
+
+    job_id = _store(request).new_id()
+    request.app['dropbox_jobs'][job_id] = {'.tag': 'complete', 'entries': entries}
+    return web.json_response({'.tag': 'async_job_id', 'async_job_id': job_id})
+
+
+async def dropbox_delete_batch(request):
+    """Deletes happen immediately, but (like large real batches) the result must be polled for"""
+    entries = []
+    for entry in (await request.json())['entries']:
+        parent, name = _dropbox_split(entry['path'])
+        if _store(request).remove('dropbox', parent, name):
+            entries.append({'.tag': 'success', 'metadata': {'path_display': entry['path']}})
+        else:
+            not_found = {'.tag': 'path_lookup', 'path_lookup': {'.tag': 'not_found'}}
+            entries.append({'.tag': 'failure', 'failure': not_found})
+
+    job_id = _store(request).new_id()
+    request.app['dropbox_jobs'][job_id] = {'.tag': 'complete', 'entries': entries}
+    return web.json_response({'.tag': 'async_job_id', 'async_job_id': job_id})
+
+
+async def dropbox_check_job(request):
+    job_id = (await request.json())['async_job_id']
+    result = request.app['dropbox_jobs'].get(job_id)
+    if result is None:
+        return web.json_response({'error_summary': 'invalid_async_job_id/'}, status=409)
+    return web.json_response(result)
+
+
+#####
+# Figshare (four step upload flow)
+async def figshare_create_article(request):
+    article_id = _store(request).new_id()
+    return web.json_response({'location': f'{_base_url(request)}figshare/v2/account/articles/{article_id}'},
+                             status=201)
+
+
+async def figshare_initiate_upload(request):
+    article_id = request.match_info['article_id']
+    body = await request.json()
+    name = _stored_name(request, 'figshare', body['name'])
+    if name is None:
+        return web.json_response({'message': 'Invalid file name'}, status=400)
+
+    file_id = _store(request).new_id()
+    request.app['figshare_files'][file_id] = {'article_id': article_id, 'name': name, 'size': int(body['size'])}
+    return web.json_response({'location': f'{_base_url(request)}figshare/v2/account/articles/{article_id}/files/{file_id}'},
+                             status=201)
+
+
+async def figshare_file_info(request):
+    file_id = request.match_info['file_id']
+    info = request.app['figshare_files'].get(file_id)
+    if info is None:
+        return web.json_response({'message': 'Not found'}, status=404)
+    return web.json_response({
+        'id': file_id,
+        'name': info['name'],
+        'upload_url': f'{_base_url(request)}figshare/upload/{file_id}',
+    })
+
+
+def _figshare_parts(size: int, part_size: int) -> typing.List[dict]:
+    offsets = range(0, max(size, 1), part_size)
+    return [{'partNo': i + 1, 'startOffset': start, 'endOffset': min(start + part_size, max(size, 1)) - 1}
+            for i, start in enumerate(offsets)]
+
+
+async def figshare_upload_parts(request):
+    info = request.app['figshare_files'].get(request.match_info['file_id'])
+    if info is None:
+        return web.json_response({'message': 'Not found'}, status=404)
+    return web.json_response({'parts': _figshare_parts(info['size'], _config(request).figshare_part_size)})
+
+
+async def figshare_upload_part(request):
+    """Like the real service, refuse a part whose size does not match the advertised offsets"""
+    info = request.app['figshare_files'].get(request.match_info['file_id'])
+    if info is None:
+        return web.Response(status=404, text='Not found')
+
+    parts = {p['partNo']: p for p in _figshare_parts(info['size'], _config(request).figshare_part_size)}
+    part = parts.get(int(request.match_info['part_no']))
+    data = await request.read()
+    if part is None or len(data) != part['endOffset'] - part['startOffset'] + 1:
+        return web.Response(status=400, text='Part size mismatch')
+
+    info.setdefault('parts', {})[part['partNo']] = data
+    return web.Response(text='OK')
+
+
+async def figshare_complete_upload(request):
+    info = request.app['figshare_files'].get(request.match_info['file_id'])
+    if info is None:
+        return web.json_response({'message': 'Not found'}, status=404)
+    content = b''.join(data for _, data in sorted(info.get('parts', {}).items()))
+    _store(request).add('figshare', info['article_id'], info['name'], content)
+    return web.Response(status=202, text='<xml>Accepted</xml>')
+
+
+#####
+# Github (contents API)
+async def github_put_contents(request):
+    path = request.match_info['path']
+    parent, _, name = path.rpartition('/')
+    name = _stored_name(request, 'github', name)
+    if name is None:
+        return web.json_response({'message': 'path contains a malformed path component'}, status=422)
+
+    body = await request.json()
+    if not _store(request).add('github', parent, name, body.get('content', '').encode('utf-8')):
+        return web.json_response({'message': 'Invalid request.\n\n"sha" wasn\'t supplied.'}, status=422)
+
+    stored_path = f'{parent}/{name}' if parent else name
+    # The branch has moved on; the next Git Data API request sees a fresh snapshot
+    request.app['github_git']['head'] = None
+    return web.json_response({'content': {'name': name, 'path': stored_path, 'sha': uuid.uuid4().hex}}, status=201)
+
+
+# Github (Git Data API). Commits are snapshots of the mock store, and updating the branch writes trees back to it.
+def _github_object(request, obj: dict) -> str:
+    sha = hashlib.sha1(json.dumps(obj, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+    request.app['github_git']['objects'][sha] = obj
+    return sha
+
+
+def _github_snapshot_tree(request, path: str) -> str:
+    """Build tree objects for everything stored at (and below) `path`"""
+    entries = {}
+    for (provider, container), files in list(_store(request).containers.items()):
+        if provider != 'github':
+            continue
+        if container == path:
+            for name, content in files.items():
+                entries[name] = {'mode': '100644', 'type': 'blob', 'sha': _github_object(request, {'blob': content})}
+        elif container and container.rpartition('/')[0] == path:
+            name = container.rpartition('/')[2]
+            entries[name] = {'mode': '040000', 'type': 'tree', 'sha': _github_snapshot_tree(request, container)}
+    return _github_object(request, {'tree': entries})
+
+
+def _github_tree_json(request, sha: str) -> dict:
+    entries = request.app['github_git']['objects'][sha]['tree']
+    return {'sha': sha, 'tree': [dict(entry, path=name) for name, entry in sorted(entries.items())]}
+
+
+def _github_write_back(request, tree_sha: str, path: str='') -> None:
+    objects = request.app['github_git']['objects']
+    for name, entry in objects[tree_sha]['tree'].items():
+        child = f'{path}/{name}' if path else name
+        if entry['type'] == 'tree':
+            _github_write_back(request, entry['sha'], child)
+        else:
+            _store(request).add('github', path, name, objects[entry['sha']].get('blob', b''))
+
+
+async def github_get_ref(request):
+    git = request.app['github_git']
+    if git['head'] is None:
+        git['head'] = _github_object(request, {'commit': _github_snapshot_tree(request, ''), 'parents': []})
+    return web.json_response({'ref': f'refs/heads/{request.match_info["branch"]}',
+                              'object': {'type': 'commit', 'sha': git['head']}})
+
+
+async def github_update_ref(request):
+    git = request.app['github_git']
+    body = await request.json()
+    commit = git['objects'].get(body['sha'])
+    if commit is None or 'commit' not in commit:
+        return web.json_response({'message': 'Object does not exist'}, status=422)
+    if git['head'] is not None and git['head'] not in commit['parents']:
+        return web.json_response({'message': 'Update is not a fast forward'}, status=422)
+
+    _github_write_back(request, commit['commit'])
+    git['head'] = body['sha']
+    return web.json_response({'ref': f'refs/heads/{request.match_info["branch"]}',
+                              'object': {'type': 'commit', 'sha': git['head']}})
+
+
+async def github_get_commit(request):
+    commit = request.app['github_git']['objects'].get(request.match_info['sha'])
+    if commit is None or 'commit' not in commit:
+        return web.json_response({'message': 'Not Found'}, status=404)
+    return web.json_response({'sha': request.match_info['sha'], 'tree': {'sha': commit['commit']}})
+
+
+async def github_create_commit(request):
+    body = await request.json()
+    sha = _github_object(request, {'commit': body['tree'], 'parents': body['parents'], 'message': body['message']})
+    return web.json_response({'sha': sha, 'tree': {'sha': body['tree']}}, status=201)
+
+
+async def github_create_blob(request):
+    body = await request.json()
+    return web.json_response({'sha': _github_object(request, {'blob': body['content'].encode('utf-8')})}, status=201)
+
+
+async def github_get_tree(request):
+    obj = request.app['github_git']['objects'].get(request.match_info['sha'])
+    if obj is None or 'tree' not in obj:
+        return web.json_response({'message': 'Not Found'}, status=404)
+    return web.json_response(_github_tree_json(request, request.match_info['sha']))
+
+
+async def github_create_tree(request):
+    body = await request.json()
+    objects = request.app['github_git']['objects']
+    entries = dict(objects[body['base_tree']]['tree']) if body.get('base_tree') else {}
+    for entry in body['tree']:
+        name = _stored_name(request, 'github', entry['path'])
+        # Like the real API, one bad path fails the whole tree
+        if name is None or '/' in name:
+            return web.json_response({'message': 'GitRPC::BadObjectState'}, status=422)
+        entries[name] = {'mode': entry['mode'], 'type': entry['type'], 'sha': entry['sha']}
+    return web.json_response(_github_tree_json(request, _github_object(request, {'tree': entries})), status=201)
+
+
+#####
+# Google Drive
+def _googledrive_create(request, metadata: dict, content: bytes=b'') -> typing.Tuple[int, dict]:
+    name = _stored_name(request, 'googledrive', metadata['title'])
+    if name is None:
+        return 400, {'error': {'code': 400}}
+    # Drive allows duplicate names, and identifies everything by ID
+    file_id = _store(request).new_id()
+    _store(request).add('googledrive', metadata['parents'][0]['id'], file_id, content)
+    return 200, {'id': file_id, 'title': name}
+
+
+def _googledrive_delete(request, file_id: str) -> typing.Tuple[int, dict]:
+    for (provider, container), files in _store(request).containers.items():
+        if provider == 'googledrive' and file_id in files:
+            del files[file_id]
+            return 204, None
+    return 404, {'error': {'code': 404, 'message': f'File not found: {file_id}'}}
+
+
+async def googledrive_create_folder(request):
+    code, payload = _googledrive_create(request, await request.json())
+    return web.json_response(payload, status=code)
+
+
+async def googledrive_upload(request):
+    reader = await request.multipart()
+    metadata = await (await reader.next()).json()
+    content_part = await reader.next()
+    content = await content_part.read() if content_part is not None else b''
+
+    code, payload = _googledrive_create(request, metadata, content)
+    return web.json_response(payload, status=code)
+
+
+async def googledrive_batch(request):
+    """Answer each part of a multipart/mixed batch as if it had been sent on its own"""
+    header = f'Content-Type: {request.headers["Content-Type"]}\r\n\r\n'.encode('utf-8')
+    message = email.message_from_bytes(header + await request.read())
+
+    boundary = uuid.uuid4().hex
+    parts = []
+    for part in message.get_payload():
+        request_line, _, rest = part.get_payload(decode=True).partition(b'\n')
+        method, path = request_line.decode('utf-8').split()[:2]
+        sub_body = re.split(rb'\r?\n\r?\n', rest, maxsplit=1)[-1] if rest.strip() else b''
+
+        if method == 'POST' and path == '/drive/v2/files':
+            code, payload = _googledrive_create(request, json.loads(sub_body.decode('utf-8')))
+        elif method == 'DELETE' and path.startswith('/drive/v2/files/'):
+            code, payload = _googledrive_delete(request, path.rsplit('/', 1)[-1])
+        else:
+            code, payload = 400, {'error': {'code': 400, 'message': 'Unsupported batch request'}}
+
+        content_id = part.get('Content-ID', '').strip('<>')
+        body = json.dumps(payload) if payload is not None else ''
+        parts.append(f'--{boundary}\r\n'
+                     f'Content-Type: application/http\r\n'
+                     f'Content-ID: <response-{content_id}>\r\n\r\n'
+                     f'HTTP/1.1 {code} {http.HTTPStatus(code).phrase}\r\n'
+                     f'Content-Type: application/json\r\n\r\n'
+                     f'{body}\r\n')
+    return web.Response(status=200, text=''.join(parts) + f'--{boundary}--\r\n',
+                        headers={'Content-Type': f'multipart/mixed; boundary={boundary}'})
+
+
+#####
+# Owncloud (WebDAV)
+async def owncloud_mkcol(request):
+    parent, _, name = request.match_info['path'].rstrip('/').rpartition('/')
+    name = _stored_name(request, 'owncloud', name)
+    if name is None:
+        return web.Response(status=400)
+    if not _store(request).add('owncloud', parent, name):
+        return web.Response(status=405)
+    return web.Response(status=201)
+
+
+async def owncloud_put(request):
+    parent, _, name = request.match_info['path'].rpartition('/')
+    name = _stored_name(request, 'owncloud', name)
+    if name is None:
+        return web.Response(status=400)
+    created = _store(request).add('owncloud', parent, name, await request.read())
+    return web.Response(status=201 if created else 204)
+
+
+async def owncloud_propfind(request):
+    folder = request.match_info['path'].rstrip('/')
+    parent, _, name = folder.rpartition('/')
+    if name not in _store(request).containers[('owncloud', parent)]:
+        return web.Response(status=404)
+
+    folder_href = request.path.rstrip('/') + '/'
+    hrefs = [folder_href] + [folder_href + urllib.parse.quote(child)
+                             for child in _store(request).containers[('owncloud', folder)]]
+    responses = ''.join(f'<d:response><d:href>{saxutils.escape(href)}</d:href></d:response>' for href in hrefs)
+    body = f'<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">{responses}</d:multistatus>'
+    return web.Response(status=207, text=body, content_type='application/xml')
+
+
+#####
+# S3 (path-style presigned URLs; signatures are not checked)
+async def s3_put_object(request):
+    bucket = request.match_info['bucket']
+    name = _stored_name(request, 's3', request.match_info['key'])
+    if name is None:
+        return web.Response(status=400, text='<Error><Code>InvalidArgument</Code></Error>')
+    # S3 silently overwrites
+    _store(request).containers[('s3', bucket)][name] = await request.read()
+    return web.Response(status=200, headers={'ETag': f'"{uuid.uuid4().hex}"'})
+
+
+async def s3_head_object(request):
+    files = _store(request).containers[('s3', request.match_info['bucket'])]
+    key = request.match_info['key']
+    if key not in files:
+        return web.Response(status=404)
+    return web.Response(status=200, headers={'Content-Length': str(len(files[key]))})
+
+
+async def s3_delete_object(request):
+    # S3 reports success whether or not the key existed
+    _store(request).remove('s3', request.match_info['bucket'], request.match_info['key'])
+    return web.Response(status=204)
+
+
+async def s3_delete_objects(request):
+    if 'delete' not in request.query:
+        return web.Response(status=400, text='<Error><Code>InvalidRequest</Code></Error>')
+
+    ns = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+    body = ElementTree.fromstring(await request.read())
+    # Clients may or may not use the S3 namespace in the request body
+    keys = [el.text or '' for el in body.iter() if el.tag in ('Key', f'{ns}Key')]
+    for key in keys:
+        _store(request).remove('s3', request.match_info['bucket'], key)
+    # Quiet mode: only errors are listed, and there are none
+    return web.Response(status=200, content_type='application/xml',
+                        text='<DeleteResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"></DeleteResult>')
+
+
+async def s3_list_objects(request):
+    bucket = request.match_info['bucket']
+    prefix = request.query.get('prefix', '')
+    marker = request.query.get('marker', '')
+    max_keys = int(request.query.get('max-keys', 1000))
+    encode = (lambda key: urllib.parse.quote_plus(key, safe='/')) if request.query.get('encoding-type') == 'url' \
+        else saxutils.escape
+
+    keys = sorted(key for key in _store(request).containers[('s3', bucket)] if key.startswith(prefix) and key > marker)
+    page = keys[:max_keys]
+    contents = ''.join(f'<Contents><Key>{encode(key)}</Key></Contents>' for key in page)
+    body = f'''<?xml version="1.0" encoding="UTF-8"?>
+<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">
+  <Name>{bucket}</Name><Prefix>{encode(prefix)}</Prefix><MaxKeys>{max_keys}</MaxKeys>
+  <IsTruncated>{'true' if len(keys) > max_keys else 'false'}</IsTruncated>{contents}
+</ListBucketResult>'''
+    return web.Response(status=200, text=body, content_type='application/xml')
+
+
+#####
+# Waterbutler
+async def waterbutler_put(request):
+    provider = request.match_info['provider']
+    parent = '/' + request.match_info['path']
+    kind = request.query.get('kind', 'file')
+    name = _stored_name(request, 'waterbutler', request.query.get('name', ''))
+    if name is None:
+        return web.json_response({'code': 400, 'message': 'Invalid name'}, status=400)
+
+    if kind == 'folder':
+        if not _store(request).add(f'waterbutler:{provider}', parent, name):
+            return web.json_response({'code': 409, 'message': 'Folder exists'}, status=409)
+        path = f'{parent}{name}/'
+    else:
+        if not _store(request).add(f'waterbutler:{provider}', parent, name, await request.read()):
+            return web.json_response({'code': 409, 'message': 'File exists'}, status=409)
+        path = f'{parent}{name}'
+
+    return web.json_response({'data': {'attributes': {'name': name, 'path': path, 'kind': kind}}}, status=201)
+
+
+def make_app(config: MockConfig=None) -> web.Application:
+    """Build a web app that serves every mock provider"""
+    app = web.Application(middlewares=[simulate_network])
+    app['config'] = config or MockConfig()
+    app['store'] = MockStore()
+    app['figshare_files'] = {}
+    app['dropbox_jobs'] = {}
+    app['dropbox_sessions'] = {}
+    app['github_git'] = {'objects': {}, 'head': None}
+
+    router = app.router
+    router.add_route('POST', '/box/2.0/folders', box_create_folder)
+    router.add_route('POST', '/box/api/2.0/files/content', box_upload)
+
+    router.add_route('POST', '/dataverse/dvn/api/data-deposit/v1.1/swordv2/collection/dataverse/{alias}',
+                     dataverse_create_dataset)
+    router.add_route('POST', '/dataverse/dvn/api/data-deposit/v1.1/swordv2/edit-media/study/doi:{doi:.+}',
+                     dataverse_deposit)
+    router.add_route('GET', '/dataverse/dvn/api/data-deposit/v1.1/swordv2/statement/study/doi:{doi:.+}',
+                     dataverse_statement)
+
+    router.add_route('POST', '/dropbox/2/files/create_folder', dropbox_create_folder)
+    router.add_route('POST', '/dropbox/2/files/upload', dropbox_upload)
+    router.add_route('POST', '/dropbox/2/files/upload_session/start', dropbox_start_session)
+    router.add_route('POST', '/dropbox/2/files/upload_session/finish_batch', dropbox_finish_batch)
+    router.add_route('POST', '/dropbox/2/files/upload_session/finish_batch/check', dropbox_check_job)
+    router.add_route('POST', '/dropbox/2/files/delete_batch', dropbox_delete_batch)
+    router.add_route('POST', '/dropbox/2/files/delete_batch/check', dropbox_check_job)
+
+    router.add_route('POST', '/figshare/v2/account/articles', figshare_create_article)
+    router.add_route('POST', '/figshare/v2/account/articles/{article_id}/files', figshare_initiate_upload)
+    router.add_route('GET', '/figshare/v2/account/articles/{article_id}/files/{file_id}', figshare_file_info)
+    router.add_route('POST', '/figshare/v2/account/articles/{article_id}/files/{file_id}', figshare_complete_upload)
+    router.add_route('GET', '/figshare/upload/{file_id}', figshare_upload_parts)
+    router.add_route('PUT', '/figshare/upload/{file_id}/{part_no}', figshare_upload_part)
+
+    router.add_route('PUT', '/github/repos/{owner}/{repo}/contents/{path:.+}', github_put_contents)
+    router.add_route('GET', '/github/repos/{owner}/{repo}/git/refs/heads/{branch}', github_get_ref)
+    router.add_route('PATCH', '/github/repos/{owner}/{repo}/git/refs/heads/{branch}', github_update_ref)
+    router.add_route('GET', '/github/repos/{owner}/{repo}/git/commits/{sha}', github_get_commit)
+    router.add_route('POST', '/github/repos/{owner}/{repo}/git/commits', github_create_commit)
+    router.add_route('POST', '/github/repos/{owner}/{repo}/git/blobs', github_create_blob)
+    router.add_route('GET', '/github/repos/{owner}/{repo}/git/trees/{sha}', github_get_tree)
+    router.add_route('POST', '/github/repos/{owner}/{repo}/git/trees', github_create_tree)
+
+    router.add_route('POST', '/googledrive/drive/v2/files', googledrive_create_folder)
+    router.add_route('POST', '/googledrive/upload/drive/v2/files', googledrive_upload)
+    router.add_route('POST', '/googledrive/batch/drive/v2', googledrive_batch)
+
+    router.add_route('MKCOL', '/owncloud/{prefix:.*}remote.php/webdav/{path:.+}', owncloud_mkcol)
+    router.add_route('PUT', '/owncloud/{prefix:.*}remote.php/webdav/{path:.+}', owncloud_put)
+    router.add_route('PROPFIND', '/owncloud/{prefix:.*}remote.php/webdav/{path:.+}', owncloud_propfind)
+
+    router.add_route('PUT', '/waterbutler/v1/resources/{node}/providers/{provider}/{path:.*}', waterbutler_put)
+
+    router.add_route('PUT', '/s3/{bucket}/{key:.+}', s3_put_object)
+    router.add_route('HEAD', '/s3/{bucket}/{key:.+}', s3_head_object)
+    router.add_route('DELETE', '/s3/{bucket}/{key:.+}', s3_delete_object)
+    router.add_route('POST', '/s3/{bucket}/', s3_delete_objects)
+    router.add_route('GET', '/s3/{bucket}/', s3_list_objects)
+    router.add_route('GET', '/s3/{bucket}', s3_list_objects)
+    return app
+
+
+class MockServer:
+    """Run the mock providers on the current event loop"""
+    def __init__(self, config: MockConfig=None, *, host: str='localhost', port: int=8765):
+        self.app = make_app(config)
+        self.host = host
+        self.port = port
+        self._handler = None
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}/'
+
+    @property
+    def store(self) -> MockStore:
+        return self.app['store']
+
+    async def start(self) -> None:
+        loop = asyncio.get_event_loop()
+        self._handler = self.app.make_handler()
+        self._server = await loop.create_server(self._handler, self.host, self.port)
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+        await self.app.shutdown()
+        await self._handler.shutdown(1.0)
+        await self.app.cleanup()
@@ -1,10 +1,45 @@
-from .base import BaseProvider, OauthBaseProvider
-from .box import BoxProvider
-from .dataverse import DataverseProvider
-from .dropbox import DropboxProvider
-from .figshare import FigshareProvider
-from .github import GithubProvider
-from .googledrive import GoogleDriveProvider
-from .owncloud import OwncloudProvider
-from .s3 import S3Provider
-from .waterbutler import WBProvider
+from .base import BaseProvider, OauthBaseProvider, mock_url
+from .registry import ProviderRegistry
+
+# Intentionally exclude certain WB services: Rackspace cloudfiles, filesystem (used internally only),
+# MattF can provide owncloud credentials. For s3 testing, use your own amazon account. For local FigShare, use https,
+# or generate a personal token for oauth.
+# Provider modules (which read their settings when imported) are only imported once that provider is used.
+KNOWN_PROVIDERS = ProviderRegistry({
+    'box': '.box:BoxProvider',
+    'dataverse': '.dataverse:DataverseProvider',
+    'dropbox': '.dropbox:DropboxProvider',
+    'figshare': '.figshare:FigshareProvider',
+    'github': '.github:GithubProvider',
+    'googledrive': '.googledrive:GoogleDriveProvider',
+    'osfstorage': '.waterbutler:WBProvider',
+    'owncloud': '.owncloud:OwncloudProvider',
+    's3': '.s3:S3Provider'
+}, package=__name__)
+
+
+def get_provider_class(name: str, *, use_wb: bool=False) -> type:
+    """Import the class for a provider, or for talking to it through Waterbutler"""
+    if use_wb:
+        return KNOWN_PROVIDERS['osfstorage']
+    return KNOWN_PROVIDERS[name]
+
+
+_CLASS_NAMES = {
+    'BoxProvider': 'box',
+    'DataverseProvider': 'dataverse',
+    'DropboxProvider': 'dropbox',
+    'FigshareProvider': 'figshare',
+    'GithubProvider': 'github',
+    'GoogleDriveProvider': 'googledrive',
+    'OwncloudProvider': 'owncloud',
+    'S3Provider': 's3',
+    'WBProvider': 'osfstorage',
+}
+
+
+def __getattr__(name: str):
+    """Keep `providers.BoxProvider` (etc) working, without importing every provider up front (Python >= 3.7)"""
+    if name in _CLASS_NAMES:
+        return KNOWN_PROVIDERS[_CLASS_NAMES[name]]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
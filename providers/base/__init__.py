@@ -1,9 +1,89 @@
 """Base provider declaring common shared behavior"""
 import abc
+import asyncio
+import time
 import typing
+import urllib.parse
 
 import aiohttp
 
+from . import retry
+from .retry import CircuitBreaker, RetryPolicy
+from .throttle import AdaptiveThrottle
+from .tracing import RequestTracer
+import settings
+from util import metrics
+
+
+def mock_url(provider_name: str, real_url: typing.Union[str, None]) -> typing.Union[str, None]:
+    """
+    Return the URL to use for a provider API. If `settings.MOCK_HOST` is defined, requests go to the local mock
+      server instead, eg `https://api.dropboxapi.com/2/files/` -> `http://localhost:8765/dropbox/2/files/`
+    """
+    mock_host = getattr(settings, 'MOCK_HOST', None)
+    if not mock_host:
+        return real_url
+
+    path = urllib.parse.urlsplit(real_url or '/').path
+    return urllib.parse.urljoin(mock_host, provider_name + path)
+
+
+def _replayable(data) -> bool:
+    """Whether a request body can be sent again. Streamed bodies (eg Dataverse's zip deposits) can only be sent once."""
+    return data is None or isinstance(data, (str, bytes, bytearray, dict, aiohttp.MultipartWriter))
+
+
+class NetworkErrorResponse:
+    """Stands in for the response to a request that never got one, so that callers can handle it like any failure"""
+    def __init__(self, exc: Exception):
+        self.status = retry.NETWORK_ERROR_CODE
+        self.reason = f'{type(exc).__name__}: {exc}'
+        self.headers = {}
+        # If no connection could be made, the request was never sent. Otherwise, the server may have acted on it.
+        self.sent = not isinstance(exc, aiohttp.ClientConnectorError)
+
+    async def text(self) -> str:
+        return self.reason
+
+    async def read(self) -> bytes:
+        return self.reason.encode('utf-8')
+
+    async def json(self) -> dict:
+        return {}
+
+
+class PoolingConnector(aiohttp.TCPConnector):
+    """
+    A TCP connector that counts how many new connections it opens, so that reuse of pooled connections is visible.
+    If a tracer is provided, it also reports time spent on DNS lookups and connection setup.
+    """
+    def __init__(self, *args, tracer: RequestTracer=None, **kwargs):
+        super(PoolingConnector, self).__init__(*args, **kwargs)
+        self.connections_created: int = 0
+        self.tracer = tracer
+
+    async def _resolve_host(self, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            return await super(PoolingConnector, self)._resolve_host(*args, **kwargs)
+        finally:
+            if self.tracer is not None:
+                self.tracer.add_phase('dns', time.monotonic() - start)
+
+    async def _create_connection(self, *args, **kwargs):
+        self.connections_created += 1
+        if self.tracer is None:
+            return await super(PoolingConnector, self)._create_connection(*args, **kwargs)
+
+        start = time.monotonic()
+        dns_before = self.tracer.get_phase('dns')
+        try:
+            return await super(PoolingConnector, self)._create_connection(*args, **kwargs)
+        finally:
+            # Connection setup includes the DNS lookup, which is reported separately
+            dns = self.tracer.get_phase('dns') - dns_before
+            self.tracer.add_phase('connect', time.monotonic() - start - dns)
+
 
 class BaseProvider(abc.ABC):
     # Base url for api requests
@@ -14,10 +94,48 @@ class BaseProvider(abc.ABC):
     # Default provider name (though we prefer users to pass it in separately)
     NAME = None
 
+    # How requests reach the storage provider: 'direct', or via an intermediary like Waterbutler
+    TRANSPORT: str = 'direct'
+    # Bump this when a provider implementation changes in a way that could affect results. Cached results from other
+    #   versions are ignored.
+    VERSION_TAG: str = '1'
+
     # Whether the provider allows subfolders below the top level. Some, like Figshare, organize things differently.
     ALLOWS_SUBFOLDERS: bool = True
 
-    def __init__(self, *args, provider_name: str=None, **kwargs):
+    # Connection pool settings for the long-lived HTTP session owned by each provider instance
+    CONNECTION_LIMIT: int = 100
+    CONNECTION_LIMIT_PER_HOST: int = 10
+    KEEPALIVE_TIMEOUT: float = 30
+
+    # Providers that can upload many files in one request set this to the largest batch to send (see `upload_files`)
+    BATCH_SIZE: typing.Union[int, None] = None
+    # Likewise, providers that can create many folders in one request set this (see `create_folders`)
+    FOLDER_BATCH_SIZE: typing.Union[int, None] = None
+
+    # Providers whose upload responses don't reveal the stored filename set this, so that names can be checked
+    #   afterwards with a single listing of the test folder (see `common.verify`). They must then also implement
+    #   `async def list_folder(self) -> (names, code)`: list the names of everything stored directly inside
+    #   `parent_folder`, following pagination if needed; names is None if the listing failed.
+    VERIFY_BY_LISTING: bool = False
+
+    # Whether deleting a folder also deletes everything inside it (so contents need no delete requests of their own)
+    RECURSIVE_DELETE: bool = True
+    # How many delete requests to send at once, for providers without a batch delete API (see `delete_resources`)
+    MAX_CONCURRENT_DELETES: int = 10
+
+    # Upper bound on request rate. The throttle adapts below this, based on the rate limit signals a provider sends.
+    MAX_REQUESTS_PER_SECOND: float = 10.0
+
+    # How to retry failed requests. Specific steps (or whole operations, eg `upload_file`) can have their own policy.
+    #   By default, requests that aren't idempotent (eg POST) are only retried if they never reached the server.
+    RETRY_POLICY: RetryPolicy = RetryPolicy()
+    RETRY_POLICIES: typing.Dict[str, RetryPolicy] = {}
+    # After this many server or network errors in a row, pause all requests to the provider for a while
+    BREAKER_THRESHOLD: int = 5
+    BREAKER_COOLDOWN: float = 30.0
+
+    def __init__(self, *args, provider_name: str=None, delay: typing.Union[float, None]=None, **kwargs):
         self.provider_name: str = provider_name or self.NAME
         self.token: str = None
         self.auth_headers: dict = {}  # TODO: Move to child class
@@ -25,6 +143,59 @@ class BaseProvider(abc.ABC):
         # Optionally, run *all* file operations within a specific folder (deliberately not general)
         self.parent_folder: str = None
 
+        # Pooled HTTP session, opened by `authorize` and shared by every request this provider makes
+        self.session: aiohttp.ClientSession = None
+        self.requests_made: int = 0
+
+        self.throttle = AdaptiveThrottle(delay=delay, max_rate=self.MAX_REQUESTS_PER_SECOND)
+        self.tracer = RequestTracer(self.provider_name)
+        self.attempts = retry.AttemptTracker()
+        self.breaker = CircuitBreaker(threshold=self.BREAKER_THRESHOLD, cooldown=self.BREAKER_COOLDOWN)
+
+        # If set (to a `common.manifest.Manifest`), every resource this provider creates is recorded for later cleanup
+        self.manifest = None
+
+    def record_created(self, kind: str, resource_id: str, **extra) -> None:
+        """Record a newly created resource (eg 'folder' or 'file'), with the id needed to delete it later"""
+        if self.manifest is None or resource_id is None:
+            return
+        self.manifest.record(provider=self.provider_name, transport=self.TRANSPORT, kind=kind,
+                             resource_id=resource_id, parent=self.parent_folder, **extra)
+
+    async def open_session(self) -> aiohttp.ClientSession:
+        """Open a keep-alive session with DNS caching, so that repeat requests skip DNS, TCP and TLS setup"""
+        if self.session is None or self.session.closed:
+            connector = PoolingConnector(limit=self.CONNECTION_LIMIT,
+                                         limit_per_host=self.CONNECTION_LIMIT_PER_HOST,
+                                         keepalive_timeout=self.KEEPALIVE_TIMEOUT,
+                                         use_dns_cache=True,
+                                         tracer=self.tracer)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def close(self) -> None:
+        """Close the pooled session (if any) and report how well connections were reused"""
+        self.tracer.close()
+        if self.session is None:
+            return
+        stats = self.connection_stats()
+        print(f'Connection stats for {self.provider_name}: {stats["requests"]} requests over '
+              f'{stats["connections_created"]} connections ({stats["connections_reused"]} reused)')
+        self.session.close()
+        self.session = None
+
+    def connection_stats(self) -> dict:
+        """Count requests made vs new connections opened. Every reused connection is a handshake we didn't pay for."""
+        created = self.session.connector.connections_created if self.session is not None else 0
+        return {
+            'requests': self.requests_made,
+            'connections_created': created,
+            'connections_reused': max(self.requests_made - created, 0),
+        }
+
+    def retry_policy(self, operation: str=None, step: str=None) -> RetryPolicy:
+        return self.RETRY_POLICIES.get(step) or self.RETRY_POLICIES.get(operation) or self.RETRY_POLICY
+
     async def _make_request(self,
                             method,
                             url, *,
@@ -32,21 +203,89 @@ class BaseProvider(abc.ABC):
                             data=None,
                             headers: dict=None,
                             params: dict = None,
+                            operation: str=None,
+                            step: str=None,
+                            attempts: retry.AttemptScope=None,
                             **kwargs) -> typing.Tuple[aiohttp.client.ClientResponse, int]:
-
+        """
+        Make a request using the pooled session, retrying according to the retry policy for this step (see
+          `retry_policy`). `operation` and `step` tag the request for latency tracing; the operation defaults to
+          whatever the caller declared via `self.tracer.operation(...)`. Likewise, retries are counted in `attempts`,
+          which defaults to the current task's scope (see `self.attempts`).
+        If no response is received at all, the result is a `NetworkErrorResponse` with code 599.
+        """
         headers = headers or {}
         headers.update(self.auth_headers)  # TODO: Move to child class
 
-        async with aiohttp.request(method, url, auth=auth, data=data, headers=headers, params=params, **kwargs) as resp:
-            code = resp.status
+        operation = operation or self.tracer.current_operation()
+        policy = self.retry_policy(operation, step) if _replayable(data) else retry.NO_RETRY
+        if attempts is None:
+            attempts = self.attempts.current()
+
+        attempt = 1
+        while True:
+            resp, code = await self._attempt_request(method, url, auth=auth, data=data, headers=headers,
+                                                     params=params, operation=operation, step=step, **kwargs)
+            if not policy.should_retry(code, attempt, method=method, sent=getattr(resp, 'sent', True)) \
+                    or not await self._is_transient(resp, code):
+                return resp, code
+
+            delay = policy.backoff(attempt)
+            print(f'Retrying {method} request for {self.provider_name} (code {code}, attempt {attempt}) in '
+                  f'{delay:.2f}s')
+            attempts.record_retry()
+            metrics.RETRIES.inc(provider=self.provider_name, operation=operation, step=step or operation)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _attempt_request(self, method, url, *, operation: str=None, step: str=None, **kwargs) \
+            -> typing.Tuple[typing.Union[aiohttp.client.ClientResponse, NetworkErrorResponse], int]:
+        """Send a request once, when the circuit breaker and throttle allow"""
+        session = await self.open_session()
+        probe = await self.breaker.wait()
+        await self.throttle.wait()
+        url = self._attempt_url(method, url)
+        self.requests_made += 1
+
+        trace = self.tracer.start(method, url, operation=operation, step=step)
+        code = None
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                self.tracer.first_byte(trace)
+                code = resp.status
+                self.throttle.observe(resp, code)
 
+                print('Sending request to', url, '\n')
+                print('Response status:', code, resp.reason, '\n')
+                print('Response headers: ', resp.headers, '\n')
+                print('Response body: ', await resp.text(), '\n\n\n')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            resp = NetworkErrorResponse(e)
+            code = resp.status
             print('Sending request to', url, '\n')
-            print('Response status:', code, resp.reason, '\n')
-            print('Response headers: ', resp.headers, '\n')
-            print('Response body: ', await resp.text(), '\n\n\n')
+            print('No response:', resp.reason, '\n\n\n')
+        finally:
+            self.tracer.finish(trace, code)
+            self.breaker.record(code is None or code >= 500, probe=probe, name=self.provider_name)
 
         return resp, code
 
+    def _attempt_url(self, method: str, url):
+        """
+        The URL to send one attempt of a request to. This is called right before each attempt is sent (after any
+          throttle, circuit breaker or retry wait), so providers whose URLs expire (eg presigned URLs) can build them
+          here.
+        """
+        return url
+
+    async def _is_transient(self, resp: typing.Union[aiohttp.client.ClientResponse, NetworkErrorResponse],
+                            code: int) -> bool:
+        """
+        Whether a failure that the retry policy would retry might succeed if sent again. Providers that report
+          permanent errors with the same code as transient ones should override this to tell them apart.
+        """
+        return True
+
     async def make_request_get_json(self, *args, **kwargs) \
             -> typing.Tuple[typing.Union[aiohttp.client.ClientResponse, dict], int]:
         """
@@ -61,17 +300,69 @@ class BaseProvider(abc.ABC):
 
     @abc.abstractmethod
     async def authorize(self, *args, **kwargs) -> None:
-        pass
+        """Prepare credentials for future requests. Implementations must call super() to open the pooled session."""
+        await self.open_session()
 
     @abc.abstractmethod
     async def create_folder(self, foldername: str) -> typing.Tuple[str, int]:
         pass
 
+    async def create_folders(self, foldernames: typing.List[str]) -> typing.List[typing.Tuple[typing.Any, int]]:
+        """
+        Create several folders, returning one (folder id, code) pair per name, in order.
+        Providers with a batch API should override this (and set `FOLDER_BATCH_SIZE`); by default, folders are created
+          one at a time.
+        """
+        return [await self.create_folder(foldername) for foldername in foldernames]
+
     @abc.abstractmethod
     async def upload_file(self, filename: str, content) \
             -> typing.Tuple[typing.Union[dict, aiohttp.client.ClientResponse], int]:
         pass
 
+    async def upload_files(self, filenames: typing.List[str], content) \
+            -> typing.List[typing.Tuple[typing.Union[dict, aiohttp.client.ClientResponse, None], int]]:
+        """
+        Upload several files with the same content, returning one (payload, code) pair per filename, in order.
+        Providers with a bulk upload API should override this (and set `BATCH_SIZE`); by default, files are uploaded
+          one at a time.
+        """
+        return [await self.upload_file(filename, content) for filename in filenames]
+
+    async def _split_batch(self, filenames: typing.List[str], content) \
+            -> typing.List[typing.Tuple[typing.Union[dict, aiohttp.client.ClientResponse, None], int]]:
+        """
+        For providers whose batches succeed or fail as a whole: upload each half of a rejected batch separately, to
+          find out which filenames were to blame. Sending a half again counts as another attempt for its filenames.
+        """
+        half = len(filenames) // 2
+        scope = self.attempts.current()
+        results = []
+        for part in (filenames[:half], filenames[half:]):
+            scope.record_retry(part)
+            with self.attempts.only_for(part):
+                results.extend(await self.upload_files(part, content))
+        return results
+
+    @abc.abstractmethod
+    async def delete_resource(self, resource: dict) -> int:
+        """Delete one resource recorded in a manifest. Returns the status code."""
+        pass
+
+    async def delete_resources(self, resources: typing.List[dict]) -> typing.List[int]:
+        """
+        Delete several resources recorded in a manifest, returning one status code per resource, in order.
+        Providers with a batch delete API should override this; by default, resources are deleted individually, up to
+          `MAX_CONCURRENT_DELETES` at a time.
+        """
+        slots = asyncio.Semaphore(self.MAX_CONCURRENT_DELETES)
+
+        async def delete(resource):
+            async with slots:
+                return await self.delete_resource(resource)
+
+        return await asyncio.gather(*[delete(resource) for resource in resources])
+
     @abc.abstractstaticmethod
     def extract_uploaded_filename(payload: dict=None):
         """Given the JSON payload from an upload response, extract the uploaded filename (if possible)"""
@@ -81,7 +372,7 @@ class BaseProvider(abc.ABC):
 class NoAuthProvider(BaseProvider, abc.ABC):
     """Provider that does not perform any global authorization (implementation must handle on each request)"""
     async def authorize(self, *args, **kwargs):
-        pass
+        await super(NoAuthProvider, self).authorize(*args, **kwargs)
 
 
 class OauthBaseProvider(BaseProvider, abc.ABC):
@@ -93,6 +384,7 @@ class OauthBaseProvider(BaseProvider, abc.ABC):
 
     async def authorize(self, *args, token: str=None, **kwargs):
         """Set authorization headers, optionally using default credentials if none are explicitly passed"""
+        await super(OauthBaseProvider, self).authorize(*args, **kwargs)
         self.token = token or self.DEFAULT_CREDENTIAL
         self.auth_headers = {
             'Authorization': 'Bearer {}'.format(self.token),
@@ -111,6 +403,7 @@ class BasicAuthProvider(BaseProvider, abc.ABC):
         self._auth = None
 
     async def authorize(self, *args, username: str=None, password: str=None, **kwargs):
+        await super(BasicAuthProvider, self).authorize(*args, **kwargs)
         username = username or self.USERNAME
         password = password or self.PASSWORD
         self._auth = aiohttp.BasicAuth(username, password)
@@ -0,0 +1,186 @@
+"""Retry failed requests with backoff, and stop sending requests to a provider that keeps failing"""
+import asyncio
+import collections
+import contextlib
+import random
+import time
+import typing
+
+from util import metrics
+from .tracing import current_task
+
+
+# The status code reported for a request that got no HTTP response at all (connection reset, timeout, DNS failure...)
+NETWORK_ERROR_CODE = 599
+
+# Sending one of these again has the same effect as sending it once, so it is always safe to retry
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'PROPFIND'})
+
+
+class RetryPolicy(typing.NamedTuple):
+    """
+    How to retry one kind of request. The delay before retry N is drawn uniformly from [0, base_delay * 2 ** (N - 1)]
+      ("full jitter"), capped at `max_delay`, so that many failed requests don't all retry in lockstep.
+
+    Other requests (eg a POST that creates something) may have taken effect even though they failed: Figshare, for
+      one, sometimes reports a 500 after creating the file. Sending those again could create a duplicate, so they are
+      only retried if they never reached the server, or if their code is in `retry_unsafe_on`. Steps where a repeat is
+      harmless opt in to that in the provider's `RETRY_POLICIES`.
+    """
+    attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    retry_on: typing.FrozenSet[int] = frozenset({429, 500, 502, 503, 504, NETWORK_ERROR_CODE})
+    retry_unsafe_on: typing.FrozenSet[int] = frozenset()
+
+    def should_retry(self, code: int, attempt: int, *, method: str='GET', sent: bool=True) -> bool:
+        """`sent` is False if the request failed before a connection was made, so the server never saw it"""
+        if attempt >= self.attempts:
+            return False
+        if method.upper() in IDEMPOTENT_METHODS or not sent:
+            return code in self.retry_on
+        return code in self.retry_unsafe_on
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+# Don't retry at all
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+class AttemptCounter:
+    """
+    Count the requests made for one check, including retries (see `AttemptTracker`). In a batch check, a retry can be
+      counted for some of the batch's filenames only; any other retry counts for all of them.
+    """
+    def __init__(self):
+        self.retries = 0
+        self.retries_by_name: typing.Counter[str] = collections.Counter()
+
+    @property
+    def attempts(self) -> int:
+        return 1 + self.retries
+
+    def attempts_of(self, name: str) -> int:
+        return self.attempts + self.retries_by_name[name]
+
+    def record_retry(self, names: typing.Iterable[str]=None) -> None:
+        if names is None:
+            self.retries += 1
+        else:
+            self.retries_by_name.update(names)
+
+
+class AttemptScope(typing.NamedTuple):
+    """Where a retry is counted: the counter for a check, and the filenames it is for (None for all of them)"""
+    counter: AttemptCounter
+    names: typing.Union[typing.Tuple[str, ...], None] = None
+
+    def for_names(self, names: typing.Iterable[str]) -> 'AttemptScope':
+        return self._replace(names=tuple(names))
+
+    def record_retry(self, names: typing.Iterable[str]=None) -> None:
+        self.counter.record_retry(self.names if names is None else names)
+
+
+class AttemptTracker:
+    """
+    Count the attempts made by each check. Like the tracer's operations, this is tracked per task: tasks that a check
+      starts (eg Figshare's part uploads) must be passed the scope explicitly, as `attempts=` on each request.
+    """
+    def __init__(self):
+        self._scopes: typing.Dict[asyncio.Task, AttemptScope] = {}
+
+    @contextlib.contextmanager
+    def _scoped(self, scope: AttemptScope) -> typing.Iterator[None]:
+        task = current_task()
+        previous = self._scopes.get(task)
+        self._scopes[task] = scope
+        try:
+            yield
+        finally:
+            if previous is None:
+                self._scopes.pop(task, None)
+            else:
+                self._scopes[task] = previous
+
+    @contextlib.contextmanager
+    def count(self) -> typing.Iterator[AttemptCounter]:
+        """Count every retry made by the current task within this block"""
+        counter = AttemptCounter()
+        with self._scoped(AttemptScope(counter)):
+            yield counter
+
+    @contextlib.contextmanager
+    def only_for(self, names: typing.Iterable[str]) -> typing.Iterator[None]:
+        """Count retries made by the current task within this block for these filenames only (eg part of a batch)"""
+        with self._scoped(self.current().for_names(names)):
+            yield
+
+    def current(self) -> AttemptScope:
+        """The scope of the current task; outside of `count`, a scope whose counts nobody reads"""
+        return self._scopes.get(current_task()) or AttemptScope(AttemptCounter())
+
+
+class CircuitBreaker:
+    """
+    After `threshold` failures in a row, pause every request to the provider for `cooldown` seconds. Then let a
+      single request through: if it succeeds, carry on as normal; if it fails, pause again for twice as long (up to
+      `max_cooldown`).
+    """
+    def __init__(self, *, threshold: int=5, cooldown: float=30.0, max_cooldown: float=600.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.cooldown = cooldown
+        self.trips = 0
+
+        self._failures = 0
+        self._open_until = 0.0
+        self._half_open = False
+        self._probe: typing.Union[asyncio.Event, None] = None
+
+    async def wait(self) -> bool:
+        """Wait until a request is allowed through. Returns True if it is the single request testing for recovery."""
+        while True:
+            now = time.monotonic()
+            if now < self._open_until:
+                await asyncio.sleep(self._open_until - now)
+            elif self._probe is not None:
+                # Wait to hear whether the provider has recovered
+                await self._probe.wait()
+            elif self._half_open:
+                self._half_open = False
+                self._probe = asyncio.Event()
+                return True
+            else:
+                return False
+
+    def _trip(self, name: str) -> None:
+        self.trips += 1
+        self._failures = 0
+        self._open_until = time.monotonic() + self.cooldown
+        self._half_open = True
+        metrics.BREAKER_TRIPS.inc(provider=name)
+        print(f'Circuit breaker for {name}: too many failures, pausing requests for {self.cooldown:.0f}s')
+
+    def record(self, failed: bool, *, probe: bool=False, name: str='provider') -> None:
+        """Record the outcome of a request let through by `wait`"""
+        if probe:
+            self._probe.set()
+            self._probe = None
+            if failed:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._trip(name)
+            else:
+                self.cooldown = self.base_cooldown
+            return
+
+        if self._half_open or self._probe is not None:
+            # Requests sent before the breaker tripped don't count; the recovery test decides
+            return
+        self._failures = self._failures + 1 if failed else 0
+        if self._failures >= self.threshold:
+            self._trip(name)
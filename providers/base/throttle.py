@@ -0,0 +1,93 @@
+"""Pace requests to a provider based on the rate limit signals that it sends back"""
+import asyncio
+import email.utils
+import time
+import typing
+
+import aiohttp
+
+
+# Status codes that mean "slow down", regardless of provider
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+def _parse_retry_after(value: str) -> typing.Union[float, None]:
+    """`Retry-After` may be given as a number of seconds, or as an HTTP date"""
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    parsed = email.utils.parsedate_to_datetime(value) if value else None
+    if parsed is None:
+        return None
+    return max(parsed.timestamp() - time.time(), 0.0)
+
+
+def _parse_rate_limit_reset(value: str) -> typing.Union[float, None]:
+    """Some providers (eg Github) send an epoch timestamp for `X-RateLimit-Reset`; others send seconds remaining"""
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+
+    if reset > 1e9:
+        return max(reset - time.time(), 0.0)
+    return max(reset, 0.0)
+
+
+class AdaptiveThrottle:
+    """
+    Space out the start of each request to a single provider, using additive increase/ multiplicative decrease.
+    Every successful response raises the allowed request rate a little; every "slow down" response cuts it sharply.
+    This lets each provider run close to its real ceiling, wherever that happens to be.
+
+    If the provider tells us exactly how long to wait (`Retry-After`, or an exhausted `X-RateLimit-*` budget), all
+    requests are paused until then.
+    """
+    def __init__(self, *,
+                 delay: typing.Union[float, None]=None,
+                 min_rate: float=0.1,
+                 max_rate: float=10.0,
+                 increase: float=0.1,
+                 decrease: float=0.5):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+
+        # Requests per second. The initial `delay` (if any) is only a starting point.
+        initial = (1.0 / delay) if delay else max_rate
+        self.rate: float = min(max(initial, min_rate), max_rate)
+
+        self._next_start: float = 0.0
+        self._paused_until: float = 0.0
+
+    async def wait(self) -> None:
+        """Wait until the next request is allowed to start"""
+        now = time.monotonic()
+        start = max(now, self._next_start, self._paused_until)
+        self._next_start = start + 1.0 / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def _pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe(self, resp: aiohttp.client.ClientResponse, code: int) -> None:
+        """Adjust the request rate based on the response to a request"""
+        headers = resp.headers
+        retry_after = _parse_retry_after(headers.get('Retry-After', ''))
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        budget_exhausted = remaining is not None and remaining.strip() == '0'
+
+        if code in THROTTLE_STATUS_CODES or retry_after is not None or budget_exhausted:
+            self.rate = max(self.rate * self.decrease, self.min_rate)
+            if retry_after is None and budget_exhausted:
+                retry_after = _parse_rate_limit_reset(headers.get('X-RateLimit-Reset'))
+            if retry_after:
+                self._pause(retry_after)
+            print(f'Throttled (code {code}); slowing to {self.rate:.2f} requests/sec, pausing {retry_after or 0}s')
+        elif code < 400:
+            self.rate = min(self.rate + self.increase, self.max_rate)
@@ -0,0 +1,157 @@
+"""Record how long each provider request takes, and where that time goes"""
+import asyncio
+import collections
+import contextlib
+import json
+import math
+import os
+import time
+import typing
+import urllib.parse
+
+from util import metrics
+
+
+def current_task() -> typing.Union[asyncio.Task, None]:
+    """Tracing state is tracked per task, since many requests may be in flight on the same loop at once"""
+    getter = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+    try:
+        return getter()
+    except RuntimeError:  # No running loop
+        return None
+
+
+def percentile(values: typing.List[float], pct: float) -> typing.Union[float, None]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class RequestTracer:
+    """
+    Time every request made by one provider, tagged by operation (eg `upload_file`) and step (eg Figshare's
+      `_initiate_upload`). Records are written to a JSONL file as they complete.
+
+    Phases:
+    - dns: time to resolve the host (zero if the connector's DNS cache was used)
+    - connect: time to open the TCP connection, including the TLS handshake (aiohttp does not expose these separately)
+    - ttfb: time from sending the request until response headers are received (includes dns + connect)
+    - total: time until the full response body has been read
+    A request that reuses a pooled connection will have no dns or connect time at all.
+    """
+    def __init__(self, provider_name: str):
+        self.provider_name = provider_name
+        self.out_fn: str = None
+        self._f = None
+
+        self._operations: typing.Dict[asyncio.Task, str] = {}
+        self._active: typing.Dict[asyncio.Task, dict] = {}
+        # (operation, step) -> list of total durations, for the summary
+        self._totals: typing.Dict[typing.Tuple[str, str], typing.List[float]] = collections.defaultdict(list)
+
+    def open(self, out_fn: str) -> None:
+        """
+        Write trace records to the specified file. Several providers may share one file per run: each record is a
+          single line-buffered append.
+        """
+        os.makedirs(os.path.dirname(out_fn), exist_ok=True)
+        self.out_fn = out_fn
+        self._f = open(out_fn, 'a', buffering=1)
+
+    def close(self) -> None:
+        """Print (and record) the latency summary for this provider, then stop writing records"""
+        if self._totals:
+            self.print_summary()
+        if self._f is not None:
+            self._f.write(json.dumps({'provider': self.provider_name, 'summary': self.summary()}) + '\n')
+            self._f.close()
+            self._f = None
+
+    @contextlib.contextmanager
+    def operation(self, name: str):
+        """Tag every request made by the current task (within this block) as part of the named operation"""
+        task = current_task()
+        self._operations[task] = name
+        try:
+            yield
+        finally:
+            self._operations.pop(task, None)
+
+    def current_operation(self) -> typing.Union[str, None]:
+        """The operation declared by the current task, if any"""
+        return self._operations.get(current_task())
+
+    def start(self, method: str, url: str, *, operation: str=None, step: str=None) -> dict:
+        task = current_task()
+        operation = operation or self._operations.get(task)
+        # Drop the query string: presigned URLs carry credentials there
+        parts = urllib.parse.urlsplit(str(url))
+        record = {
+            'provider': self.provider_name,
+            'operation': operation,
+            'step': step or operation,
+            'method': method,
+            'url': urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path, '', '')),
+            'status': None,
+            'reused_connection': True,
+            'dns': 0.0,
+            'connect': 0.0,
+            'ttfb': None,
+            'total': None,
+            '_start': time.monotonic(),
+        }
+        self._active[task] = record
+        return record
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        """Called by the connector when the current task's request has to resolve a host or open a connection"""
+        record = self._active.get(current_task())
+        if record is None:
+            return
+        record[name] += seconds
+        record['reused_connection'] = False
+
+    def get_phase(self, name: str) -> float:
+        record = self._active.get(current_task())
+        return record[name] if record is not None else 0.0
+
+    def first_byte(self, record: dict) -> None:
+        record['ttfb'] = time.monotonic() - record['_start']
+
+    def finish(self, record: dict, status: typing.Union[int, None]) -> None:
+        record['status'] = status
+        record['total'] = time.monotonic() - record.pop('_start')
+        self._active.pop(current_task(), None)
+
+        self._totals[(record['operation'], record['step'])].append(record['total'])
+        labels = {'provider': self.provider_name, 'operation': record['operation'], 'step': record['step']}
+        metrics.REQUESTS.inc(code=status, **labels)
+        metrics.REQUEST_DURATION.observe(record['total'], **labels)
+        if self._f is not None:
+            self._f.write(json.dumps(record) + '\n')
+
+    def summary(self) -> typing.Dict[str, dict]:
+        """p50/p95/p99 of total request time, per operation step and for the provider overall"""
+        groups = {f'{op}:{step}': totals for (op, step), totals in self._totals.items()}
+        groups['all'] = [t for totals in self._totals.values() for t in totals]
+
+        rv = {}
+        for name, totals in groups.items():
+            totals = sorted(totals)
+            rv[name] = {
+                'count': len(totals),
+                'p50': percentile(totals, 50),
+                'p95': percentile(totals, 95),
+                'p99': percentile(totals, 99),
+            }
+        return rv
+
+    def print_summary(self) -> None:
+        print(f'Request latency for {self.provider_name} (seconds):')
+        for name, stats in sorted(self.summary().items()):
+            if not stats['count']:
+                continue
+            print(f'  {name:<45} n={stats["count"]:<6} p50={stats["p50"]:.3f} p95={stats["p95"]:.3f} '
+                  f'p99={stats["p99"]:.3f}')
@@ -5,7 +5,7 @@ import urllib.parse
 
 import aiohttp
 
-from ..base import OauthBaseProvider
+from ..base import OauthBaseProvider, RetryPolicy, mock_url
 import settings
 
 
@@ -13,11 +13,26 @@ class BoxProvider(OauthBaseProvider):
     NAME = 'box'
 
     DEFAULT_CREDENTIAL = settings.BOX_OAUTH_TOKEN
-    BASE_URL = 'https://api.box.com/2.0/'
-    BASE_CONTENT_URL = 'https://upload.box.com/api/2.0/files/'
+    BASE_URL = mock_url(NAME, 'https://api.box.com/2.0/')
+    BASE_CONTENT_URL = mock_url(NAME, 'https://upload.box.com/api/2.0/files/')
 
     ALLOWS_SUBFOLDERS = True
 
+    # Box sometimes rejects an upload with an unexplained 400, then accepts the same upload when it is sent again.
+    #   Nothing was stored, so it is safe to send again (unlike an upload that failed with a server error).
+    RETRY_POLICIES = {'upload_file': RetryPolicy(retry_unsafe_on=frozenset({400}))}
+    # ...but a 400 with one of these error codes means the name itself was rejected, which sending again won't change
+    NAME_REJECTED_ERRORS = frozenset({'item_name_invalid', 'item_name_too_long'})
+
+    async def _is_transient(self, resp, code: int) -> bool:
+        if code != 400:
+            return True
+        try:
+            error = json.loads(await resp.text())
+        except ValueError:
+            return True
+        return not isinstance(error, dict) or error.get('code') not in self.NAME_REJECTED_ERRORS
+
     async def create_folder(self, foldername: str):
         """
         See: https://docs.box.com/reference#create-a-new-folder
@@ -37,6 +52,7 @@ class BoxProvider(OauthBaseProvider):
                                                       data=json.dumps(data),
                                                       headers={'Content-Type': 'application/json'})
         rv = resp['id'] if code < 400 else None
+        self.record_created('folder', rv)
         return rv, code
 
     async def upload_file(self,
@@ -73,7 +89,26 @@ class BoxProvider(OauthBaseProvider):
             for l in mpwriter.serialize():
                 print(l.decode('utf-8'))
 
-            return await self.make_request_get_json('POST', url, data=mpwriter)
+            resp, code = await self.make_request_get_json('POST', url, data=mpwriter)
+
+        if code < 400:
+            # The upload API wraps the new file in a list of entries
+            entry = resp['entries'][0] if 'entries' in resp else resp
+            self.record_created('file', entry.get('id'))
+        return resp, code
+
+    async def delete_resource(self, resource: dict) -> int:
+        """
+        See https://docs.box.com/reference#delete-a-folder and https://docs.box.com/reference#delete-a-file
+        """
+        if resource['kind'] == 'folder':
+            url = urllib.parse.urljoin(self.BASE_URL, f'folders/{resource["id"]}')
+            params = {'recursive': 'true'}
+        else:
+            url = urllib.parse.urljoin(self.BASE_URL, f'files/{resource["id"]}')
+            params = None
+        resp, code = await self._make_request('DELETE', url, params=params)
+        return code
 
     @staticmethod
     def extract_uploaded_filename(payload: dict=None):
@@ -2,22 +2,73 @@
 import io
 import re
 import typing
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
 import xml.sax.saxutils as saxutils
 import zipfile
 
-from ..base import NoAuthProvider
+import aiohttp
+
+from ..base import NoAuthProvider, mock_url
 import settings
 
 
+class _ChunkSink(io.RawIOBase):
+    """A write-only, unseekable buffer that hands over whatever has been written so far"""
+    def __init__(self):
+        super(_ChunkSink, self).__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+@aiohttp.streamer
+async def _zip_stream(writer, filenames: typing.List[str]=(), content: str=''):
+    """Compress each file into a zip archive, sending each entry as soon as it is ready"""
+    sink = _ChunkSink()
+    # Zipfile supports unseekable output (it writes data descriptors instead of seeking back to fill in sizes)
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename in filenames:
+            archive.writestr(filename, content)
+            await writer.write(sink.drain())
+    # Closing the archive writes the central directory. (Never send an empty chunk: that would end the body early.)
+    tail = sink.drain()
+    if tail:
+        await writer.write(tail)
+
+
 class DataverseProvider(NoAuthProvider):
     # TODO: Uses basic auth, genericize if needed
     NAME = 'dataverse'
 
     DEFAULT_CREDENTIAL = settings.DATAVERSE_API_TOKEN
-    BASE_URL = 'https://demo.dataverse.org/dvn/api/'
+    BASE_URL = mock_url(NAME, 'https://demo.dataverse.org/dvn/api/')
 
     ALLOWS_SUBFOLDERS = False
 
+    # Each SWORD deposit is slow, so send many files per zip
+    BATCH_SIZE = 50
+    # How a deposit is refused when a file in the zip has a name that Dataverse won't accept
+    FILENAME_REJECTED_CODE = 400
+
+    # A deposit response says nothing about the files inside the zip; the dataset statement lists them all
+    VERIFY_BY_LISTING = True
+
+    @property
+    def _auth(self):
+        # SWORD API takes the API token as the basic auth username, with no password
+        return aiohttp.BasicAuth(self.DEFAULT_CREDENTIAL or '')
+
     def _dataset_xml(self, datasetname: str) -> str:
         """Generate minimum xml file required to create a new dataset"""
         # TODO: Never do this in production code
@@ -51,44 +102,79 @@ class DataverseProvider(NoAuthProvider):
         headers = {
             'Content-type': 'application/atom+xml'
         }
-        resp, code = await self._make_request('POST', url, data=xml, headers=headers, auth=(self.DEFAULT_CREDENTIAL,))
+        resp, code = await self._make_request('POST', url, data=xml, headers=headers, auth=self._auth)
 
         # For uploading, we need the DOI of the resource, because THIS IS SPARTA
         # Well. The XML format only gives links, so, we're not getting this out without a regex anyway
         if code < 400:
             match = re.search('(10.[a-zA-Z0-9\/]+)', await resp.text())
             # Future dataset operations require the DOI (not the title or alias etc)
+            self.record_created('dataset', match.group())
             return match.group(), code
         else:
             return None, code
 
-    async def upload_file(self, filename: str, content):
+    async def _deposit(self, filenames: typing.List[str], content):
         """
+        Deposit one zip file containing every filename. The zip is streamed straight into the request body as each
+          entry is compressed, rather than being built in memory first.
         See http://guides.dataverse.org/en/4.5/api/sword.html#add-files-to-a-dataset-with-a-zip-file
-        
-        This script is focused on uploading files one at a time. In production use, zipfile upload could be handled 
-        more efficiently as a bulk request.
         """
         doi = self.parent_folder  # Every file we upload needs a dataset specified in advance!
-
-        stream = io.BytesIO()
-
-        with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED) as memzip:
-            memzip.writestr(filename, content)
-
         url = f'{self.BASE_URL}data-deposit/v1.1/swordv2/edit-media/study/doi:{doi}'
-        size = len(stream.getvalue())
-        stream.seek(0, 0)
 
+        # Size is not known in advance, so the body is sent with chunked transfer encoding
         headers = {
             "Content-Disposition": "filename=temp.zip",
             "Content-Type": "application/zip",
             "Packaging": "http://purl.org/net/sword/package/SimpleZip",
-            "Content-Length": str(size),
         }
 
-        return await self._make_request('POST', url, auth=(self.DEFAULT_CREDENTIAL,),
-                                        data=stream, headers=headers)
+        return await self._make_request('POST', url, auth=self._auth,
+                                        data=_zip_stream(filenames=filenames, content=content), headers=headers)
+
+    async def upload_file(self, filename: str, content):
+        """Upload a single file, as a zip containing only that file"""
+        return await self._deposit([filename], content)
+
+    async def upload_files(self, filenames: typing.List[str], content):
+        """
+        Upload many files in a single SimpleZip deposit. A deposit succeeds or fails as a whole, so if a filename is
+          rejected, split the batch in half and try again to find out which filenames were to blame. Any other failure
+          (eg a server error or rate limit) is reported for the whole batch.
+        """
+        resp, code = await self._deposit(filenames, content)
+        if code != self.FILENAME_REJECTED_CODE or len(filenames) == 1:
+            return [(resp, code)] * len(filenames)
+
+        return await self._split_batch(filenames, content)
+
+    async def delete_resource(self, resource: dict) -> int:
+        """
+        Delete a dataset, and every file in it. (Files in a zip deposit have no ids, so only datasets are recorded.)
+        See http://guides.dataverse.org/en/4.5/api/sword.html#delete-a-dataset
+        """
+        url = f'{self.BASE_URL}data-deposit/v1.1/swordv2/edit/study/doi:{resource["id"]}'
+        resp, code = await self._make_request('DELETE', url, auth=self._auth)
+        return code
+
+    async def list_folder(self):
+        """
+        Fetch the dataset's SWORD statement, an Atom feed with one entry per file.
+        See http://guides.dataverse.org/en/4.5/api/sword.html#list-files-in-a-dataset
+        """
+        url = f'{self.BASE_URL}data-deposit/v1.1/swordv2/statement/study/doi:{self.parent_folder}'
+        resp, code = await self._make_request('GET', url, auth=self._auth)
+        if code >= 400:
+            return None, code
+
+        # Each entry's content link ends in the (URL-encoded) name of the stored file
+        names = []
+        for el in ElementTree.fromstring(await resp.read()).iter('{http://www.w3.org/2005/Atom}content'):
+            src = el.get('src')
+            if src:
+                names.append(urllib.parse.unquote(src.rstrip('/').rsplit('/', 1)[-1]))
+        return names, code
 
     @staticmethod
     def extract_uploaded_filename(payload: dict = None):
@@ -1,20 +1,39 @@
 """A provider that talks to DropBox"""
+import asyncio
 import json
 import typing
 import urllib.parse
 
-from ..base import OauthBaseProvider
+from ..base import OauthBaseProvider, RetryPolicy, mock_url, retry
 import settings
 
 class DropboxProvider(OauthBaseProvider):
     NAME = 'dropbox'
 
     DEFAULT_CREDENTIAL = settings.DROPBOX_OAUTH_TOKEN
-    BASE_URL = 'https://api.dropboxapi.com/2/files/'
-    BASE_CONTENT_URL = 'https://content.dropboxapi.com/2/files/'
+    BASE_URL = mock_url(NAME, 'https://api.dropboxapi.com/2/files/')
+    BASE_CONTENT_URL = mock_url(NAME, 'https://content.dropboxapi.com/2/files/')
 
     ALLOWS_SUBFOLDERS = True
 
+    # Dropbox serializes metadata writes, so concurrent single uploads get `too_many_write_operations`. Instead, send
+    #   content through upload sessions, and commit a whole batch of files in one `finish_batch` (maximum 1000).
+    BATCH_SIZE = 200
+    # How many upload sessions (content only, no metadata writes) to start at once
+    MAX_CONCURRENT_SESSIONS = 8
+
+    # Most entries accepted by one `delete_batch` call
+    MAX_DELETE_BATCH = 1000
+    # How often to ask whether an asynchronous batch job has finished, in seconds
+    POLL_INTERVAL = 0.5
+
+    # Every Dropbox API call is a POST, but some are safe to send again: an upload session that is never committed
+    #   creates no file, and checking on a job only reads its status
+    RETRY_POLICIES = {
+        '_start_session': RetryPolicy(retry_unsafe_on=RetryPolicy().retry_on),
+        '_poll_job': RetryPolicy(retry_unsafe_on=RetryPolicy().retry_on),
+    }
+
     async def create_folder(self, foldername: str):
         parent_folder = self.parent_folder or ''
         url = urllib.parse.urljoin(self.BASE_URL, 'create_folder')
@@ -26,6 +45,7 @@ class DropboxProvider(OauthBaseProvider):
                                                       data=json.dumps(data),
                                                       headers={'Content-Type': 'application/json'})
         rv = resp['path_display'] if code < 400 else None
+        self.record_created('folder', rv)
         return rv, code
 
     async def upload_file(self,
@@ -46,7 +66,123 @@ class DropboxProvider(OauthBaseProvider):
             ),
             'Content-Length': str(size),
         }
-        return await self.make_request_get_json('POST', url, headers=headers, data=content)
+        resp, code = await self.make_request_get_json('POST', url, headers=headers, data=content)
+        if code < 400:
+            self.record_created('file', resp.get('path_display'))
+        return resp, code
+
+    async def _start_session(self, content, *, attempts: retry.AttemptScope=None) -> typing.Tuple[dict, int]:
+        """
+        Upload the content of one file in a new (closed) upload session, ready to be committed by `finish_batch`
+        See https://www.dropbox.com/developers/documentation/http/documentation#files-upload_session-start
+        """
+        url = urllib.parse.urljoin(self.BASE_CONTENT_URL, 'upload_session/start')
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'Dropbox-API-Arg': json.dumps({'close': True}),
+        }
+        return await self.make_request_get_json('POST', url, headers=headers, data=content,
+                                                step='_start_session', attempts=attempts)
+
+    async def upload_files(self, filenames: typing.List[str], content):
+        """
+        Upload each file's content in its own upload session, then commit every file with one `finish_batch` call, and
+          map each entry of the (polled) result back to its filename.
+        See https://www.dropbox.com/developers/documentation/http/documentation#files-upload_session-finish_batch
+        """
+        parent_folder = self.parent_folder or ''
+        size = len(content.encode('utf-8'))
+        slots = asyncio.Semaphore(self.MAX_CONCURRENT_SESSIONS)
+        attempts = self.attempts.current()
+
+        async def start(filename):
+            async with slots:
+                # Sessions run as separate tasks, so name the operation explicitly for tracing, and count any retry
+                #   against this file only
+                with self.tracer.operation('upload_file'):
+                    return await self._start_session(content, attempts=attempts.for_names([filename]))
+
+        sessions = await asyncio.gather(*[start(filename) for filename in filenames])
+        results = list(sessions)
+
+        # Only files whose content arrived safely can be committed
+        started = [i for i, (_, code) in enumerate(sessions) if code < 400]
+        if not started:
+            return results
+
+        entries = [{
+            'cursor': {'session_id': sessions[i][0]['session_id'], 'offset': size},
+            'commit': {'path': f'{parent_folder}/{filenames[i]}', 'mode': 'add', 'autorename': False},
+        } for i in started]
+        url = urllib.parse.urljoin(self.BASE_URL, 'upload_session/finish_batch')
+        with self.attempts.only_for([filenames[i] for i in started]):
+            resp, code = await self.make_request_get_json('POST', url,
+                                                          data=json.dumps({'entries': entries}),
+                                                          headers={'Content-Type': 'application/json'},
+                                                          step='_finish_batch')
+            if code < 400 and resp.get('.tag') == 'async_job_id':
+                resp, code = await self._poll_job(
+                    urllib.parse.urljoin(self.BASE_URL, 'upload_session/finish_batch/check'), resp['async_job_id'])
+
+        if code >= 400 or resp.get('.tag') != 'complete':
+            for i in started:
+                results[i] = (resp, code if code >= 400 else 500)
+            return results
+
+        for i, entry in zip(started, resp['entries']):
+            if entry['.tag'] == 'success':
+                self.record_created('file', entry.get('path_display'))
+                results[i] = (entry, 200)
+            else:
+                failure = entry.get('failure', {})
+                # Too many writes is transient (and so should not be cached as this filename's outcome)
+                results[i] = (failure, 429 if failure.get('.tag') == 'too_many_write_operations' else 409)
+        return results
+
+    async def _poll_job(self, check_url: str, job_id: str) -> typing.Tuple[dict, int]:
+        """Wait for an asynchronous batch job to finish, and return its final status"""
+        while True:
+            resp, code = await self.make_request_get_json('POST', check_url,
+                                                          data=json.dumps({'async_job_id': job_id}),
+                                                          headers={'Content-Type': 'application/json'},
+                                                          step='_poll_job')
+            if code >= 400 or resp.get('.tag') != 'in_progress':
+                return resp, code
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def delete_resource(self, resource: dict) -> int:
+        return (await self.delete_resources([resource]))[0]
+
+    async def delete_resources(self, resources: typing.List[dict]) -> typing.List[int]:
+        """
+        Delete up to `MAX_DELETE_BATCH` paths per request. Dropbox may run the batch as a job to be polled.
+        See https://www.dropbox.com/developers/documentation/http/documentation#files-delete_batch
+        """
+        codes = []
+        for start in range(0, len(resources), self.MAX_DELETE_BATCH):
+            batch = resources[start:start + self.MAX_DELETE_BATCH]
+            url = urllib.parse.urljoin(self.BASE_URL, 'delete_batch')
+            data = {'entries': [{'path': resource['id']} for resource in batch]}
+            resp, code = await self.make_request_get_json('POST', url,
+                                                          data=json.dumps(data),
+                                                          headers={'Content-Type': 'application/json'})
+            if code < 400 and resp.get('.tag') == 'async_job_id':
+                resp, code = await self._poll_job(urllib.parse.urljoin(self.BASE_URL, 'delete_batch/check'),
+                                                  resp['async_job_id'])
+
+            if code >= 400 or resp.get('.tag') != 'complete':
+                codes.extend([code if code >= 400 else 500] * len(batch))
+                continue
+
+            for entry in resp['entries']:
+                lookup_error = entry.get('failure', {}).get('path_lookup', {})
+                if entry['.tag'] == 'success':
+                    codes.append(200)
+                elif lookup_error.get('.tag') == 'not_found':
+                    codes.append(404)
+                else:
+                    codes.append(409)
+        return codes
 
     @staticmethod
     def extract_uploaded_filename(payload: dict=None):
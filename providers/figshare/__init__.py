@@ -1,8 +1,9 @@
 """A provider that talks to Figshare"""
+import asyncio
 import json
 import typing
 
-from ..base import BaseProvider
+from ..base import BaseProvider, mock_url
 import settings
 
 
@@ -10,13 +11,17 @@ class FigshareProvider(BaseProvider):
     NAME = 'figshare'
 
     DEFAULT_CREDENTIAL = settings.FIGSHARE_API_TOKEN
-    BASE_URL = 'https://api.figshare.com/v2/'
+    BASE_URL = mock_url(NAME, 'https://api.figshare.com/v2/')
     BASE_CONTENT_URL = None
 
     ALLOWS_SUBFOLDERS = False
 
+    # How many parts of a single file may be uploaded at once
+    MAX_CONCURRENT_PARTS = 4
+
     async def authorize(self, *args, token: str = None, **kwargs):
         """Set authorization headers, optionally using default credentials if none are explicitly passed"""
+        await super(FigshareProvider, self).authorize(*args, **kwargs)
         self.token = token or self.DEFAULT_CREDENTIAL
         self.auth_headers = {
             'Authorization': 'token {}'.format(self.token),
@@ -39,7 +44,9 @@ class FigshareProvider(BaseProvider):
             data=json.dumps(data)
         )
 
-        article_id = resp['location'].rsplit('/', 1)[1] if code < 400 else resp
+        article_id = resp['location'].rsplit('/', 1)[1] if code < 400 else None
+        if code < 400:
+            self.record_created('article', article_id)
         return article_id, code
 
     async def _initiate_upload(self, parent_dataset, filename, size):
@@ -50,7 +57,8 @@ class FigshareProvider(BaseProvider):
             'size': str(size)
         }
         placeholder_url = f'{self.BASE_URL}account/articles/{parent_dataset}/files'
-        payload, code = await self.make_request_get_json('POST', placeholder_url, data=json.dumps(payload))
+        payload, code = await self.make_request_get_json('POST', placeholder_url, data=json.dumps(payload),
+                                                          step='_initiate_upload')
         return payload, code
 
     async def _get_file_upload_url(self, article_id, file_id):
@@ -61,44 +69,63 @@ class FigshareProvider(BaseProvider):
         Then after we get the upload url, we need to play Figshare may I to be told how to upload
         
         I continue to be told all this is not a weird joke.
+
+        Returns (file metadata, upload url, parts, code); the code is that of whichever request failed, if one did.
         """
 
         url = f'{self.BASE_URL}account/articles/{article_id}/files/{file_id}'
-        payload, url_code = await self.make_request_get_json('GET', url)
-
-        upload_url = None
-        parts = None
-        if url_code < 400:
-            upload_url = payload['upload_url']
-            parts_resp_payload, parts_code = await self.make_request_get_json('GET', upload_url)
-
-            parts = parts_resp_payload['parts'] if parts_code < 400 else parts_resp_payload
+        payload, url_code = await self.make_request_get_json('GET', url, step='_get_file_upload_url')
+        if url_code >= 400:
+            return payload, None, None, url_code
 
-        return payload, upload_url, parts
+        upload_url = payload['upload_url']
+        parts_resp_payload, parts_code = await self.make_request_get_json('GET', upload_url,
+                                                                        step='_get_file_upload_url')
+        parts = parts_resp_payload['parts'] if parts_code < 400 else None
+        return payload, upload_url, parts, parts_code
 
     async def _perform_upload(self, content, upload_url, parts):
         """Second upload step: send data
         Interestingly, these endpoints just return "OK" for each upload step req body. Pretty uninformative.
+
+        Each part gets the slice of the content between its (inclusive) start and end offsets. Parts are sent
+          concurrently, up to `MAX_CONCURRENT_PARTS` at a time for each file.
         """
-        upload_response = None
-        code = 400 # If nothing gets uploaded, don't consider this a success
-        for part in parts:
-            # size = part['endOffset'] - part['startOffset'] + 1  # We choose to ignore this for the limited testcase!
-            part_number = part['partNo']
-            upload_response, code = await self._make_request(
-                'PUT',
-                upload_url + '/' + str(part_number),
-                data=content
-            )
-        # Just return the last response info, or a "failure-esque" placeholder
-        return upload_response, code
+        if not isinstance(parts, list) or not parts:
+            # If nothing gets uploaded, don't consider this a success
+            return None, 400
+
+        body = content.encode('utf-8') if isinstance(content, str) else content
+        slots = asyncio.Semaphore(self.MAX_CONCURRENT_PARTS)
+        attempts = self.attempts.current()
+
+        async def upload_part(part):
+            data = body[part['startOffset']:part['endOffset'] + 1]
+            async with slots:
+                # Parts run as separate tasks, so name the operation (and where to count retries) explicitly
+                return await self._make_request(
+                    'PUT',
+                    upload_url + '/' + str(part['partNo']),
+                    data=data,
+                    operation='upload_file',
+                    step='_perform_upload',
+                    attempts=attempts
+                )
+
+        responses = await asyncio.gather(*[upload_part(part) for part in parts])
+
+        # Report the first failed part if there was one, otherwise the last part
+        for upload_response, code in responses:
+            if code >= 400:
+                return upload_response, code
+        return responses[-1]
 
     async def _mark_upload_complete(self, article_id: str, file_id: str):
         """Last upload step: tell figshare you're done"""
         url = f'{self.BASE_URL}account/articles/{article_id}/files/{file_id}'
         # This should return a 202 code
         # Note: The success response contains XML, not JSON.
-        return await self._make_request('POST', url)
+        return await self._make_request('POST', url, step='_mark_upload_complete')
 
     async def upload_file(self,
                           filename: str,
@@ -114,21 +141,39 @@ class FigshareProvider(BaseProvider):
         parent_dataset = self.parent_folder or settings.FIGSHARE_PROJECT
         size = len(content.encode('utf-8'))
         initiate_payload, code = await self._initiate_upload(parent_dataset, filename, size)
+        if code >= 400:
+            return {}, code
+
         new_file_id = initiate_payload['location'].rsplit('/', 1)[1]
+        # Placeholders take up quota too, so record the file as soon as it exists (even if the upload fails)
+        self.record_created('file', new_file_id, article=parent_dataset)
 
+        metadata_payload, upload_url, parts, code = await self._get_file_upload_url(parent_dataset, new_file_id)
         if code >= 400:
             return {}, code
 
-        metadata_payload, upload_url, parts = await self._get_file_upload_url(parent_dataset, new_file_id)
-
         # TODO: Upload response?
         upload_resp, code = await self._perform_upload(content, upload_url, parts)
+        if code >= 400:
+            return {}, code
 
         # We return the code for the last request attempted as final status... but the filename payload is from a
         #   different request, b/c Figshare API is very fragmented. Admittedly this is clunky.
         _, code = await self._mark_upload_complete(parent_dataset, new_file_id)
         return metadata_payload, code
 
+    async def delete_resource(self, resource: dict) -> int:
+        """
+        See https://docs.figshare.com/api/articles/#delete-an-article and
+          https://docs.figshare.com/api/articles/#delete-a-file-from-an-article
+        """
+        if resource['kind'] == 'article':
+            url = f'{self.BASE_URL}account/articles/{resource["id"]}'
+        else:
+            url = f'{self.BASE_URL}account/articles/{resource["article"]}/files/{resource["id"]}'
+        resp, code = await self._make_request('DELETE', url)
+        return code
+
     @staticmethod
     def extract_uploaded_filename(payload: dict = None):
         return payload['name']
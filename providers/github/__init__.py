@@ -5,7 +5,7 @@ import os
 import typing
 import urllib.parse
 
-from ..base import OauthBaseProvider
+from ..base import OauthBaseProvider, RetryPolicy, mock_url
 import settings
 
 
@@ -13,12 +13,42 @@ class GithubProvider(OauthBaseProvider):
     NAME = 'github'
 
     DEFAULT_CREDENTIAL = settings.GITHUB_AUTH_TOKEN
-    BASE_URL = 'https://api.github.com/'
+    BASE_URL = mock_url(NAME, 'https://api.github.com/')
     BASE_CONTENT_URL = None
 
     # Pseudo folders via gitkeep
     ALLOWS_SUBFOLDERS = True
 
+    # Secondary rate limits allow ~80 content-creating requests per minute
+    MAX_REQUESTS_PER_SECOND = 80 / 60
+
+    # Folders are only implied by the paths of the files inside them, and every delete is a commit to the same branch
+    RECURSIVE_DELETE = False
+    MAX_CONCURRENT_DELETES = 1
+
+    # The branch that every test file is committed to
+    BRANCH = getattr(settings, 'GH_BRANCH', None) or 'master'
+
+    # In batch mode, each batch of files is added in one commit via the Git Data API, instead of one commit per file
+    BATCH_SIZE = 500
+    # If another commit lands on the branch while a batch is being built, rebuild it on top of the new head
+    MAX_REF_RETRIES = 3
+    # How tree creation reports an invalid path
+    PATH_REJECTED_CODE = 422
+
+    # Git objects are named by their content, and change nothing until the branch points at them, so creating one
+    #   again is harmless
+    RETRY_POLICIES = {
+        '_create_blob': RetryPolicy(retry_unsafe_on=RetryPolicy().retry_on),
+        '_create_tree': RetryPolicy(retry_unsafe_on=RetryPolicy().retry_on),
+        '_create_commit': RetryPolicy(retry_unsafe_on=RetryPolicy().retry_on),
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(GithubProvider, self).__init__(*args, **kwargs)
+        # Blob SHA for each file content already uploaded (see `_blob_sha`)
+        self._blob_shas: typing.Dict[str, str] = {}
+
     async def create_folder(self, foldername: str):
         """
         Create an empty gitkeep file at the specified path
@@ -33,16 +63,19 @@ class GithubProvider(OauthBaseProvider):
                 'name': 'Frodo Baggins',
                 'email': 'frodo@sacksville-bagend.org',  # Intentionally fake email; avoid spamming GH activity
             },
-            'branch': 'master',  # FIXME: that's right- this is hardcoded
+            'branch': self.BRANCH,
             'message': 'Test of provider filename behaviors'
         }
 
         path_encoded = urllib.parse.quote(gk_path)
         url = f'{self.BASE_URL}repos/{settings.GH_REPO_NAME}/contents/{path_encoded}'
 
-        resp, code = await self._make_request('PUT', url,
-                                              data=json.dumps(data),
-                                              headers={'Content-Type': 'application/json'})
+        resp, code = await self.make_request_get_json('PUT', url,
+                                                      data=json.dumps(data),
+                                                      headers={'Content-Type': 'application/json'})
+        if code < 400:
+            # Deleting a file requires the blob SHA of the version to delete
+            self.record_created('file', gk_path, sha=resp['content']['sha'])
         return foldername, code
 
     async def upload_file(self,
@@ -65,16 +98,158 @@ class GithubProvider(OauthBaseProvider):
                 'name': 'Frodo Baggins',
                 'email': 'frodo@sacksville-bagend.org',  # Intentionally fake email; avoid spamming GH activity
             },
-            'branch': 'master',  # FIXME: that's right- this is hardcoded
+            'branch': self.BRANCH,
             'message': 'Test of provider filename behaviors'
         }
 
         path_encoded = urllib.parse.quote(filename)
         url = f'{self.BASE_URL}repos/{settings.GH_REPO_NAME}/contents/{path_encoded}'
 
-        return await self.make_request_get_json('PUT', url,
-                                                data=json.dumps(data),
-                                                headers={'Content-Type': 'application/json'})
+        resp, code = await self.make_request_get_json('PUT', url,
+                                                      data=json.dumps(data),
+                                                      headers={'Content-Type': 'application/json'})
+        if code < 400:
+            self.record_created('file', resp['content']['path'], sha=resp['content']['sha'])
+        return resp, code
+
+    @property
+    def _git_url(self) -> str:
+        return f'{self.BASE_URL}repos/{settings.GH_REPO_NAME}/git/'
+
+    async def _git_request(self, method: str, path: str, data: dict=None, *, step: str):
+        body = json.dumps(data) if data is not None else None
+        return await self.make_request_get_json(method, self._git_url + path, data=body,
+                                                headers={'Content-Type': 'application/json'}, step=step)
+
+    async def _blob_sha(self, content) -> typing.Tuple[typing.Union[str, dict], int]:
+        """
+        Create a blob for some file content, once: every file in a batch shares the same content, so the same blob is
+          reused for all of them (and for later batches).
+        See https://developer.github.com/v3/git/blobs/#create-a-blob
+        """
+        if content in self._blob_shas:
+            return self._blob_shas[content], 201
+
+        resp, code = await self._git_request('POST', 'blobs', {'content': content, 'encoding': 'utf-8'},
+                                             step='_create_blob')
+        if code >= 400:
+            return resp, code
+        self._blob_shas[content] = resp['sha']
+        return resp['sha'], code
+
+    async def _commit_tree(self, filenames: typing.List[str], blob_sha: str) \
+            -> typing.Tuple[typing.Union[dict, None], int, typing.Union[str, None]]:
+        """
+        Add every file to the parent folder in a single commit: build a new tree for the parent folder (on top of its
+          current contents), graft it into the root tree, commit, and move the branch to the new commit. Returns the
+          parent folder's new tree, whose entries show the names each file was stored under. On failure, returns the
+          error instead, with the step that failed.
+        See https://developer.github.com/v3/git/trees/#create-a-tree
+        """
+        parent_folder = self.parent_folder or ''
+        for attempt in range(self.MAX_REF_RETRIES):
+            ref, code = await self._git_request('GET', f'refs/heads/{self.BRANCH}', step='_get_ref')
+            if code >= 400:
+                return ref, code, '_get_ref'
+            head_sha = ref['object']['sha']
+
+            commit, code = await self._git_request('GET', f'commits/{head_sha}', step='_get_commit')
+            if code >= 400:
+                return commit, code, '_get_commit'
+            root, code = await self._git_request('GET', f'trees/{commit["tree"]["sha"]}', step='_get_tree')
+            if code >= 400:
+                return root, code, '_get_tree'
+
+            # Add to whatever is already in the folder (eg .gitkeep, or files from an earlier batch)
+            if parent_folder:
+                folder_sha = next((entry['sha'] for entry in root['tree'] if entry['path'] == parent_folder), None)
+            else:
+                folder_sha = root['sha']
+            folder_tree = {'tree': [{'path': fn, 'mode': '100644', 'type': 'blob', 'sha': blob_sha}
+                                    for fn in filenames]}
+            if folder_sha:
+                folder_tree['base_tree'] = folder_sha
+            folder, code = await self._git_request('POST', 'trees', folder_tree, step='_create_tree')
+            if code >= 400:
+                return folder, code, '_create_tree'
+
+            new_root = folder
+            if parent_folder:
+                new_root, code = await self._git_request('POST', 'trees', {
+                    'base_tree': root['sha'],
+                    'tree': [{'path': parent_folder, 'mode': '040000', 'type': 'tree', 'sha': folder['sha']}],
+                }, step='_create_tree')
+                if code >= 400:
+                    return new_root, code, '_create_tree'
+
+            new_commit, code = await self._git_request('POST', 'commits', {
+                'message': 'Test of provider filename behaviors',
+                'tree': new_root['sha'],
+                'parents': [head_sha],
+                'committer': {
+                    'name': 'Frodo Baggins',
+                    'email': 'frodo@sacksville-bagend.org',
+                },
+            }, step='_create_commit')
+            if code >= 400:
+                return new_commit, code, '_create_commit'
+
+            # Not a forced update: if the branch moved since we read it, this fails (422) and we start over
+            resp, code = await self._git_request('PATCH', f'refs/heads/{self.BRANCH}', {'sha': new_commit['sha']},
+                                                 step='_update_ref')
+            if code != 422:
+                return (folder, code, None) if code < 400 else (resp, code, '_update_ref')
+        return resp, code, '_update_ref'
+
+    async def upload_files(self, filenames: typing.List[str], content):
+        """
+        Upload a batch of files in one commit, using the Git Data API. If any path is rejected, the whole tree is, so
+          split the batch in half and try again to find out which filenames were to blame. Any other failure (eg the
+          branch kept moving, or a server error) is reported for the whole batch.
+        """
+        blob_sha, code = await self._blob_sha(content)
+        if code >= 400:
+            return [(blob_sha, code)] * len(filenames)
+
+        folder, code, failed_step = await self._commit_tree(filenames, blob_sha)
+        if code == self.PATH_REJECTED_CODE and failed_step == '_create_tree' and len(filenames) > 1:
+            return await self._split_batch(filenames, content)
+        if code >= 400:
+            return [(folder, code)] * len(filenames)
+
+        # Map each filename to the tree entry it became. (Other entries were already in the folder.)
+        parent_folder = self.parent_folder or ''
+        stored = {entry['path']: entry for entry in folder['tree']}
+        results = []
+        for fn in filenames:
+            entry = stored.get(fn)
+            if entry is None:
+                # Committed, but under a name we can't identify
+                results.append(({'content': {'name': None}}, 201))
+                continue
+            path = os.path.join(parent_folder, entry['path'])
+            self.record_created('file', path, sha=entry['sha'])
+            results.append(({'content': {'name': entry['path'], 'path': path, 'sha': entry['sha']}}, 201))
+        return results
+
+    async def delete_resource(self, resource: dict) -> int:
+        """
+        See https://developer.github.com/v3/repos/contents/#delete-a-file
+        """
+        data = {
+            'sha': resource['sha'],
+            'committer': {
+                'name': 'Frodo Baggins',
+                'email': 'frodo@sacksville-bagend.org',
+            },
+            'branch': self.BRANCH,
+            'message': 'Clean up test of provider filename behaviors'
+        }
+        url = f'{self.BASE_URL}repos/{settings.GH_REPO_NAME}/contents/{urllib.parse.quote(resource["id"])}'
+        resp, code = await self._make_request('DELETE', url,
+                                              data=json.dumps(data),
+                                              headers={'Content-Type': 'application/json'})
+        return code
 
     @staticmethod
     def extract_uploaded_filename(payload: dict=None):
@@ -1,28 +1,62 @@
 """A provider that talks to Google Drive"""
+import email
 import json
+import re
 import typing
 import urllib.parse
+import uuid
 
 import aiohttp
 
-from ..base import OauthBaseProvider
+from ..base import OauthBaseProvider, mock_url
 import settings
 
 
+def _parse_batch_response(content_type: str, body: bytes, count: int) -> typing.List[typing.Tuple[dict, int]]:
+    """
+    Split a multipart/mixed batch response into one (payload, code) pair per sub-request, in request order. Each part
+      is a complete HTTP response, tagged with the Content-ID of the request it answers.
+    """
+    results = [(None, 500)] * count
+    message = email.message_from_bytes(f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + body)
+    for part in message.get_payload():
+        match = re.search(r'item(\d+)', part.get('Content-ID', ''))
+        raw = part.get_payload(decode=True) or b''
+        status_line, _, rest = raw.partition(b'\n')
+        if not match or len(status_line.split()) < 2:
+            continue
+
+        code = int(status_line.split()[1])
+        sub_body = re.split(rb'\r?\n\r?\n', rest, maxsplit=1)[-1] if rest.strip() else b''
+        try:
+            payload = json.loads(sub_body.decode('utf-8')) if sub_body.strip() else {}
+        except ValueError:
+            payload = {}
+        results[int(match.group(1))] = (payload, code)
+    return results
+
+
 class GoogleDriveProvider(OauthBaseProvider):
     NAME = 'googledrive'
 
     DEFAULT_CREDENTIAL = settings.GOOGLEDRIVE_OAUTH_TOKEN
-    BASE_URL = 'https://www.googleapis.com/drive/v2/'  # TODO: v3 exists but wb uses v2
-    BASE_CONTENT_URL = 'https://www.googleapis.com/upload/drive/v2/files'
+    BASE_URL = mock_url(NAME, 'https://www.googleapis.com/drive/v2/')  # TODO: v3 exists but wb uses v2
+    BASE_CONTENT_URL = mock_url(NAME, 'https://www.googleapis.com/upload/drive/v2/files')
+
+    BATCH_URL = mock_url(NAME, 'https://www.googleapis.com/batch/drive/v2')
 
     ALLOWS_SUBFOLDERS = True
 
-    async def create_folder(self, foldername: str):
-        """See https://developers.google.com/drive/v3/web/folder"""
+    # Most sub-requests accepted in one batch request
+    MAX_BATCH_REQUESTS = 100
+    # Folder creation is metadata-only, so whole batches of folders can be created in one round trip
+    FOLDER_BATCH_SIZE = MAX_BATCH_REQUESTS
+    # Upload and folder creation responses already include the stored title, so nothing is read back afterwards (no
+    #   `VERIFY_BY_LISTING`, and no metadata reads)
+
+    def _folder_metadata(self, foldername: str) -> dict:
         parent_folder = self.parent_folder or 'root'
-        url = urllib.parse.urljoin(self.BASE_URL, 'files')
-        data = {
+        return {
             'title': foldername,
             'parents': [
                 {'id': parent_folder}
@@ -30,11 +64,31 @@ class GoogleDriveProvider(OauthBaseProvider):
             'mimeType': 'application/vnd.google-apps.folder'
         }
 
+    def _folder_result(self, resp, code: int):
+        rv = resp['id'] if code < 400 else None
+        if code < 400:
+            self.record_created('folder', rv)
+        return rv, code
+
+    async def create_folder(self, foldername: str):
+        """See https://developers.google.com/drive/v3/web/folder"""
+        url = urllib.parse.urljoin(self.BASE_URL, 'files')
+        data = self._folder_metadata(foldername)
+
         resp, code = await self.make_request_get_json('POST', url,
                                                       data=json.dumps(data),
                                                       headers={'Content-Type': 'application/json'})
-        rv = resp['id'] if code < 400 else resp
-        return rv, code
+        return self._folder_result(resp, code)
+
+    async def create_folders(self, foldernames: typing.List[str]):
+        """Create up to `MAX_BATCH_REQUESTS` folders per batch request"""
+        results = []
+        for start in range(0, len(foldernames), self.MAX_BATCH_REQUESTS):
+            batch = foldernames[start:start + self.MAX_BATCH_REQUESTS]
+            responses = await self._batch_request([('POST', '/drive/v2/files', self._folder_metadata(foldername))
+                                                   for foldername in batch])
+            results.extend(self._folder_result(resp, code) for resp, code in responses)
+        return results
 
     async def upload_file(self,
                           filename: str,
@@ -69,7 +123,49 @@ class GoogleDriveProvider(OauthBaseProvider):
                 headers={'charset': 'UTF-8'}
             )
             mpwriter.append(content, headers={'Content-Type': 'text/plain'})
-            return await self.make_request_get_json('POST', url, data=mpwriter, params=params, headers=headers)
+            resp, code = await self.make_request_get_json('POST', url, data=mpwriter, params=params, headers=headers)
+
+        if code < 400:
+            self.record_created('file', resp['id'])
+        return resp, code
+
+    async def _batch_request(self, requests: typing.List[typing.Tuple[str, str, typing.Union[dict, None]]]) \
+            -> typing.List[typing.Tuple[dict, int]]:
+        """
+        Send several (method, path, JSON body) API calls in one multipart/mixed batch request, and return one
+          (payload, code) pair per call, in order. Paths are relative to the API host, eg `/drive/v2/files/<id>`.
+        See https://developers.google.com/drive/v2/web/batch
+        """
+        boundary = uuid.uuid4().hex
+        parts = []
+        for i, (method, path, body) in enumerate(requests):
+            lines = [f'--{boundary}', 'Content-Type: application/http', f'Content-ID: <item{i}>', '',
+                     f'{method} {path} HTTP/1.1']
+            if body is not None:
+                lines += ['Content-Type: application/json; charset=UTF-8', '', json.dumps(body)]
+            else:
+                lines += ['']
+            parts.append('\r\n'.join(lines))
+        data = '\r\n'.join(parts) + f'\r\n--{boundary}--\r\n'
+
+        headers = {'Content-Type': f'multipart/mixed; boundary={boundary}'}
+        resp, code = await self._make_request('POST', self.BATCH_URL, data=data, headers=headers)
+        if code >= 400:
+            return [(None, code)] * len(requests)
+        return _parse_batch_response(resp.headers.get('Content-Type', ''), await resp.read(), len(requests))
+
+    async def delete_resource(self, resource: dict) -> int:
+        return (await self.delete_resources([resource]))[0]
+
+    async def delete_resources(self, resources: typing.List[dict]) -> typing.List[int]:
+        """Delete files and folders (with their contents) in batches of up to `MAX_BATCH_REQUESTS`"""
+        codes = []
+        for start in range(0, len(resources), self.MAX_BATCH_REQUESTS):
+            batch = resources[start:start + self.MAX_BATCH_REQUESTS]
+            responses = await self._batch_request([('DELETE', f'/drive/v2/files/{resource["id"]}', None)
+                                                   for resource in batch])
+            codes.extend(code for _, code in responses)
+        return codes
 
     @staticmethod
     def extract_uploaded_filename(payload: dict = None):
@@ -2,29 +2,35 @@
 import os
 import typing
 import urllib.parse
+import xml.etree.ElementTree as ElementTree
 
-from ..base import BasicAuthProvider
+from ..base import BasicAuthProvider, mock_url
 import settings
 
 
+# Only ask for what we need: the href of each entry is always returned
+_PROPFIND_BODY = '''<?xml version="1.0"?>
+<d:propfind xmlns:d="DAV:"><d:prop><d:resourcetype/></d:prop></d:propfind>'''
+
+
 class OwncloudProvider(BasicAuthProvider):
     NAME = 'owncloud'
 
     USERNAME = settings.OWNCLOUD_USERNAME
     PASSWORD = settings.OWNCLOUD_APP_PASSWORD
 
-    BASE_URL = settings.OWNCLOUD_URL
+    BASE_URL = mock_url(NAME, settings.OWNCLOUD_URL)
     BASE_CONTENT_URL = None
 
     ALLOWS_SUBFOLDERS = True
 
+    # PUT responses don't confirm the stored name, so it is read back from a folder listing
+    VERIFY_BY_LISTING = True
+
     @property
     def _webdav_url(self):
         return urllib.parse.urljoin(self.BASE_URL, 'remote.php/webdav/')
 
-    async def _make_request(self, *args, **kwargs):
-        return await super(OwncloudProvider, self)._make_request(*args, as_json=False, **kwargs)
-
     async def create_folder(self, foldername: str):
         """Borrowed heavily from WB implementation"""
         parent_folder = self.parent_folder or ''
@@ -32,6 +38,8 @@ class OwncloudProvider(BasicAuthProvider):
         url = self._webdav_url + os.path.join(urllib.parse.quote(parent_folder), urllib.parse.quote(foldername))
 
         resp, code = await self._make_request('MKCOL', url)
+        if code < 400:
+            self.record_created('folder', os.path.join(parent_folder, foldername))
         # FIXME: Owncloud response contains an OC-FILEID, but no foldername confirmation. So just assume.
         return foldername, code
 
@@ -44,7 +52,36 @@ class OwncloudProvider(BasicAuthProvider):
         parent_folder = self.parent_folder or ''
         # TODO: might only work for top-level folders
         url = self._webdav_url + os.path.join(urllib.parse.quote(parent_folder), urllib.parse.quote(filename))
-        return await self._make_request('PUT', url, data=content)
+        resp, code = await self._make_request('PUT', url, data=content)
+        if code < 400:
+            self.record_created('file', os.path.join(parent_folder, filename))
+        return resp, code
+
+    async def delete_resource(self, resource: dict) -> int:
+        """WebDAV DELETE removes a collection along with everything inside it"""
+        resp, code = await self._make_request('DELETE', self._webdav_url + urllib.parse.quote(resource['id']))
+        return code
+
+    async def list_folder(self):
+        """
+        List the test folder with a single PROPFIND (Depth: 1 returns the folder itself, plus its immediate children)
+        See https://doc.owncloud.org/server/10.0/developer_manual/webdav_api/
+        """
+        url = self._webdav_url + urllib.parse.quote(self.parent_folder or '') + '/'
+        headers = {'Depth': '1', 'Content-Type': 'application/xml'}
+        resp, code = await self._make_request('PROPFIND', url, data=_PROPFIND_BODY, headers=headers)
+        if code >= 400:
+            return None, code
+
+        folder_path = urllib.parse.unquote(urllib.parse.urlsplit(url).path).rstrip('/')
+        names = []
+        for el in ElementTree.fromstring(await resp.read()).iter('{DAV:}href'):
+            # Split before unquoting, so that an encoded slash stays part of the name
+            path = urllib.parse.urlsplit(el.text or '').path.rstrip('/')
+            if urllib.parse.unquote(path) == folder_path:
+                continue
+            names.append(urllib.parse.unquote(path.rsplit('/', 1)[-1]))
+        return names, code
 
     @staticmethod
     def extract_uploaded_filename(payload= None):
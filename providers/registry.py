@@ -0,0 +1,36 @@
+"""
+Look up provider classes by name, importing each provider's module (and whatever it depends on) only when that
+  provider is first used. Short runs that only try one or two providers don't pay to import the rest.
+"""
+import collections.abc
+import importlib
+import typing
+
+
+class ProviderRegistry(collections.abc.Mapping):
+    """A read-only mapping of provider name to provider class, where each class is given as 'module:ClassName'"""
+    def __init__(self, locations: typing.Dict[str, str], *, package: str=None):
+        self._locations = dict(locations)
+        self._package = package
+        self._loaded: typing.Dict[str, type] = {}
+
+    def __getitem__(self, name: str) -> type:
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+
+        module_name, class_name = self._locations[name].split(':')
+        module = importlib.import_module(module_name, self._package)
+        cls = self._loaded[name] = getattr(module, class_name)
+        return cls
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._locations)
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def loaded(self) -> typing.List[str]:
+        """The names of the providers whose modules have been imported so far"""
+        return list(self._loaded)
@@ -1,22 +1,46 @@
 """A provider that talks to Amazon S3"""
+import base64
+import hashlib
 import os
+import re
 import typing
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+import xml.sax.saxutils as saxutils
 
-from boto.s3.connection import S3Connection
-from boto.s3.connection import OrdinaryCallingFormat
+import yarl
 
-from ..base import NoAuthProvider
+from ..base import NoAuthProvider, mock_url
+from .sigv4 import SigV4Signer
 import settings
 
 
+# Namespace of ListObjects response elements
+_S3_NS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+# Characters that can't appear in an XML 1.0 document (and so can't be named in a multi-object delete request)
+_XML_INVALID = re.compile('[^\u0009\u000A\u000D\u0020-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]')
+
+
+class _Unsigned(typing.NamedTuple):
+    """
+    A request for an object (or, with no key, for the bucket itself). The URL is only presigned when each attempt is
+      sent (see `S3Provider._attempt_url`), so that it can't expire while a request waits to be sent or retried.
+    """
+    key: str = ''
+    params: typing.Union[typing.Dict[str, str], None] = None
+
+
 class S3Provider(NoAuthProvider):
     NAME = 's3'
 
     S3_ACCESS_KEY = settings.S3_ACCESS_KEY
     S3_SECRET_KEY = settings.S3_SECRET_KEY
     S3_BUCKET = settings.S3_BUCKET
+    S3_REGION = getattr(settings, 'S3_REGION', None) or 'us-east-1'
 
-    BASE_URL = None
+    # Path-style addressing (bucket in the path), so that bucket names with dots work over https
+    BASE_URL = mock_url(NAME, f'https://s3.{S3_REGION}.amazonaws.com/')
     BASE_CONTENT_URL = None
 
     # Pseudo/ abstraction layer. See http://docs.aws.amazon.com/AmazonS3/latest/UG/FolderOperations.html
@@ -24,14 +48,32 @@ class S3Provider(NoAuthProvider):
     #   character in the key name as a folder, for example examplekeyname/."
     ALLOWS_SUBFOLDERS = True
 
-    def __init__(self, *args, **kwargs):
-        self.connection = S3Connection(self.S3_ACCESS_KEY,
-                                       self.S3_SECRET_KEY,
-                                       calling_format=OrdinaryCallingFormat())
-        self.bucket = self.connection.get_bucket(self.S3_BUCKET, validate=False)
+    # S3 supports thousands of writes per second per prefix; we will never get near that
+    MAX_REQUESTS_PER_SECOND = 100.0
+
+    # PUT responses only contain an ETag, so stored names are read back from a bucket listing
+    VERIFY_BY_LISTING = True
+
+    # "Folders" are just keys; deleting one leaves every key under that prefix behind
+    RECURSIVE_DELETE = False
+    # Most keys accepted by one multi-object delete request
+    MAX_DELETE_BATCH = 1000
 
+    def __init__(self, *args, **kwargs):
+        self.signer = SigV4Signer(self.S3_ACCESS_KEY, self.S3_SECRET_KEY, region=self.S3_REGION)
         super(S3Provider, self).__init__(*args, **kwargs)
 
+    def _presigned_url(self, method: str, key: str='', params: dict=None) -> yarl.URL:
+        """Presign a request for an object (or, with no key, for the bucket itself)"""
+        url = f'{self.BASE_URL}{urllib.parse.quote(self.S3_BUCKET or "")}/{urllib.parse.quote(key, safe="/~")}'
+        # The URL is already encoded exactly as signed; don't let it be re-quoted or normalized on the way out
+        return yarl.URL(self.signer.presign(method, url, params=params), encoded=True)
+
+    def _attempt_url(self, method: str, url):
+        if isinstance(url, _Unsigned):
+            return self._presigned_url(method, url.key, url.params)
+        return url
+
     async def create_folder(self, foldername: str):
         """
         From WB implementation
@@ -39,9 +81,9 @@ class S3Provider(NoAuthProvider):
         parent_folder = self.parent_folder or ''
         path = os.path.join(parent_folder, foldername)
 
-        url = self.bucket.new_key(path).generate_url(60, 'PUT')
-
-        resp, code = await self._make_request('PUT', url, skip_auto_headers=['CONTENT-TYPE'])
+        resp, code = await self._make_request('PUT', _Unsigned(path), skip_auto_headers=['CONTENT-TYPE'])
+        if code < 400:
+            self.record_created('folder', path)
         # TODO: May need separate metadata fetch for file content info??
         return foldername, code
 
@@ -56,12 +98,79 @@ class S3Provider(NoAuthProvider):
 
         # TODO: Don't encrypt uploads for now, but this may change
         headers = {'Content-Length': str(len(content.encode('utf-8')))}
-        url = self.bucket.new_key(path).generate_url(60, 'PUT', headers=headers)
 
         # FIXME: May need a separate metadata request to get the actual filename
-        return await self._make_request('PUT', url,
-                                        data=content, headers=headers,
-                                        skip_auto_headers={'CONTENT-TYPE'})
+        resp, code = await self._make_request('PUT', _Unsigned(path),
+                                              data=content, headers=headers,
+                                              skip_auto_headers={'CONTENT-TYPE'})
+        if code < 400:
+            self.record_created('file', path)
+        return resp, code
+
+    async def delete_resource(self, resource: dict) -> int:
+        """See http://docs.aws.amazon.com/AmazonS3/latest/API/RESTObjectDELETE.html"""
+        resp, code = await self._make_request('DELETE', _Unsigned(resource['id']))
+        return code
+
+    async def delete_resources(self, resources: typing.List[dict]) -> typing.List[int]:
+        """
+        Delete up to `MAX_DELETE_BATCH` keys per multi-object delete request. Keys that can't be written in XML are
+          deleted one at a time instead.
+        See http://docs.aws.amazon.com/AmazonS3/latest/API/multiobjectdeleteapi.html
+        """
+        codes: typing.List[int] = [None] * len(resources)
+        batchable = [i for i, resource in enumerate(resources) if not _XML_INVALID.search(resource['id'])]
+        singles = [i for i, resource in enumerate(resources) if _XML_INVALID.search(resource['id'])]
+
+        for start in range(0, len(batchable), self.MAX_DELETE_BATCH):
+            batch = batchable[start:start + self.MAX_DELETE_BATCH]
+            objects = ''.join(f'<Object><Key>{saxutils.escape(resources[i]["id"])}</Key></Object>' for i in batch)
+            # Quiet mode: the response only lists the keys that could not be deleted
+            body = f'<?xml version="1.0" encoding="UTF-8"?><Delete><Quiet>true</Quiet>{objects}</Delete>'
+            body = body.encode('utf-8')
+            headers = {
+                'Content-MD5': base64.b64encode(hashlib.md5(body).digest()).decode('ascii'),
+                'Content-Type': 'application/xml',
+            }
+            resp, code = await self._make_request('POST', _Unsigned(params={'delete': ''}),
+                                                  data=body, headers=headers)
+            failed = set()
+            if code < 400:
+                result = ElementTree.fromstring(await resp.read())
+                failed = {el.findtext(f'{_S3_NS}Key') for el in result.iter(f'{_S3_NS}Error')}
+            for i in batch:
+                codes[i] = code if code >= 400 else (409 if resources[i]['id'] in failed else 204)
+
+        single_codes = await super(S3Provider, self).delete_resources([resources[i] for i in singles])
+        for i, code in zip(singles, single_codes):
+            codes[i] = code
+        return codes
+
+    async def list_folder(self):
+        """
+        List every key under the test folder prefix, 1000 keys per page.
+        See http://docs.aws.amazon.com/AmazonS3/latest/API/RESTBucketGET.html
+        """
+        prefix = self.parent_folder.rstrip('/') + '/' if self.parent_folder else ''
+
+        names = []
+        marker = ''
+        while True:
+            # Ask for URL-encoded keys: control characters in a key would otherwise make the response invalid XML
+            query = {'prefix': prefix, 'encoding-type': 'url'}
+            if marker:
+                query['marker'] = marker
+            resp, code = await self._make_request('GET', _Unsigned(params=query))
+            if code >= 400:
+                return None, code
+
+            listing = ElementTree.fromstring(await resp.read())
+            keys = [urllib.parse.unquote_plus(el.text or '') for el in listing.iter(f'{_S3_NS}Key')]
+            names.extend(key[len(prefix):] for key in keys if key.startswith(prefix) and key != prefix)
+
+            if listing.findtext(f'{_S3_NS}IsTruncated') != 'true' or not keys:
+                return names, code
+            marker = keys[-1]
 
     @staticmethod
     def extract_uploaded_filename(payload: dict = None):
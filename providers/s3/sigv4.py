@@ -0,0 +1,90 @@
+"""
+Presign S3 requests with AWS Signature Version 4, without blocking the event loop on a full SDK.
+See http://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-query-string-auth.html
+"""
+import datetime
+import hashlib
+import hmac
+import typing
+import urllib.parse
+
+
+ALGORITHM = 'AWS4-HMAC-SHA256'
+
+
+def _quote(value: str, safe: str='-_.~') -> str:
+    """URI-encode every byte except the unreserved characters, as SigV4 requires"""
+    return urllib.parse.quote(value, safe=safe)
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+class SigV4Signer:
+    """
+    Build presigned URLs for one set of credentials. The derived signing key only changes once a day, so it is computed
+      once per date and reused for every request.
+    """
+    def __init__(self, access_key: str, secret_key: str, *, region: str='us-east-1', service: str='s3'):
+        self.access_key = access_key or ''
+        self.secret_key = secret_key or ''
+        self.region = region
+        self.service = service
+
+        self._signing_key: typing.Tuple[str, bytes] = (None, None)
+
+    def signing_key(self, datestamp: str) -> bytes:
+        cached_date, key = self._signing_key
+        if cached_date != datestamp:
+            key = _hmac(('AWS4' + self.secret_key).encode('utf-8'), datestamp)
+            for part in (self.region, self.service, 'aws4_request'):
+                key = _hmac(key, part)
+            self._signing_key = (datestamp, key)
+        return key
+
+    def presign(self,
+                method: str,
+                url: str,
+                *,
+                params: typing.Dict[str, str]=None,
+                expires: int=60,
+                now: datetime.datetime=None) -> str:
+        """
+        Return `url` (whose path must already be URI-encoded) with `params` and the signature added to the query
+          string. Only the host header is signed, and the payload is left unsigned.
+        """
+        now = now or datetime.datetime.utcnow()
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        datestamp = now.strftime('%Y%m%d')
+        scope = f'{datestamp}/{self.region}/{self.service}/aws4_request'
+
+        parts = urllib.parse.urlsplit(url)
+        query = dict(params or {})
+        query.update({
+            'X-Amz-Algorithm': ALGORITHM,
+            'X-Amz-Credential': f'{self.access_key}/{scope}',
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expires),
+            'X-Amz-SignedHeaders': 'host',
+        })
+        canonical_query = '&'.join(f'{_quote(k)}={_quote(v)}' for k, v in sorted(query.items()))
+
+        canonical_request = '\n'.join([
+            method.upper(),
+            parts.path or '/',
+            canonical_query,
+            f'host:{parts.netloc}\n',
+            'host',
+            'UNSIGNED-PAYLOAD',
+        ])
+        string_to_sign = '\n'.join([
+            ALGORITHM,
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest(),
+        ])
+        signature = hmac.new(self.signing_key(datestamp), string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+        return urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path,
+                                        f'{canonical_query}&X-Amz-Signature={signature}', ''))
@@ -4,7 +4,7 @@ A meta-provider that performs file actions on many different storage hosts, usin
 import typing
 import urllib.parse
 
-from ..base import OauthBaseProvider
+from ..base import OauthBaseProvider, mock_url
 import settings
 
 
@@ -12,8 +12,9 @@ class WBProvider(OauthBaseProvider):
     """A wrapper that uses the WB API to talk to one of a range of storage providers"""
     # Default name, but prefer users to pass it in explicitly (because this is sort of an indirect provider)
     NAME = 'waterbutler'
+    TRANSPORT = 'wb'
 
-    BASE_URL = settings.WB_HOST
+    BASE_URL = mock_url(NAME, settings.WB_HOST)
     DEFAULT_CREDENTIAL = settings.WATERBUTLER_OSF_TOKEN
 
     # True of osfstorage, but less so if using WB to talk to other providers. We allow the attempt and defer to
@@ -26,13 +27,15 @@ class WBProvider(OauthBaseProvider):
         # If a parent folder is specified, append it to the URL. Otherwise just add a trailing slash.
         parent_folder = self.parent_folder or '/'
         url = urllib.parse.urljoin(self.BASE_URL,
-                                   f'/v1/resources/{settings.OSF_NODE}/providers/{self.provider_name}{parent_folder}')
+                                   f'v1/resources/{settings.OSF_NODE}/providers/{self.provider_name}{parent_folder}')
         params = {
             'kind': 'folder',
             'name': foldername
         }
         resp, code = await self.make_request_get_json('PUT', url, params=params, headers={'Content-Type': 'application/json'})
-        rv = resp['data']['attributes']['path'] if code < 400 else resp
+        rv = resp['data']['attributes']['path'] if code < 400 else None
+        if code < 400:
+            self.record_created('folder', rv)
         return rv, code
 
     async def upload_file(self, filename: str, content):
@@ -40,12 +43,22 @@ class WBProvider(OauthBaseProvider):
         # If a parent folder is specified, append it to the URL. Otherwise just add a trailing slash.
         parent_folder = self.parent_folder or '/'
         url = urllib.parse.urljoin(self.BASE_URL,
-                                   f'/v1/resources/{settings.OSF_NODE}/providers/{self.provider_name}{parent_folder}')
+                                   f'v1/resources/{settings.OSF_NODE}/providers/{self.provider_name}{parent_folder}')
         params = {
             'kind': 'file',
             'name': filename
         }
-        return await self.make_request_get_json('PUT', url, params=params, data=content)
+        resp, code = await self.make_request_get_json('PUT', url, params=params, data=content)
+        if code < 400:
+            self.record_created('file', resp['data']['attributes']['path'])
+        return resp, code
+
+    async def delete_resource(self, resource: dict) -> int:
+        """WB deletes folders recursively, on whichever storage provider is behind it"""
+        url = urllib.parse.urljoin(self.BASE_URL,
+                                   f'v1/resources/{settings.OSF_NODE}/providers/{self.provider_name}{resource["id"]}')
+        resp, code = await self._make_request('DELETE', url)
+        return code
 
     @staticmethod
     def extract_uploaded_filename(payload: dict=None):
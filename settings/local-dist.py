@@ -5,6 +5,9 @@ Default configuration for script. Copy to settings/local.py to use.
 WB_HOST = 'http://localhost:7777/'
 OSF_NODE = None  # Let WB handle credentials/ auth: specify an OSF node that has multiple providers connected
 
+# Send all provider requests to a local mock server instead of the real services (see `mocks/` and `benchmark.py`)
+MOCK_HOST = None  # eg 'http://localhost:8765/'
+
 # Non-expiring Personal access tokens/ credentials used to authenticate to various services. Do NOT commit to Github!
 WATERBUTLER_OSF_TOKEN = None
 DROPBOX_OAUTH_TOKEN = None
@@ -29,10 +32,12 @@ OWNCLOUD_URL = None
 #  MISC info required for providers to work
 ####
 # Github provider
-GH_REPO_NAME = None  # Of form <username/repo_name> as it appears in github urls. Must have `master` branch!
+GH_REPO_NAME = None  # Of form <username/repo_name> as it appears in github urls
+GH_BRANCH = 'master'  # Test files are committed to this branch, which must already exist
 
 # S3 Provider
 S3_BUCKET = None
+S3_REGION = 'us-east-1'  # Region of the bucket; requests are signed (AWS Signature Version 4) for this region
 
 # Dataverse: alias id of dataverse we want to connect to (where we will be depositing the data)
 DATAVERSE_NAME = None
@@ -0,0 +1,59 @@
+"""
+Measure how long it takes to start a run: import `main` and look up the providers being tried, in a fresh interpreter
+  each time. Reports wall time and the number of modules imported, for no providers, each provider, and all of them.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a fresh interpreter, so that nothing is imported yet
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+before = len(sys.modules)
+import main
+for name in sys.argv[1:]:
+    main.KNOWN_PROVIDERS[name]
+print(json.dumps({'seconds': time.perf_counter() - start, 'modules': len(sys.modules) - before}))
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--providers', nargs='*',
+                        default=['box', 'dataverse', 'dropbox', 'figshare', 'github', 'googledrive', 'osfstorage',
+                                 'owncloud', 's3'],
+                        help='The name of the storage provider(s) to time individually')
+    parser.add_argument('--repeat', default=5, type=int, help='How many times to start up for each measurement')
+    return parser.parse_args()
+
+
+def measure(provider_names: list, *, repeat: int=5) -> dict:
+    """Start up `repeat` times, looking up the given providers. Returns the median wall time and the module count."""
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', PROBE] + provider_names, cwd=HERE)
+        samples.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+    return {
+        'seconds': statistics.median(s['seconds'] for s in samples),
+        'modules': samples[-1]['modules'],
+    }
+
+
+if __name__ == '__main__':
+    if sys.version_info < (3, 6):
+        raise RuntimeError('For best results, must use Python >= 3.6')
+
+    args = parse_args()
+
+    targets = [('(none)', [])] + [(name, [name]) for name in args.providers] + [('(all)', list(args.providers))]
+    print(f'{"providers":<12} {"seconds":>8} {"modules":>8}')
+    for label, names in targets:
+        result = measure(names, repeat=args.repeat)
+        print(f'{label:<12} {result["seconds"]:>8.3f} {result["modules"]:>8}')
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from common import cache as result_cache, report
+
+
+def _key(filename: str) -> str:
+    return result_cache.ResultCache.key(provider='box', transport='direct', kind='file', filename=filename,
+                                        version='1')
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip_counts_per_provider(self):
+        cache = result_cache.ResultCache(self.tmp.name)
+        r = report.Report('Scenario', 'a', 'a', 201, 'exact', 2)
+        cache.put(_key('a'), r)
+
+        self.assertEqual(cache.get(_key('a'), provider='box'), r)
+        self.assertIsNone(cache.get(_key('b'), provider='dropbox'))
+        self.assertEqual((cache.hits['box'], cache.misses['box']), (1, 0))
+        self.assertEqual((cache.hits['dropbox'], cache.misses['dropbox']), (0, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = result_cache.ResultCache(self.tmp.name, ttl=60)
+        r = report.Report('Scenario', 'a', 'a', 201, 'exact')
+        cache.put(_key('a'), r)
+
+        later = time.time() + 61
+        with mock.patch.object(result_cache.time, 'time', return_value=later):
+            self.assertIsNone(cache.get(_key('a')))
+        self.assertEqual(cache.get(_key('a')), r)
+
+    def test_evict_removes_least_recently_used(self):
+        cache = result_cache.ResultCache(self.tmp.name, max_entries=2)
+        for age, fn in enumerate(['old', 'middle', 'new']):
+            cache.put(_key(fn), report.Report('Scenario', fn, fn, 201, 'exact'))
+            stamp = 1000 + age
+            os.utime(cache._path(_key(fn)), (stamp, stamp))
+        # Reading an entry makes it the most recently used
+        cache.get(_key('old'))
+
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNotNone(cache.get(_key('old')))
+        self.assertIsNone(cache.get(_key('middle')))
+        self.assertIsNotNone(cache.get(_key('new')))
+
+    def test_evict_without_limit_keeps_everything(self):
+        cache = result_cache.ResultCache(self.tmp.name)
+        cache.put(_key('a'), report.Report('Scenario', 'a', 'a', 201, 'exact'))
+        self.assertEqual(cache.evict(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
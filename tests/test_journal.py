@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from common import journal as run_journal, report
+
+
+def _report(fn: str, code: int) -> report.Report:
+    return report.Report('Scenario ' + fn, fn, fn, code, 'exact')
+
+
+class IsFinalTests(unittest.TestCase):
+    def test_outcomes_about_the_filename_are_final(self):
+        for code in (200, 201, 400, 404, 409):
+            self.assertTrue(run_journal.is_final(_report('a', code)), code)
+
+    def test_auth_rate_limit_and_server_errors_are_not(self):
+        for code in (401, 403, 429, 500, 503, 599):
+            self.assertFalse(run_journal.is_final(_report('a', code)), code)
+
+
+class ResumeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'box.journal')
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmp.cleanup()
+
+    def replay(self, journal):
+        async def drain():
+            return [r async for r in journal.replay()]
+        return self.loop.run_until_complete(drain())
+
+    def interrupted_run(self, reports):
+        journal = run_journal.Journal(self.path)
+        journal.open()
+        journal.record_parent_folder('folder-1')
+        for r in reports:
+            journal.record(r)
+        journal.close()
+
+    def test_resume_skips_only_final_results(self):
+        done, expired, throttled, failed = _report('a', 201), _report('b', 401), _report('c', 429), _report('d', 503)
+        self.interrupted_run([done, expired, throttled, failed])
+
+        journal = run_journal.Journal(self.path)
+        journal.load()
+        self.assertEqual(journal.parent_folder, 'folder-1')
+        self.assertIn((done.description, done.our_fn), journal)
+        for r in (expired, throttled, failed):
+            self.assertNotIn((r.description, r.our_fn), journal)
+        self.assertEqual((journal.count, journal.superseded), (1, 3))
+
+    def test_resume_drops_superseded_results_and_appends(self):
+        done, expired = _report('a', 201), _report('b', 403)
+        self.interrupted_run([done, expired])
+
+        journal = run_journal.Journal(self.path)
+        journal.load()
+        journal.open(resume=True)
+        retried = _report('b', 201)
+        journal.record(retried)
+        journal.close()
+
+        self.assertEqual(self.replay(journal), [done, retried])
+        self.assertEqual(journal.superseded, 0)
+
+    def test_partial_last_line_is_ignored(self):
+        done = _report('a', 201)
+        self.interrupted_run([done])
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'report': list(_report('b', 201))})[:20])
+
+        journal = run_journal.Journal(self.path)
+        journal.load()
+        self.assertEqual(journal.count, 1)
+
+        journal.open(resume=True)
+        later = _report('c', 201)
+        journal.record(later)
+        journal.close()
+        self.assertEqual(self.replay(journal), [done, later])
+
+    def test_new_run_discards_previous_results(self):
+        self.interrupted_run([_report('a', 201)])
+
+        journal = run_journal.Journal(self.path)
+        journal.load()
+        journal.open()
+        journal.close()
+
+        self.assertEqual((journal.parent_folder, journal.count), (None, 0))
+        self.assertEqual(self.replay(journal), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+
+import providers
+from common import make_requests
+
+
+class FakeProvider(providers.BaseProvider):
+    """Uploads succeed after a per-filename delay. Filenames with no delay never finish."""
+    NAME = 'fake'
+
+    def __init__(self, delays, **kwargs):
+        super(FakeProvider, self).__init__(**kwargs)
+        self.delays = delays
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.cancelled = []
+
+    async def authorize(self, *args, **kwargs):
+        pass
+
+    async def create_folder(self, foldername: str):
+        return foldername, 201
+
+    async def upload_file(self, filename: str, content):
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            delay = self.delays.get(filename)
+            if delay is None:
+                await asyncio.Event().wait()
+            await asyncio.sleep(delay)
+            return {'name': filename}, 201
+        except asyncio.CancelledError:
+            self.cancelled.append(filename)
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def delete_resource(self, resource: dict):
+        return 204
+
+    @staticmethod
+    def extract_uploaded_filename(payload: dict=None):
+        return payload['name']
+
+
+class ConcurrentRequestsTests(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_reports_follow_scenario_order(self):
+        # Later scenarios finish first
+        filenames = [f'file{i}' for i in range(6)]
+        provider = FakeProvider({fn: 0.01 * (len(filenames) - i) for i, fn in enumerate(filenames)})
+        scenarios = [(f'Scenario {fn}', fn) for fn in filenames]
+
+        async def collect():
+            return [r async for r in make_requests.concurrent_requests(provider, iter(scenarios), concurrency=3,
+                                                                       special=False)]
+        reports = self.loop.run_until_complete(collect())
+
+        self.assertEqual([r.our_fn for r in reports], filenames)
+        self.assertEqual([r.their_fn for r in reports], filenames)
+        self.assertEqual({r.attempts for r in reports}, {1})
+        self.assertEqual(provider.most_in_flight, 3)
+
+    def test_stopping_early_cancels_pending_requests(self):
+        provider = FakeProvider({'first': 0})
+        scenarios = [('Scenario first', 'first')] + [(f'Scenario {i}', f'stuck{i}') for i in range(4)]
+
+        async def take_first():
+            requests = make_requests.concurrent_requests(provider, iter(scenarios), concurrency=2, special=False)
+            r = await requests.__anext__()
+            await requests.aclose()
+            # Let the cancelled requests unwind
+            await asyncio.sleep(0)
+            return r
+
+        r = self.loop.run_until_complete(take_first())
+
+        self.assertEqual(r.our_fn, 'first')
+        self.assertEqual(sorted(provider.cancelled), ['stuck0', 'stuck1'])
+        self.assertEqual(provider.in_flight, 0)
+        self.assertEqual([task for task in asyncio.Task.all_tasks(self.loop) if not task.done()], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from common import analysis, matrix as result_matrix, report
+
+
+class ResultMatrixTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.direct = self.write('box.csv', 'direct', [
+            report.Report('Plain', 'a.txt', 'a.txt', 201, 'exact'),
+            report.Report('Colon', 'a:b', None, 400, None),
+            report.Report('Only direct', 'c', 'c', 201, 'exact'),
+        ])
+        self.wb = self.write('box-wb.csv', 'wb', [
+            report.Report('Colon', 'a:b', 'a_b', 201, 'substitution'),
+            report.Report('Plain', 'a.txt', 'a.txt', 201, 'exact'),
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, transport, reports):
+        path = os.path.join(self.tmp.name, name)
+        report.write_report(reports, out_fn=path)
+        return analysis.ReportFile(path, 'box', transport, False, '')
+
+    def test_disagreements_join_on_scenario(self):
+        matrix = result_matrix.ResultMatrix()
+        matrix.refresh([self.direct, self.wb])
+
+        [(direct, wb)] = list(matrix.pairs())
+        common, found = matrix.disagreements(direct, wb)
+
+        self.assertEqual(common, 2)
+        self.assertEqual([(d.description, d.our_fn, d.direct[0], d.wb[0]) for d in found],
+                         [('Colon', 'a:b', 400, 201)])
+
+    def test_only_changed_reports_are_reloaded(self):
+        snapshot = os.path.join(self.tmp.name, '.matrix.json')
+        matrix = result_matrix.ResultMatrix()
+        self.assertEqual(matrix.refresh([self.direct, self.wb]), [self.direct.path, self.wb.path])
+        matrix.save(snapshot)
+
+        self.write('box-wb.csv', 'wb', [report.Report('Colon', 'a:b', None, 400, None)])
+        matrix = result_matrix.ResultMatrix.load(snapshot)
+        self.assertEqual(matrix.refresh([self.direct, self.wb]), [self.wb.path])
+
+        [(direct, wb)] = list(matrix.pairs())
+        self.assertEqual(matrix.disagreements(direct, wb), (1, []))
+
+    def test_removed_reports_are_dropped(self):
+        matrix = result_matrix.ResultMatrix()
+        matrix.refresh([self.direct, self.wb])
+        matrix.refresh([self.direct])
+        self.assertEqual(list(matrix.columns), [self.direct.path])
+        self.assertEqual(list(matrix.pairs()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from common import report, results_db as results_store
+
+
+async def _stream(reports):
+    for r in reports:
+        yield r
+
+
+class RecordTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = results_store.ResultsDB(os.path.join(self.tmp.name, 'results.sqlite3'))
+        self.run_id = self.db.start_run()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.db.close()
+        self.tmp.cleanup()
+
+    def record(self, reports, **where):
+        async def drain():
+            return [r async for r in self.db.record(_stream(reports), **where)]
+        return self.loop.run_until_complete(drain())
+
+    def test_failed_folder_creation(self):
+        # When a folder can't be created, `create_folder` returns (None, code), and that is what gets reported
+        failed = report.Report('Create a file, then a folder with same name (folder)', 'filethenfolder', None, 409,
+                               None)
+        created = report.Report('Create a folder, then a file with same name (folder)', 'folderthenfile', 'abc123',
+                                201, None)
+
+        passed = self.record([created, failed], provider='googledrive', transport='direct', kind='folder')
+        self.assertEqual(passed, [created, failed])
+
+        stored = list(self.db.results(self.run_id, provider='googledrive', kind='folder'))
+        self.assertEqual(stored, [created, failed])
@@ -0,0 +1,127 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from providers.base import retry
+
+
+class RetryPolicyTests(unittest.TestCase):
+    def test_idempotent_requests_retry_on_transient_codes(self):
+        policy = retry.RetryPolicy()
+        for code in (429, 500, 503, retry.NETWORK_ERROR_CODE):
+            self.assertTrue(policy.should_retry(code, 1, method='PUT'), code)
+        for code in (400, 401, 404, 409):
+            self.assertFalse(policy.should_retry(code, 1, method='GET'), code)
+
+    def test_unsafe_requests_only_retry_if_never_sent_or_opted_in(self):
+        policy = retry.RetryPolicy()
+        self.assertFalse(policy.should_retry(500, 1, method='POST'))
+        self.assertTrue(policy.should_retry(retry.NETWORK_ERROR_CODE, 1, method='POST', sent=False))
+
+        opted_in = retry.RetryPolicy(retry_unsafe_on=frozenset({500}))
+        self.assertTrue(opted_in.should_retry(500, 1, method='POST'))
+
+    def test_stops_after_the_last_attempt(self):
+        policy = retry.RetryPolicy(attempts=3)
+        self.assertTrue(policy.should_retry(503, 2, method='GET'))
+        self.assertFalse(policy.should_retry(503, 3, method='GET'))
+        self.assertFalse(retry.NO_RETRY.should_retry(503, 1, method='GET'))
+
+    def test_backoff_is_full_jitter_with_a_cap(self):
+        policy = retry.RetryPolicy(base_delay=0.5, max_delay=3.0)
+        with mock.patch.object(retry.random, 'uniform', side_effect=lambda low, high: high) as uniform:
+            self.assertEqual([policy.backoff(attempt) for attempt in (1, 2, 3, 4, 5)], [0.5, 1.0, 2.0, 3.0, 3.0])
+        for call in uniform.call_args_list:
+            self.assertEqual(call[0][0], 0)
+
+
+class AttemptCounterTests(unittest.TestCase):
+    def test_retries_count_for_their_filenames_only(self):
+        counter = retry.AttemptCounter()
+        scope = retry.AttemptScope(counter)
+        scope.record_retry()
+        scope.for_names(['a', 'b']).record_retry()
+        scope.record_retry(['b'])
+
+        self.assertEqual(counter.attempts, 2)
+        self.assertEqual([counter.attempts_of(fn) for fn in ('a', 'b', 'c')], [3, 4, 2])
+
+    def test_scopes_are_per_task(self):
+        tracker = retry.AttemptTracker()
+        loop = asyncio.new_event_loop()
+
+        async def check(retries):
+            with tracker.count() as counter:
+                for _ in range(retries):
+                    await asyncio.sleep(0)
+                    tracker.current().record_retry()
+            return counter.attempts
+
+        try:
+            self.assertEqual(loop.run_until_complete(asyncio.gather(check(1), check(3), loop=loop)), [2, 4])
+        finally:
+            loop.close()
+        self.assertEqual(tracker._scopes, {})
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(retry.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.breaker = retry.CircuitBreaker(threshold=3, cooldown=10.0, max_cooldown=25.0)
+
+    def wait(self):
+        return self.loop.run_until_complete(self.breaker.wait())
+
+    def trip(self):
+        for _ in range(self.breaker.threshold):
+            self.breaker.record(True)
+
+    def test_trips_after_threshold_failures_in_a_row(self):
+        self.breaker.record(True)
+        self.breaker.record(True)
+        self.breaker.record(False)
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.trips, 0)
+        self.assertFalse(self.wait())
+
+        self.breaker.record(True)
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.trips, 1)
+
+    def test_single_probe_after_cooldown(self):
+        self.trip()
+        self.now += 10.0
+        self.assertTrue(self.wait())
+
+        # Everyone else waits to hear how the probe went
+        waiter = self.loop.create_task(self.breaker.wait())
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        self.assertFalse(waiter.done())
+
+        self.breaker.record(False, probe=True)
+        self.assertFalse(self.loop.run_until_complete(waiter))
+        self.assertEqual(self.breaker.cooldown, 10.0)
+
+    def test_failed_probe_doubles_cooldown_up_to_max(self):
+        self.trip()
+        for expected in (20.0, 25.0):
+            self.now += self.breaker.cooldown
+            self.assertTrue(self.wait())
+            self.breaker.record(True, probe=True)
+            self.assertEqual(self.breaker.cooldown, expected)
+        self.assertEqual(self.breaker.trips, 3)
+
+    def test_requests_sent_before_tripping_do_not_count(self):
+        self.trip()
+        for _ in range(self.breaker.threshold):
+            self.breaker.record(True)
+        self.assertEqual(self.breaker.trips, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
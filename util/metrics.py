@@ -0,0 +1,213 @@
+"""
+Live counters and histograms for long runs, served in the OpenMetrics text format (see `MetricsServer`) so that a
+  monitoring system can scrape a sweep while it is in progress
+See https://github.com/OpenObservability/OpenMetrics/blob/main/specification/OpenMetrics.md
+"""
+import abc
+import asyncio
+import collections
+import math
+import typing
+
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Request latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str('' if value is None else value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: typing.Iterable[typing.Tuple[str, str]]) -> str:
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return '{' + pairs + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(abc.ABC):
+    TYPE: str = None
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Iterable[str]=(), *, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name) for name in self.labelnames)
+
+    def _labels(self, key: tuple, *extra: typing.Tuple[str, str]) -> str:
+        return _format_labels(list(zip(self.labelnames, key)) + list(extra))
+
+    @abc.abstractmethod
+    def samples(self) -> typing.Iterator[str]:
+        """The sample lines for every set of labels seen so far"""
+        pass
+
+    def render(self) -> typing.Iterator[str]:
+        yield f'# TYPE {self.name} {self.TYPE}'
+        yield f'# HELP {self.name} {_escape(self.documentation)}'
+        yield from self.samples()
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super(Counter, self).__init__(*args, **kwargs)
+        self._values: typing.Dict[tuple, float] = collections.defaultdict(float)
+
+    def inc(self, amount: float=1, **labels) -> None:
+        self._values[self._key(labels)] += amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> typing.Iterator[str]:
+        for key, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+            yield f'{self.name}_total{self._labels(key)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super(Gauge, self).__init__(*args, **kwargs)
+        self._values: typing.Dict[tuple, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> typing.Iterator[str]:
+        for key, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+            yield f'{self.name}{self._labels(key)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, *args, buckets: typing.Sequence[float]=DEFAULT_BUCKETS, **kwargs):
+        super(Histogram, self).__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: the count in each bucket (not cumulative), then the sum of all observations
+        self._counts: typing.Dict[tuple, typing.List[int]] = {}
+        self._sums: typing.Dict[tuple, float] = collections.defaultdict(float)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self._sums[key] += value
+
+    def samples(self) -> typing.Iterator[str]:
+        for key, counts in sorted(self._counts.items(), key=lambda item: str(item[0])):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{self._labels(key, ("le", _format_value(bound)))} {cumulative}'
+            yield f'{self.name}_count{self._labels(key)} {cumulative}'
+            yield f'{self.name}_sum{self._labels(key)} {_format_value(self._sums[key])}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: typing.List[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = [line for metric in self._metrics for line in metric.render()]
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# The series recorded during a run
+REQUESTS = Counter('filenames_requests', 'Requests sent to providers, by response code (599: no response)',
+                   ['provider', 'operation', 'step', 'code'])
+REQUEST_DURATION = Histogram('filenames_request_duration_seconds', 'Time until each response was fully read',
+                             ['provider', 'operation', 'step'])
+RETRIES = Counter('filenames_retries', 'Requests sent again after a failure', ['provider', 'operation', 'step'])
+BREAKER_TRIPS = Counter('filenames_circuit_breaker_trips', 'Times that requests to a provider were paused after '
+                                                           'repeated failures', ['provider'])
+SCENARIOS_DONE = Counter('filenames_scenarios_done', 'Scenarios completed, by whether the request succeeded',
+                         ['provider', 'kind', 'result'])
+SCENARIOS_REMAINING = Gauge('filenames_scenarios_remaining', 'Scenarios not yet completed (if the total is known)',
+                            ['provider', 'kind'])
+
+_expected: typing.Dict[typing.Tuple[str, str], int] = {}
+
+
+def expect_scenarios(provider: str, kind: str, count: int) -> None:
+    """Declare how many scenarios a provider will try, so that progress can be reported as scenarios remaining"""
+    _expected[(provider, kind)] = count
+    SCENARIOS_REMAINING.set(count, provider=provider, kind=kind)
+
+
+def _update_remaining(provider: str, kind: str) -> None:
+    expected = _expected.get((provider, kind))
+    if expected is None:
+        return
+    done = sum(SCENARIOS_DONE.value(provider=provider, kind=kind, result=result)
+               for result in ('ok', 'failed', 'resumed'))
+    SCENARIOS_REMAINING.set(max(expected - done, 0), provider=provider, kind=kind)
+
+
+def scenario_done(provider: str, kind: str, code: int) -> None:
+    SCENARIOS_DONE.inc(provider=provider, kind=kind, result='ok' if code < 400 else 'failed')
+    _update_remaining(provider, kind)
+
+
+def scenarios_resumed(provider: str, kind: str, count: int) -> None:
+    """Count the scenarios already completed by an earlier, interrupted run"""
+    SCENARIOS_DONE.inc(count, provider=provider, kind=kind, result='resumed')
+    _update_remaining(provider, kind)
+
+
+class MetricsServer:
+    """Serve `GET /metrics` on the current event loop"""
+    def __init__(self, registry: Registry=None, *, host: str='localhost', port: int=9100):
+        self.registry = registry or REGISTRY
+        self.host = host
+        self.port = port
+
+        # Most runs don't serve metrics, so only pay for importing the web server when one is wanted
+        from aiohttp import web
+        self._web = web
+        self.app = web.Application()
+        self.app.router.add_get('/metrics', self.handle)
+        self._handler = None
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}/metrics'
+
+    async def handle(self, request):
+        return self._web.Response(body=self.registry.render().encode('utf-8'),
+                                  headers={'Content-Type': CONTENT_TYPE})
+
+    async def start(self) -> None:
+        loop = asyncio.get_event_loop()
+        self._handler = self.app.make_handler()
+        self._server = await loop.create_server(self._handler, self.host, self.port)
+        print(f'Serving metrics at {self.url}')
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+        await self.app.shutdown()
+        await self._handler.shutdown(1.0)
+        await self.app.cleanup()
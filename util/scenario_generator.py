@@ -1,10 +1,20 @@
 """Generate a set of scenarios (filenames) based on character sequences known to cause problems"""
 
+import argparse
 import csv
+import hashlib
+import itertools
+import os
+import typing
+import unicodedata
+import zlib
 
 from pprint import pprint as pp
 
 
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scenarios')
+
+
 # Things that, in themselves, cause problems for operating systems by their presence
 TROUBLESOME_CHARACTERS = [
     '#', '%', '?',  # Things that REALLY mess with URL encoding
@@ -50,6 +60,119 @@ def write_for_sequence(out_fn: str, charset: list, *, position: int=1, mode='w')
             ])
 
 
+# Named character sets that the generator can combine
+CHARSETS = {
+    'troublesome': TROUBLESOME_CHARACTERS,
+    'foreign': FRIN_CHARS_YALL,
+}
+
+NORMALIZATION_FORMS = ('NFC', 'NFD', 'NFKC', 'NFKD')
+
+# Where a character may be placed: 0 for start of string, 1 for middle, -1 for end (as in `write_for_sequence`)
+POSITIONS = (0, 1, -1)
+
+
+def _place(chars: str, position: int, *, stem: str='filename', extension: str='.txt') -> str:
+    if position == 0:
+        return f'{chars}{stem}{extension}'
+    elif position == -1:
+        return f'{stem}{extension}{chars}'
+    else:
+        half = len(stem) // 2
+        return f'{stem[:half]}{chars}{stem[half:]}{extension}'
+
+
+def _singles(charset: list, positions: tuple):
+    for c in charset:
+        for position in positions:
+            yield f'a sequence containing {c} at position {position}', _place(c, position)
+
+
+def _combinations(charset: list, positions: tuple, depth: int):
+    """Every ordered tuple of `depth` characters, placed together or at (possibly) different positions"""
+    for chars in itertools.product(charset, repeat=depth):
+        for position in positions:
+            yield f'characters {" ".join(chars)} together at position {position}', _place(''.join(chars), position)
+
+        # Spread the characters out: first at the start, last at the end, anything else in the middle
+        if depth > 1:
+            middle = ''.join(chars[1:-1])
+            yield (f'characters {" ".join(chars)} spread across the name',
+                   f'{chars[0]}file{middle}name.txt{chars[-1]}')
+
+
+def _repetitions(charset: list, positions: tuple, repeats: typing.Iterable[int]):
+    for c in charset:
+        for n in repeats:
+            for position in positions:
+                yield f'{c} repeated {n} times at position {position}', _place(c * n, position)
+
+
+def _lengths(charset: list, lengths: typing.Iterable[int]):
+    """Pad names out to (or just past) common length limits, with the interesting character at the very end"""
+    for c in charset:
+        for length in lengths:
+            stem = 'a' * max(length - len(c) - len('.txt'), 1)
+            yield f'{c} at the end of a {length} character name', f'{stem}.txt{c}'
+
+
+def _normalized(scenarios, forms: typing.Iterable[str]):
+    """Each scenario, plus its Unicode normalized variants (identical variants are dropped later, by dedup)"""
+    for prose, fn in scenarios:
+        yield prose, fn
+        for form in forms:
+            yield f'{prose} ({form} normalized)', unicodedata.normalize(form, fn)
+
+
+def generate_scenarios(charsets: typing.Iterable[str]=tuple(CHARSETS),
+                       *,
+                       positions: tuple=POSITIONS,
+                       depth: int=2,
+                       repeats: typing.Iterable[int]=(2, 3, 8),
+                       lengths: typing.Iterable[int]=(64, 255, 256, 1024),
+                       normalization_forms: typing.Iterable[str]=NORMALIZATION_FORMS,
+                       shard: int=0,
+                       num_shards: int=1) -> typing.Iterator[typing.Tuple[str, str]]:
+    """
+    Lazily generate (prose, filename) scenarios that combine the named character sets across positions, pairs (or
+      longer combinations, up to `depth`), repetitions, name lengths and Unicode normalization forms.
+
+    Filenames that are byte-identical to one already generated are skipped. The output is split into `num_shards`
+      deterministic shards based on a hash of the filename, so a given filename always lands in the same shard
+      regardless of which other options are used.
+    """
+    charset = []
+    for name in charsets:
+        charset.extend(CHARSETS[name])
+
+    families = itertools.chain(
+        _singles(charset, positions),
+        *(_combinations(charset, positions, d) for d in range(2, depth + 1)),
+        _repetitions(charset, positions, repeats),
+        _lengths(charset, lengths),
+    )
+
+    # Only keep a short digest of each filename, so dedup stays cheap even for very large corpora
+    seen = set()
+    for prose, fn in _normalized(families, normalization_forms):
+        encoded = fn.encode('utf-8', 'surrogatepass')
+        if num_shards > 1 and zlib.crc32(encoded) % num_shards != shard:
+            continue
+
+        digest = hashlib.blake2b(encoded, digest_size=8).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        yield prose, fn
+
+
+def write_scenarios(out_fn: str, scenarios: typing.Iterable[typing.Tuple[str, str]]) -> None:
+    """Write generated scenarios to a CSV file in the format read by `main.load_scenarios`"""
+    with open(out_fn, 'w') as f:
+        writer = csv.writer(f, dialect='unix')
+        writer.writerows(scenarios)
+
+
 def verify_readable(filename):
     """Verify this is a readable CSV file (some of the characters we throw in are pretty weird!)"""
     with open(filename, 'r') as f:
@@ -58,15 +181,32 @@ def verify_readable(filename):
         pp(list(reader))
 
 
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--combinatorial', metavar='OUT_FN',
+                        help='Write combinatorial scenarios to this file, instead of regenerating the standard '
+                             'scenario files. (Not required for `main.py --generate`, which reads them directly)')
+    parser.add_argument('--depth', default=2, type=int, help='Longest combination of characters to generate')
+    parser.add_argument('--shard', default=0, type=int, help='Which shard to write (0-based)')
+    parser.add_argument('--num-shards', default=1, type=int, help='Split the generated scenarios into N shards')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    write_for_sequence('../scenarios/special-char-tests.csv', TROUBLESOME_CHARACTERS, position=0)
-    write_for_sequence('../scenarios/special-char-tests.csv', TROUBLESOME_CHARACTERS, position=1, mode='a')
-    write_for_sequence('../scenarios/special-char-tests.csv', TROUBLESOME_CHARACTERS, position=-1, mode='a')
+    args = parse_args()
 
-    write_for_sequence('../scenarios/encodings-tests.csv', FRIN_CHARS_YALL, position=1)
+    if args.combinatorial:
+        write_scenarios(args.combinatorial,
+                        generate_scenarios(depth=args.depth, shard=args.shard, num_shards=args.num_shards))
+    else:
+        special_fn = os.path.join(SCENARIOS_PATH, 'special-char-tests.csv')
+        write_for_sequence(special_fn, TROUBLESOME_CHARACTERS, position=0)
+        write_for_sequence(special_fn, TROUBLESOME_CHARACTERS, position=1, mode='a')
+        write_for_sequence(special_fn, TROUBLESOME_CHARACTERS, position=-1, mode='a')
 
+        write_for_sequence(os.path.join(SCENARIOS_PATH, 'encodings-tests.csv'), FRIN_CHARS_YALL, position=1)
 
-print('Done writing test cases!')
+    print('Done writing test cases!')
 
 # print('Verifying ../scenarios/special-char-tests.csv')
 # verify_readable('../scenarios/special-char-tests.csv')